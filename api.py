@@ -0,0 +1,311 @@
+import json
+from flask import Blueprint, Response, abort, current_app, request, url_for
+from sqlalchemy.exc import NoResultFound
+from cache import page_cache, conditional
+from exporter import json_value
+from models import Venue, Artist, ShowUI
+from pagination import InvalidCursor, decode_position, encode_position
+from queries import (
+    api_detail,
+    api_entity_shows,
+    api_fields,
+    api_listing,
+    api_show,
+    entity_exists,
+    entity_show_page,
+    page_validator,
+    request_now,
+    search_results,
+    show_listing
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+# /api/v1: list, detail and search of venues and artists, list and detail
+# of shows, answered from column-only queries.
+#   ?fields=id,name    fields of the listed resource (also fields[venues]=...),
+#                      id is always returned
+#   ?fields[shows]=... fields of included shows
+#   ?include=shows     past_shows and upcoming_shows of venues and artists,
+#                      the first API_INCLUDED_SHOWS of each with a cursor to
+#                      the rest (/venues/<id>/shows), two statements for a
+#                      whole page (or include=past_shows)
+#   ?limit=&cursor=    page size and the next_cursor of the previous page
+# Lists and details go through the page cache and are invalidated with
+# the HTML pages; venue and artist details answer conditional requests.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+SHOW_FIELDS = ShowUI.__slots__
+SEARCH_FIELDS = ('id', 'name', 'upcoming_shows_count')
+# included lists and the shows they hold
+INCLUDES = {'past_shows': 'past', 'upcoming_shows': 'upcoming'}
+
+
+#  Encoding
+#  ----------------------------------------------------------------
+
+json_encoder = json.JSONEncoder(default=json_value, ensure_ascii=False, separators=(',', ':'))
+
+
+# orjson when installed (pip install orjson), several times faster than the
+# standard library on large listings; both write datetimes in ISO 8601
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json_encoder.encode(payload).encode()
+
+
+def json_response(payload, status: int = 200) -> Response:
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return json_response({'error': error.description}, status=error.code)
+
+
+#  Request parameters
+#  ----------------------------------------------------------------
+
+# names from ?fields[resource]= (or ?fields= for the listed resource),
+# every field when none are asked for
+def requested_fields(resource: str, available, primary: bool = True) -> list:
+    value = request.args.get('fields[{}]'.format(resource))
+    if value is None and primary:
+        value = request.args.get('fields')
+    if not value:
+        return list(available)
+
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(400, 'unknown {} fields: {}'.format(resource, ', '.join(unknown)))
+
+    return ['id'] + [name for name in dict.fromkeys(names) if name != 'id']
+
+
+# include=shows is past_shows and upcoming_shows
+def requested_includes() -> list:
+    names = [name.strip() for name in request.args.get('include', '').split(',') if name.strip()]
+    includes = []
+    for name in names:
+        if name == 'shows':
+            includes.extend(INCLUDES)
+        elif name in INCLUDES:
+            includes.append(name)
+        else:
+            abort(400, 'unknown include: {}'.format(name))
+    return list(dict.fromkeys(includes))
+
+
+def page_size() -> int:
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return min(max(limit, 1), current_app.config['API_MAX_PAGE_SIZE'])
+
+
+# url of the next page: this request with its cursor replaced
+def next_link(cursor: str) -> str:
+    if cursor is None:
+        return None
+    # the path arguments win over query parameters of the same name
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **{**args, **request.view_args})
+
+
+def page_payload(items: list, cursor: str, **extra) -> dict:
+    return dict(extra, data=items, next_cursor=cursor, next=next_link(cursor))
+
+
+#  Items
+#  ----------------------------------------------------------------
+
+def show_item(show, fields: list) -> dict:
+    return {name: getattr(show, name) for name in fields}
+
+
+# rows of the requested fields, plus the included shows of all of them;
+# each included list has the cursor of its next page, or None
+def entity_items(model, rows, fields: list, includes: list) -> list:
+    items = [dict(zip(fields, row)) for row in rows]
+    if not includes or not items:
+        return items
+
+    show_fields = requested_fields('shows', SHOW_FIELDS, primary=False)
+    shows = api_entity_shows(
+        model,
+        [item['id'] for item in items],
+        whens=[INCLUDES[name] for name in includes],
+        per_page=current_app.config['API_INCLUDED_SHOWS'],
+        now=request_now())
+
+    for item in items:
+        for name in includes:
+            page = shows[item['id']][INCLUDES[name]]
+            item[name] = [show_item(show, show_fields) for show in page]
+            item[name + '_cursor'] = page.next_cursor
+    return items
+
+
+#  Views
+#  ----------------------------------------------------------------
+
+def entity_listing(model, resource: str) -> Response:
+    now = request_now()
+    fields = requested_fields(resource, api_fields(model))
+    includes = requested_includes()
+
+    try:
+        page = api_listing(model, fields, cursor=request.args.get('cursor'), per_page=page_size(), now=now)
+        rows = list(page)
+    except InvalidCursor:
+        abort(400, 'invalid cursor')
+
+    return json_response(page_payload(entity_items(model, rows, fields, includes), page.next_cursor))
+
+
+def entity_detail(model, resource: str, entity_id: int) -> Response:
+    now = request_now()
+    fields = requested_fields(resource, api_fields(model))
+    includes = requested_includes()
+
+    try:
+        row = api_detail(model, entity_id, fields, now=now)
+    except NoResultFound:
+        abort(404, '{} {} not found'.format(resource[:-1], entity_id))
+
+    return json_response({'data': entity_items(model, [row], fields, includes)[0]})
+
+
+# a venue's or an artist's past shows, latest first, or upcoming shows,
+# from the cursor of an included list
+def entity_shows(model, resource: str, entity_id: int) -> Response:
+    fields = requested_fields('shows', SHOW_FIELDS)
+    when = request.args.get('when')
+    if when not in ('past', 'upcoming'):
+        abort(400, 'when must be past or upcoming')
+
+    try:
+        page = entity_show_page(model, entity_id, when, cursor=request.args.get('cursor'), per_page=page_size(), now=request_now())
+        items = [show_item(row, fields) for row in page]
+    except InvalidCursor:
+        abort(400, 'invalid cursor')
+
+    if not items and not entity_exists(model, entity_id):
+        abort(404, '{} {} not found'.format(resource[:-1], entity_id))
+
+    return json_response(page_payload(items, page.next_cursor))
+
+
+# ranked like the HTML search, the cursor is the offset of the next page
+def entity_search(model, resource: str) -> Response:
+    fields = requested_fields(resource, SEARCH_FIELDS)
+    per_page = page_size()
+    cursor = request.args.get('cursor')
+
+    try:
+        offset = decode_position(cursor) if cursor else 0
+    except InvalidCursor:
+        abort(400, 'invalid cursor')
+
+    count, rows = search_results(model, request.args.get('q'), per_page=per_page, now=request_now(), offset=offset)
+
+    values = {'upcoming_shows_count': 'upcoming_count'}
+    items = [{name: getattr(row, values.get(name, name)) for name in fields} for row in rows]
+    next_offset = offset + len(rows)
+    next_cursor = encode_position(next_offset) if rows and next_offset < count else None
+
+    return json_response(page_payload(items, next_cursor, count=count))
+
+
+@api.route('/venues')
+@page_cache.cached('venues', 'shows')
+def venues():
+    return entity_listing(Venue, 'venues')
+
+
+@api.route('/venues/search')
+def search_venues():
+    return entity_search(Venue, 'venues')
+
+
+@api.route('/venues/<int:venue_id>')
+@conditional(lambda venue_id: page_validator(Venue, venue_id, per_page=current_app.config['API_INCLUDED_SHOWS'], now=request_now()))
+@page_cache.cached('venue:{venue_id}')
+def venue(venue_id):
+    return entity_detail(Venue, 'venues', venue_id)
+
+
+@api.route('/venues/<int:venue_id>/shows')
+@page_cache.cached('venue:{venue_id}')
+def venue_shows(venue_id):
+    return entity_shows(Venue, 'venues', venue_id)
+
+
+@api.route('/artists')
+@page_cache.cached('artists', 'shows')
+def artists():
+    return entity_listing(Artist, 'artists')
+
+
+@api.route('/artists/search')
+def search_artists():
+    return entity_search(Artist, 'artists')
+
+
+@api.route('/artists/<int:artist_id>')
+@conditional(lambda artist_id: page_validator(Artist, artist_id, per_page=current_app.config['API_INCLUDED_SHOWS'], now=request_now()))
+@page_cache.cached('artist:{artist_id}')
+def artist(artist_id):
+    return entity_detail(Artist, 'artists', artist_id)
+
+
+@api.route('/artists/<int:artist_id>/shows')
+@page_cache.cached('artist:{artist_id}')
+def artist_shows(artist_id):
+    return entity_shows(Artist, 'artists', artist_id)
+
+
+# when: past (newest first) or upcoming, like /shows
+@api.route('/shows')
+@page_cache.cached('shows')
+def shows():
+    fields = requested_fields('shows', SHOW_FIELDS)
+    when = request.args.get('when')
+    if when not in (None, 'past', 'upcoming'):
+        abort(400, 'when must be past or upcoming')
+
+    try:
+        page = show_listing(
+            when=when,
+            cursor=request.args.get('cursor'),
+            per_page=page_size(),
+            batch_size=current_app.config['SHOWS_BATCH_SIZE'],
+            now=request_now())
+        items = [show_item(row, fields) for row in page]
+    except InvalidCursor:
+        abort(400, 'invalid cursor')
+
+    return json_response(page_payload(items, page.next_cursor))
+
+
+@api.route('/shows/<int:show_id>')
+@page_cache.cached('shows')
+def show(show_id):
+    fields = requested_fields('shows', SHOW_FIELDS)
+
+    try:
+        row = api_show(show_id)
+    except NoResultFound:
+        abort(404, 'show {} not found'.format(show_id))
+
+    return json_response({'data': show_item(row, fields)})
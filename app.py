@@ -2,9 +2,8 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import dateutil.parser
-import babel
 import logging
+from datetime import timedelta
 from flask import (
   Flask,
   render_template,
@@ -12,13 +11,28 @@ from flask import (
   flash,
   redirect,
   url_for,
-  abort
+  abort,
+  Response,
+  stream_with_context
   )
 from flask_moment import Moment
+from sqlalchemy.orm import noload
 from logging import Formatter, FileHandler
 from forms import *
 from flask_migrate import Migrate
 from models import *
+from queries import *
+from pagination import InvalidCursor
+from cache import page_cache, conditional
+from formatting import datetime_formatter
+from engine import EngineTuning
+from profiling import request_profiler
+from importer import import_command
+from exporter import export_command, export_chunks, export_filename, MIMETYPES
+from show_stats import stats_command
+from partitions import partitions_command
+from scheduling import ScheduleError, recurring_slots, schedule_shows, uploaded_slots
+from api import api
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -27,30 +41,34 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 
+engine_tuning = EngineTuning(db, app)
 db.init_app(app)
+page_cache.init_app(app)
+datetime_formatter.init_app(app)
+request_profiler.init_app(app)
 
 # TODO: connect to a local postgresql database
 migrate = Migrate(app, db)
+app.cli.add_command(import_command)
+app.cli.add_command(export_command)
+app.cli.add_command(stats_command)
+app.cli.add_command(partitions_command)
+app.register_blueprint(api)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date : datetime
-  
-  if isinstance(value, str):
-     date = dateutil.parser.parse(value)
-  else:
-     date = value
+def format_datetime(value, format='medium', tz=None):
+  return datetime_formatter.format(value, format, tz)
 
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+# (show, formatted start_time) for the show tiles of a listing, formatted
+# in batches of SHOWS_BATCH_SIZE as the rows stream in
+def format_start_times(shows, format='medium', tz=None):
+  return datetime_formatter.format_items(shows, 'start_time', format, tz, batch_size=app.config['SHOWS_BATCH_SIZE'])
 
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['start_times'] = format_start_times
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -65,54 +83,68 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached('venues')
 def venues():
   # TODO: replace with real venues data.
   #       num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
   data: list[AreaUI] = []
 
-  def get_venues_by_city(city):
-    return Venue.query.filter_by(city=city).order_by('id').all()
-
   try:
-    areas = Venue.query.with_entities(Venue.city, Venue.state).distinct(Venue.city).all()
-
-    data = map(lambda area: AreaUI(city= area.city, state= area.state, venues = get_venues_by_city(area.city)), areas)
-
+    data = area_directory(now=request_now())
   except:
     flash('Some error ocurred while fetching veues.', 'error')
 
   return render_template('pages/venues.html', areas=data);
 
 @app.route('/venues/search', methods=['POST'])
+@db.router.read_only
 def search_venues():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # search for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
   search = request.form.get('search_term')
+  page = request.form.get('page', 1, type=int)
 
   response = SearchUI(count=0, data=[])
 
   try:
-    response = Venue.query.filter(Venue.name.ilike('%{}%'.format(search)))
-    response = data_to_search_ui(response)
+    count, rows = search_results(Venue, search, page=page, per_page=app.config['SEARCH_PAGE_SIZE'], now=request_now())
+    response = data_to_search_ui(rows, count=count)
   except Exception as e:
     flash('Some error ocurred while searching results for {}.'.format(e), 'error')
 
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@conditional(lambda venue_id: page_validator(Venue, venue_id, per_page=app.config['DETAIL_SHOWS_PAGE_SIZE'], now=request_now()))
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
   try:
-    data = Venue.query.get(venue_id)
-    data = VenueUI(venue_data=data)
+    data = venue_detail(venue_id, now=request_now(), per_page=app.config['DETAIL_SHOWS_PAGE_SIZE'])
     return render_template('pages/show_venue.html', venue=data)
   except:
     flash('Some error ocurred while fetching venue with id {}.'.format(venue_id))
     return render_template('pages/home.html')
 
+@app.route('/venues/<int:venue_id>/shows')
+@page_cache.cached('venue:{venue_id}')
+def venue_shows(venue_id):
+  # the next past or upcoming shows of a venue page ("load more"),
+  # as a fragment of show tiles
+  when, cursor = entity_shows_args()
+  try:
+    page = entity_show_page(Venue, venue_id, when, cursor=cursor, per_page=app.config['DETAIL_SHOWS_PAGE_SIZE'], now=request_now())
+  except InvalidCursor:
+    abort(400)
+
+  shows = MapperShowUI(rows=page).shows()
+  if not shows and not entity_exists(Venue, venue_id):
+    abort(404)
+  return render_template('pages/venue_shows.html', venue_id=venue_id, when=when, shows=shows, cursor=page.next_cursor)
+
  
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -146,6 +178,7 @@ def create_venue_submission():
 
       db.session.add(venue)
       db.session.commit()
+      page_cache.invalidate('venues')
       # on successful db insert, flash success
       flash('Venue was successfully listed!'.format(form.name.data))
     except:
@@ -170,9 +203,13 @@ def delete_venue(venue_id):
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   error = False
   try:
-    venue : Venue = Venue.query.get(venue_id)
+    # shows are deleted in bulk below, so session.delete() must not load them
+    venue : Venue = Venue.query.options(noload(Venue.shows)).get(venue_id)
+    page_tags = venue_page_tags(venue_id)
+    delete_entity_shows(Venue, venue_id)
     db.session.delete(venue)
     db.session.commit()
+    page_cache.invalidate(*page_tags)
     
   except Exception as e:
     db.session.rollback()
@@ -191,6 +228,7 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists', methods=['GET'])
+@page_cache.cached('artists')
 def artists():
   # TODO: replace with real data returned from querying the database
   try:
@@ -201,80 +239,87 @@ def artists():
      return render_template('pages/artists.html', artists=[])
 
 @app.route('/artists/search', methods=['POST'])
+@db.router.read_only
 def search_artists():
   # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
   # search for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
   search = request.form.get('search_term')
+  page = request.form.get('page', 1, type=int)
 
   response = SearchUI(count=0, data=[])
 
   try:
-    response = Artist.query.filter(Artist.name.ilike('%{}%'.format(search)))
-  
-    response = data_to_search_ui(response)
+    count, rows = search_results(Artist, search, page=page, per_page=app.config['SEARCH_PAGE_SIZE'], now=request_now())
+    response = data_to_search_ui(rows, count=count)
   except:
     flash('Some error ocurred while searching results for {}.'.format(search), 'error')
 
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@conditional(lambda artist_id: page_validator(Artist, artist_id, per_page=app.config['DETAIL_SHOWS_PAGE_SIZE'], now=request_now()))
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
   # TODO: replace with real artist data from the artist table, using artist_id
   try:
-    artist = Artist.query.get(artist_id)
-    artist_ui = ArtistUI(artist_data=artist)
+    artist_ui = artist_detail(artist_id, now=request_now(), per_page=app.config['DETAIL_SHOWS_PAGE_SIZE'])
     return render_template('pages/show_artist.html', artist=artist_ui)
   except:
      flash('Some error ocurred while fetching artist with id {}.'.format(artist_id))
      return render_template('pages/home.html')
 
+@app.route('/artists/<int:artist_id>/shows')
+@page_cache.cached('artist:{artist_id}')
+def artist_shows(artist_id):
+  # the next past or upcoming shows of an artist page ("load more"),
+  # as a fragment of show tiles
+  when, cursor = entity_shows_args()
+  try:
+    page = entity_show_page(Artist, artist_id, when, cursor=cursor, per_page=app.config['DETAIL_SHOWS_PAGE_SIZE'], now=request_now())
+  except InvalidCursor:
+    abort(400)
+
+  shows = MapperShowUI(rows=page).shows()
+  if not shows and not entity_exists(Artist, artist_id):
+    abort(404)
+  return render_template('pages/artist_shows.html', artist_id=artist_id, when=when, shows=shows, cursor=page.next_cursor)
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
+  form = EditArtistForm()
 
   # TODO: populate form with fields from artist with ID <artist_id>
+  # only the columns the form shows, with the version it submits back
   try:
-    artist = Artist.query.get(artist_id)
-    form.name.data = artist.name
-    form.city.data = artist.city
-    form.state.data = artist.state
-    form.phone.data = artist.phone
-    form.genres.data = artist.genres
-    form.image_link.data = artist.image_link
-    form.facebook_link.data = artist.facebook_link
-    form.website_link.data = artist.website_link
-    form.seeking_venue.data = artist.seeking_venue
-    form.seeking_description.data = artist.seeking_description
-
-    return render_template('forms/edit_artist.html', form=form, artist=artist)
+    artist = entity_form_data(Artist, form, artist_id)
   except:
      flash('Some error ocurred while fetching artist with id {}.'.format(artist_id), 'error')
      return render_template('forms/edit_artist.html', form=form)
 
+  if artist is None:
+    abort(404)
+  form.process(obj=artist)
+  return render_template('forms/edit_artist.html', form=form, artist=artist)
+
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
-  form = ArtistForm(request.form, meta={'csrf': False})
+  # one UPDATE, refused when the artist was edited since the form was filled
+  form = EditArtistForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      artist = Artist.query.get(artist_id)
-      artist.name = form.name.data
-      artist.city = form.city.data
-      artist.state = form.state.data
-      artist.phone = form.phone.data
-      artist.genres = form.genres.data
-      artist.image_link = form.image_link.data
-      artist.facebook_link = form.facebook_link.data
-      artist.website_link = form.website_link.data
-      artist.seeking_venue = form.seeking_venue.data
-      artist.seeking_description = form.seeking_description.data
+      if update_entity(Artist, artist_id, form) is None:
+        db.session.rollback()
+        return edit_conflict(Artist, artist_id, form, 'forms/edit_artist.html', 'artist')
+      page_tags = artist_page_tags(artist_id)
       db.session.commit()
+      page_cache.invalidate(*page_tags)
     except:
       db.session.rollback()
       flash('An error occurred. Artist {} could not be updated.'.format(form.name.data), 'error')
@@ -292,45 +337,33 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   # TODO: populate form with values from venue with ID <venue_id>
-  form = VenueForm(request.form, meta={'csrf': False})
+  # only the columns the form shows, with the version it submits back
+  form = EditVenueForm(meta={'csrf': False})
   try:
-    venue = Venue.query.get(venue_id)
-    form.name.data = venue.name
-    form.genres.data = venue.genres
-    form.address.data = venue.address
-    form.city.data = venue.city
-    form.state.data = venue.state
-    form.phone.data = venue.phone
-    form.website_link.data = venue.website_link
-    form.facebook_link.data = venue.facebook_link
-    form.seeking_talent.data = venue.seeking_talent
-    form.seeking_description.data = venue.seeking_description
-    form.image_link.data = venue.image_link
-    return render_template('forms/edit_venue.html', form=form, venue=venue)
+    venue = entity_form_data(Venue, form, venue_id)
   except:
     flash('Some error ocurred while fetching veue with id {}.'.format(venue_id), 'error')
     return render_template('forms/edit_venue.html', form=form)
 
+  if venue is None:
+    abort(404)
+  form.process(obj=venue)
+  return render_template('forms/edit_venue.html', form=form, venue=venue)
+
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
-  form = VenueForm(request.form, meta={'csrf': False})
+  # one UPDATE, refused when the venue was edited since the form was filled
+  form = EditVenueForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      venue = Venue.query.get(venue_id)
-      venue.name = form.name.data
-      venue.genres = form.genres.data
-      venue.address = form.address.data
-      venue.city = form.city.data
-      venue.state = form.state.data
-      venue.phone = form.phone.data
-      venue.website_link = form.website_link.data
-      venue.facebook_link = form.facebook_link.data
-      venue.seeking_talent = form.seeking_talent.data
-      venue.seeking_description = form.seeking_description.data
-      venue.image_link = form.image_link.data
+      if update_entity(Venue, venue_id, form) is None:
+        db.session.rollback()
+        return edit_conflict(Venue, venue_id, form, 'forms/edit_venue.html', 'venue')
+      page_tags = venue_page_tags(venue_id)
       db.session.commit()
+      page_cache.invalidate(*page_tags)
     except:
       db.session.rollback()
       flash('Some error ocurred while fetching veue with id {}.'.format(venue_id), 'error')
@@ -373,6 +406,7 @@ def create_artist_submission():
 
       db.session.add(artist)
       db.session.commit()
+      page_cache.invalidate('artists')
       # on successful db insert, flash success
       flash('Artist {} was successfully listed!'.format(form.name.data))
     except:
@@ -394,17 +428,29 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached('shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
+  # displays list of shows at /shows, one keyset page at a time,
+  # streamed while rows arrive from the database
+  when = request.args.get('when')
+  when = when if when in ('past', 'upcoming') else None
+  cursor = request.args.get('cursor')
+
   data=[]
   try:
-    shows = Show.query.all()
-    data = MapperShowUI(shows=shows).shows()
+    data = show_listing(
+      when=when,
+      cursor=cursor,
+      per_page=app.config['SHOWS_PAGE_SIZE'],
+      batch_size=app.config['SHOWS_BATCH_SIZE'],
+      now=request_now()
+      )
+  except InvalidCursor:
+    abort(400)
   except:
-    flash('Some error ocurred while fetching artists.')
+    flash('Some error ocurred while fetching shows.')
 
-  return render_template('pages/shows.html', shows=data)
+  return Response(stream_with_context(stream_template('pages/shows.html', shows=data, when=when)))
 
 @app.route('/shows/create')
 def create_shows():
@@ -414,26 +460,48 @@ def create_shows():
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
-  # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
+  # called to create new shows in the db, upon submitting new show listing form;
+  # refused when the venue or the artist does not exist or is already
+  # booked at that time, the form is shown again with the conflicting shows
   form = ShowForm(request.form, meta={"csrf": False})
   if form.validate():
+    venue_id = form.venue_id.data
+    artist_id = form.artist_id.data
+    duration = timedelta(minutes=form.duration.data)
     try:
+       venue_found, artist_found = lock_show_schedule(venue_id, artist_id)
+       if not venue_found:
+          flash('There is no venue with ID {}.'.format(venue_id))
+       if not artist_found:
+          flash('There is no artist with ID {}.'.format(artist_id))
+       if not (venue_found and artist_found):
+          db.session.rollback()
+          return render_template('forms/new_show.html', form=form), 400
+
+       conflicts = show_conflicts(venue_id, artist_id, form.start_time.data, duration)
+       if conflicts:
+          db.session.rollback()
+          flash('The venue or the artist is already booked at that time.')
+          return render_template('forms/new_show.html', form=form, conflicts=conflicts), 409
+
        show = Show(
-          venue_id = form.venue_id.data,
-          artist_id = form.artist_id.data,
+          venue_id = venue_id,
+          artist_id = artist_id,
           start_time = form.start_time.data,
+          duration = duration
           )
        db.session.add(show)
        db.session.commit()
+       page_cache.invalidate(
+          'shows',
+          'venue:{}'.format(venue_id),
+          'artist:{}'.format(artist_id)
+          )
       # on successful db insert, flash success
        flash('Show was successfully listed!')
-
-    # TODO: on unsuccessful db insert, flash an error instead.
-    # e.g., flash('An error occurred. Show could not be listed.')
-    # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     except:
       db.session.rollback()
+      flash('An error occurred. Show could not be listed.')
     finally:
       db.session.close()
 
@@ -442,26 +510,154 @@ def create_show_submission():
     flash_form_error(form=form)
     return redirect(url_for('create_show_submission'))
 
+@app.route('/shows/schedule')
+def schedule_shows_form():
+  form = ScheduleForm()
+  return render_template('forms/schedule_shows.html', form=form)
+
+@app.route('/shows/schedule', methods=['POST'])
+def schedule_shows_submission():
+  # books every slot of a recurrence or an uploaded file at once: the free
+  # slots are inserted in one statement, each slot's status is listed
+  form = ScheduleForm(meta={"csrf": False})
+  if not form.validate():
+    flash_form_error(form=form)
+    return redirect(url_for('schedule_shows_form'))
+
+  venue_id = form.venue_id.data
+  artist_id = form.artist_id.data
+  duration = timedelta(minutes=form.duration.data)
+  max_slots = app.config['SCHEDULE_MAX_SLOTS']
+
+  try:
+    if form.slots.data and form.slots.data.filename:
+      slots = uploaded_slots(form.slots.data.stream, duration, max_slots)
+    elif form.start_time.data and form.until.data:
+      slots = recurring_slots(form.start_time.data, form.frequency.data, form.interval.data, form.until.data, duration, max_slots)
+    else:
+      raise ScheduleError('Give the first show and the last date, or upload a file of shows.')
+
+    schedule_shows(db.session, venue_id, artist_id, slots)
+    db.session.commit()
+  except ScheduleError as error:
+    db.session.rollback()
+    flash(str(error))
+    return render_template('forms/schedule_shows.html', form=form), 400
+  except:
+    db.session.rollback()
+    flash('An error occurred. Shows could not be scheduled.')
+    return render_template('forms/schedule_shows.html', form=form), 500
+  finally:
+    db.session.close()
+
+  scheduled = sum(1 for slot in slots if slot.show_id is not None)
+  if scheduled:
+    page_cache.invalidate(
+      'shows',
+      'venue:{}'.format(venue_id),
+      'artist:{}'.format(artist_id)
+      )
+  flash('{} of {} shows were scheduled.'.format(scheduled, len(slots)))
+  return render_template('pages/scheduled_shows.html', slots=slots, venue_id=venue_id, artist_id=artist_id)
+
+#  Exports
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(shows, venues, artists):kind>.<any(csv, ndjson):format>', defaults={'compress': False})
+@app.route('/export/<any(shows, venues, artists):kind>.<any(csv, ndjson):format>.gz', defaults={'compress': True})
+def export(kind, format, compress):
+  # streams every matching row from a server side cursor, never cached;
+  # since/until are ISO dates, on start_time for shows
+  # and on updated_at for venues and artists
+  try:
+    since = request.args.get('since')
+    until = request.args.get('until')
+    since = datetime.fromisoformat(since) if since else None
+    until = datetime.fromisoformat(until) if until else None
+  except ValueError:
+    abort(400)
+
+  chunks = export_chunks(
+    kind,
+    format,
+    compress=compress,
+    since=since,
+    until=until,
+    city=request.args.get('city') or None,
+    genre=request.args.get('genre') or None
+    )
+
+  response = Response(
+    stream_with_context(chunks),
+    mimetype='application/gzip' if compress else MIMETYPES[format]
+    )
+  response.headers['Content-Disposition'] = 'attachment; filename={}'.format(export_filename(kind, format, compress))
+  return response
+
 #  Utils
 #  ----------------------------------------------------------------
 
-# takes Arstist and Venue data as input,
+# takes (id, name, upcoming_count) rows of Artist or Venue search results,
 # returns SearchUI,
-# since the html files expect same data
-def data_to_search_ui(data):
-    data = map(lambda venue: SearchData(
-      id= venue.id,
-      name= venue.name,
-      num_upcoming_shows= len(list(filter(lambda show: show.start_time > datetime.now(),venue.shows)))
-    ) , data)
-
-    data = list(data)
+# since the html files expect same data;
+# count is the total number of matches, rows is a single page
+def data_to_search_ui(rows, count):
+    data = [SearchData(
+      id= row.id,
+      name= row.name,
+      num_upcoming_shows= row.upcoming_count
+    ) for row in rows]
 
     return SearchUI(
-      count = len(data),
+      count = count,
       data= data
     )
 
+# cached pages that render a venue: its own page, the directory,
+# show tiles and the pages of artists playing there
+def venue_page_tags(venue_id) -> list[str]:
+  artist_ids = show_counterpart_ids(Venue, venue_id)
+  return ['venue:{}'.format(venue_id), 'venues', 'shows'] + ['artist:{}'.format(id) for id in artist_ids]
+
+# cached pages that render an artist: its own page, the listing,
+# show tiles and the pages of venues it plays at
+def artist_page_tags(artist_id) -> list[str]:
+  venue_ids = show_counterpart_ids(Artist, artist_id)
+  return ['artist:{}'.format(artist_id), 'artists', 'shows'] + ['venue:{}'.format(id) for id in venue_ids]
+
+# (when, cursor) of a "load more" request for a page's past or upcoming
+# shows; both are required
+def entity_shows_args() -> (str, str):
+  when = request.args.get('when')
+  cursor = request.args.get('cursor')
+  if when not in ('past', 'upcoming') or not cursor:
+    abort(400)
+  return when, cursor
+
+# the edit form again, with the submitted values, after update_entity()
+# refused them: someone saved the venue or artist since the form was
+# filled. The form now carries the current version, so submitting it
+# again replaces the other edit.
+def edit_conflict(model, entity_id, form, template, kind):
+  current = entity_form_data(model, form, entity_id)
+  if current is None:
+    flash('This {} was deleted while you were editing it.'.format(kind), 'error')
+    return redirect(url_for('index'))
+
+  form.version.data = current.version
+  form.version.raw_data = [str(current.version)]
+  flash('{} was changed by someone else while you were editing it, your changes were not saved. '
+        'Submit them again to replace the other changes, or open the {} page to see them.'.format(current.name, kind), 'error')
+  return render_template(template, form=form, **{kind: current}), 409
+
+# render_template counterpart that yields the page in chunks,
+# wrap it in stream_with_context so the request outlives the view
+def stream_template(template_name, **context):
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(5)
+  return stream
+
 def flash_form_error(form):
   message = []
   for field, errors in form.errors.items():
@@ -0,0 +1,177 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.util import await_only, greenlet_spawn
+from werkzeug.exceptions import HTTPException
+from app import app as flask_app
+from engine import async_engine_options, async_url
+from models import db
+from replicas import ENGINE_ADAPTER, READ_METHODS
+
+try:
+    import asyncpg
+except ImportError:
+    raise ImportError('asgi.py needs asyncpg, and uvicorn to serve it: pip install -r requirements-asgi.txt')
+
+#----------------------------------------------------------------------------#
+# ASGI entry point.
+#----------------------------------------------------------------------------#
+
+# Serves the Flask app from an ASGI server (uvicorn asgi:app).
+# Read requests (GET, HEAD and the read_only search forms) run the usual
+# views, queries and templates on the event loop, each in its own greenlet,
+# with the database sessions bound to SQLAlchemy's async engine: a request
+# waiting on PostgreSQL lets the others run instead of holding a worker.
+# Form submissions and other writes run on the sync engine in a thread pool.
+# Werkzeug's context locals and Flask-SQLAlchemy's scoped session are keyed
+# by greenlet, so concurrent requests on the loop keep their own request
+# context and session.
+
+
+# asyncpg engines standing in for the app's engines (the primary and each
+# replica), created on first use.
+# Called with an engine, returns the sync facade of its async counterpart:
+# sessions use it like any engine, and its connections await the event loop
+# when used inside greenlet_spawn.
+class AsyncEngines:
+
+    def __init__(self, config):
+        self.pgbouncer = config['PGBOUNCER_TRANSACTION_POOLING']
+        self.options = async_engine_options(config)
+        self.engines = {}
+
+    def __call__(self, engine):
+        key = engine.url.render_as_string(hide_password=False)
+        async_engine = self.engines.get(key)
+        if async_engine is None:
+            async_engine = self.engines[key] = create_async_engine(
+                async_url(engine.url, self.pgbouncer), **self.options)
+        return async_engine.sync_engine
+
+    async def dispose(self):
+        for async_engine in self.engines.values():
+            await async_engine.dispose()
+
+
+class AsgiApp:
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.url_map = wsgi_app.url_map
+        self.engines = AsyncEngines(config)
+        self.executor = ThreadPoolExecutor(max_workers=config['ASGI_SYNC_THREADS'], thread_name_prefix='fyyur-sync')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        environ = wsgi_environ(scope, await read_body(receive))
+
+        if self.is_read(environ):
+            environ[ENGINE_ADAPTER] = self.engines
+            await greenlet_spawn(self.run_wsgi, environ, lambda message: await_only(send(message)))
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self.executor,
+                self.run_wsgi,
+                environ,
+                lambda message: asyncio.run_coroutine_threadsafe(send(message), loop).result())
+
+    def is_read(self, environ) -> bool:
+        if environ['REQUEST_METHOD'] in READ_METHODS:
+            return True
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return False
+        return endpoint in db.router.read_only_endpoints
+
+    # runs the WSGI app, passing its response to send(message) chunk by chunk
+    def run_wsgi(self, environ, send):
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(
+                type='http.response.start',
+                status=int(status.split(' ', 1)[0]),
+                headers=[(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers])
+
+        body = self.wsgi_app(environ, start_response)
+        try:
+            started = False
+            for chunk in body:
+                if not chunk:
+                    continue
+                if not started:
+                    send(start)
+                    started = True
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                send(start)
+            send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engines.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+# PEP 3333 environ of an ASGI http scope
+def wsgi_environ(scope, body: bytes) -> dict:
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope['http_version']),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin1')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+
+    # the body is read whole, chunked uploads included
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+app = AsgiApp(flask_app, flask_app.config)
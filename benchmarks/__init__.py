@@ -0,0 +1,63 @@
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Benchmark helpers.
+#----------------------------------------------------------------------------#
+
+# benchmarks create, truncate and fill their own tables,
+# so they must never run against the application database;
+# seeding and legacy code paths run without statement timeouts
+def bench_app(database_url: str):
+    import config
+    config.SQLALCHEMY_DATABASE_URI = database_url
+    config.DB_STATEMENT_TIMEOUT = 0
+    config.DB_ROUTE_STATEMENT_TIMEOUTS = {}
+
+    from app import app
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    return app
+
+
+# brings the benchmark database to the migrations head,
+# so indexes and functions match a deployed database
+def create_schema():
+    from flask_migrate import upgrade
+    upgrade()
+
+
+class StatementCounter:
+    count: int
+
+    def __init__(self, engine):
+        self.count = 0
+        self._engine = engine
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self._engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self._engine, 'before_cursor_execute', self._on_execute)
+
+
+# runs fn `repeat` times, returns (best seconds, statements per run)
+def measure(engine, fn, repeat: int = 5):
+    best = None
+    statements = 0
+
+    for _ in range(repeat):
+        with StatementCounter(engine) as counter:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+
+        statements = counter.count
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, statements
@@ -0,0 +1,103 @@
+""" Requests per second of the /api/v1 JSON routes against the HTML pages
+they replace for clients, rendered from the same data.
+
+Usage:
+    python -m benchmarks.api_throughput --database-url postgresql://localhost:5432/fyyur_bench --shows 100000
+
+The page cache is disabled so every request queries and renders; requests
+run one after another through the test client (no HTTP server), so the
+numbers compare per request work, not concurrency.
+"""
+import argparse
+import time
+from benchmarks import bench_app, create_schema
+
+ENTITIES = 1000
+
+# (name, HTML request, API request); a request is (method, url, form)
+ROUTES = [
+    ('venue page', ('GET', '/venues/1', None), ('GET', '/api/v1/venues/1?include=shows', None)),
+    ('venue page, sparse', ('GET', '/venues/1', None), ('GET', '/api/v1/venues/1?include=upcoming_shows&fields=name&fields[shows]=start_time,artist_name', None)),
+    ('artist page', ('GET', '/artists/1', None), ('GET', '/api/v1/artists/1?include=shows', None)),
+    ('shows page', ('GET', '/shows', None), ('GET', '/api/v1/shows?limit=60', None)),
+    ('venue search', ('POST', '/venues/search', {'search_term': 'venue 1'}), ('GET', '/api/v1/venues/search?q=venue%201&limit=20', None)),
+    ('artist search', ('POST', '/artists/search', {'search_term': 'artist 1'}), ('GET', '/api/v1/artists/search?q=artist%201&limit=20', None)),
+    ('venue directory', ('GET', '/venues', None), ('GET', '/api/v1/venues?limit=500&fields=name,city,state,upcoming_shows_count', None)),
+]
+
+
+def seed(db, shows: int):
+    db.session.execute('TRUNCATE "Venue", "Artist", show RESTART IDENTITY CASCADE')
+    db.session.execute('''
+        INSERT INTO "Venue" (name, city, state, address, phone, genres, image_link, seeking_talent)
+        SELECT 'Venue ' || i, 'City ' || i % 50, 'CA', i || ' Main St', '123-123-1234', '{Jazz}',
+               'https://example.com/venue/' || i, false
+        FROM generate_series(1, :entities) AS i
+    ''', {'entities': ENTITIES})
+    db.session.execute('''
+        INSERT INTO "Artist" (name, city, state, phone, genres, image_link, seeking_venue)
+        SELECT 'Artist ' || i, 'City ' || i % 50, 'CA', '123-123-1234', '{"Rock n Roll"}',
+               'https://example.com/artist/' || i, false
+        FROM generate_series(1, :entities) AS i
+    ''', {'entities': ENTITIES})
+    db.session.execute('''
+        INSERT INTO show (venue_id, artist_id, start_time)
+        SELECT 1 + i % :entities, 1 + (i * 7) % :entities, now() + (i - :shows / 2) * interval '1 minute'
+        FROM generate_series(1, :shows) AS i
+    ''', {'entities': ENTITIES, 'shows': shows})
+    db.session.commit()
+
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM ANALYZE')
+
+
+# (requests per second, response bytes)
+def throughput(client, request, requests: int):
+    method, url, form = request
+    size = len(client.open(url, method=method, data=form).get_data())
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.open(url, method=method, data=form)
+        response.get_data()
+    elapsed = time.perf_counter() - start
+
+    return requests / elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--stdlib-json', action='store_true', help='encode with json instead of orjson')
+    args = parser.parse_args()
+
+    import config
+    config.PAGE_CACHE_BACKEND = None
+    app = bench_app(args.database_url)
+
+    import api
+    from models import db
+    if args.stdlib_json:
+        api.orjson = None
+
+    with app.app_context():
+        create_schema()
+        seed(db, args.shows)
+        db.session.remove()
+
+    client = app.test_client()
+
+    print('encoder: {}'.format('orjson' if api.orjson is not None else 'json'))
+    print('{:<20} {:>10} {:>10} {:>8} {:>12} {:>12}'.format('route', 'html req/s', 'api req/s', 'speedup', 'html bytes', 'api bytes'))
+
+    for name, html, json in ROUTES:
+        html_rate, html_size = throughput(client, html, args.requests)
+        api_rate, api_size = throughput(client, json, args.requests)
+        print('{:<20} {:>10.0f} {:>10.0f} {:>7.1f}x {:>12,} {:>12,}'.format(
+            name, html_rate, api_rate, api_rate / html_rate, html_size, api_size))
+
+
+if __name__ == '__main__':
+    main()
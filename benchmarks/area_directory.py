@@ -0,0 +1,79 @@
+""" Query count and latency of the /venues directory as the number of cities grows.
+
+Usage:
+    python -m benchmarks.area_directory --database-url postgresql://localhost:5432/fyyur_bench
+
+The legacy path is the per-city lookup /venues used before area_directory(),
+including the joined load of every venue's shows.
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+from benchmarks import bench_app, create_schema, measure
+
+VENUES_PER_CITY = 3
+SHOWS_PER_VENUE = 4
+
+
+def seed(db, Venue, Artist, Show, cities: int):
+    db.session.execute('TRUNCATE "Venue", "Artist", show RESTART IDENTITY CASCADE')
+
+    rng = random.Random(cities)
+    now = datetime.now()
+
+    db.session.execute(Artist.__table__.insert(), [{'name': 'Artist 1', 'seeking_venue': False}])
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': 'Venue {}-{}'.format(city, n), 'city': 'City {}'.format(city), 'state': 'CA', 'seeking_talent': False}
+        for city in range(cities) for n in range(VENUES_PER_CITY)
+        ])
+    db.session.execute(Show.__table__.insert(), [
+        {'venue_id': venue_id, 'artist_id': 1, 'start_time': now + timedelta(days=rng.randint(-365, 365))}
+        for venue_id in range(1, cities * VENUES_PER_CITY + 1) for _ in range(SHOWS_PER_VENUE)
+        ])
+    db.session.commit()
+
+
+def legacy_area_directory(Venue, VenueUI):
+    areas = Venue.query.with_entities(Venue.city, Venue.state).distinct(Venue.city).all()
+
+    for area in areas:
+        venues = Venue.query.options(joinedload(Venue.shows)).filter_by(city=area.city).order_by('id').all()
+        for venue in map(lambda data: VenueUI(venue_data=data), venues):
+            venue.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--cities', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = bench_app(args.database_url)
+
+    from models import db, Venue, Artist, Show, VenueUI
+    from queries import area_directory
+
+    print('{:>8} {:>22} {:>22}'.format('cities', 'legacy (stmts / ms)', 'grouped (stmts / ms)'))
+
+    with app.app_context():
+        create_schema()
+
+        for cities in args.cities:
+            seed(db, Venue, Artist, Show, cities)
+
+            legacy_time, legacy_statements = measure(
+                db.engine, lambda: legacy_area_directory(Venue, VenueUI), args.repeat)
+            grouped_time, grouped_statements = measure(
+                db.engine, lambda: [area.venues for area in area_directory()], args.repeat)
+            db.session.remove()
+
+            print('{:>8} {:>12} / {:>7.1f} {:>12} / {:>7.1f}'.format(
+                cities,
+                legacy_statements, legacy_time * 1000,
+                grouped_statements, grouped_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+""" Load test of the read routes: sync WSGI workers against the ASGI entry point.
+
+Usage:
+    python -m benchmarks.asgi_load --database-url postgresql://localhost:5432/fyyur_bench --concurrency 50 200
+
+Starts gunicorn with sync workers (app:app), then uvicorn (asgi:app), with
+the same number of worker processes and the page cache disabled, and
+drives each with `concurrency` clients looping over venue, artist and
+API detail pages, /shows and the venue search form for --duration
+seconds. Reports requests per second and p50 / p99 latency.
+Needs gunicorn, uvicorn and asyncpg; run the load generator on another
+machine than the server to keep it from competing for CPU.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from benchmarks import bench_app, create_schema
+from benchmarks.api_throughput import ENTITIES, seed
+
+HOST = '127.0.0.1'
+PORT = 8021
+
+# (method, path, form body), {entity} is a random venue or artist id
+REQUESTS = [
+    ('GET', '/venues/{entity}', None),
+    ('GET', '/artists/{entity}', None),
+    ('GET', '/api/v1/venues/{entity}?include=shows', None),
+    ('GET', '/shows', None),
+    ('POST', '/venues/search', 'search_term=venue+{entity}'),
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_command(server: str, workers: int) -> list:
+    if server == 'sync':
+        return [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(workers),
+                '--bind', '{}:{}'.format(HOST, PORT), '--log-level', 'warning']
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers),
+            '--host', HOST, '--port', str(PORT), '--log-level', 'warning', '--no-access-log']
+
+
+def start_server(server: str, workers: int, database_url: str):
+    env = dict(os.environ, DATABASE_URL=database_url, PAGE_CACHE_BACKEND='none')
+    process = subprocess.Popen(server_command(server, workers), cwd=ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if asyncio.run(fetch('GET', '/', None)) == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('{} server did not start'.format(server))
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait(timeout=30)
+
+
+# one request on its own connection, returns the status code
+async def fetch(method: str, path: str, body: str) -> int:
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    try:
+        head = '{} {} HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n'.format(method, path, HOST)
+        payload = (body or '').encode()
+        if body is not None:
+            head += 'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {}\r\n'.format(len(payload))
+        writer.write(head.encode() + b'\r\n' + payload)
+        status = await reader.readline()
+        await reader.read()
+        return int(status.split()[1])
+    finally:
+        writer.close()
+
+
+async def client(deadline: float, rng: random.Random, latencies: list, errors: list):
+    while time.monotonic() < deadline:
+        method, path, body = rng.choice(REQUESTS)
+        entity = rng.randint(1, ENTITIES)
+        start = time.perf_counter()
+        try:
+            status = await fetch(method, path.format(entity=entity), body and body.format(entity=entity))
+        except OSError:
+            status = None
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(status)
+
+
+# (requests per second, p50 seconds, p99 seconds, errors)
+async def load(concurrency: int, duration: float):
+    latencies, errors = [], []
+    start = time.monotonic()
+    await asyncio.gather(*(
+        client(start + duration, random.Random(index), latencies, errors)
+        for index in range(concurrency)))
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    if not latencies:
+        return 0.0, None, None, len(errors)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return len(latencies) / elapsed, p50, p99, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--servers', nargs='+', choices=('sync', 'async'), default=['sync', 'async'])
+    args = parser.parse_args()
+
+    app = bench_app(args.database_url)
+
+    from models import db
+
+    with app.app_context():
+        create_schema()
+        seed(db, args.shows)
+        db.session.remove()
+        db.engine.dispose()
+
+    print('{:<8} {:>11} {:>9} {:>7} {:>8} {:>8} {:>8}'.format(
+        'server', 'concurrency', 'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms'))
+
+    for server in args.servers:
+        process = start_server(server, args.workers, args.database_url)
+        try:
+            # first requests compile templates and open pool connections
+            asyncio.run(load(min(args.concurrency), 2))
+
+            for concurrency in args.concurrency:
+                rate, p50, p99, errors = asyncio.run(load(concurrency, args.duration))
+                print('{:<8} {:>11} {:>9} {:>7} {:>8.0f} {:>8.1f} {:>8.1f}'.format(
+                    server, concurrency, int(rate * args.duration), errors, rate,
+                    (p50 or 0) * 1000, (p99 or 0) * 1000))
+        finally:
+            stop_server(process)
+
+
+if __name__ == '__main__':
+    main()
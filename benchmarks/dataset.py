@@ -0,0 +1,184 @@
+""" Seeded benchmark dataset: venues, artists and shows at a scale factor.
+
+Usage:
+    python -m benchmarks.dataset --database-url postgresql://localhost:5432/fyyur_bench --scale 10k --seed 1
+
+The same scale and seed always produce the same rows, relative to the
+hour the dataset is generated: show times are spread over a year either
+side of it, so about half the shows are past and half upcoming.
+Shows per venue and per artist are skewed like real listings, a few busy
+venues and many quiet ones: venue 1 is the busiest, then venue 2, and so
+on (see SKEW).
+"""
+import argparse
+import time
+from benchmarks import bench_app, create_schema
+
+# shows at each scale factor
+SCALES = {
+    '1k': 1000,
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+
+# average shows per venue and per artist
+SHOWS_PER_ENTITY = 50
+MIN_ENTITIES = 10
+
+# show i goes to venue floor(venues * u ** skew) + 1, u uniform in [0, 1):
+# skew 1 spreads shows evenly, the busiest venue gets venues ** (-1 / skew)
+# of all shows (0.7% of 1M shows across 20,000 venues at 2)
+SKEW = {
+    'venue': 2.0,
+    'artist': 1.5,
+}
+
+CITIES = 50
+STATES = ['CA', 'NY', 'TX', 'IL', 'WA', 'LA']
+GENRES = ['Jazz', 'Folk', 'Rock n Roll', 'Blues', 'Classical', 'Hip-Hop', 'Swing', 'Soul']
+
+# days either side of the generation time
+SHOW_SPAN_DAYS = 365
+
+# uniform float in [0, 1) for row i, the same for a given seed and stream
+UNIFORM = "(('x' || substr(md5(:seed || '/{stream}/' || i), 1, 8))::bit(32)::bigint / 4294967296.0)"
+
+
+def uniform(stream: str) -> str:
+    return UNIFORM.format(stream=stream)
+
+
+# genres as the column's array literal ('{Jazz,Folk}'),
+# one or two of GENRES picked by the row's hash
+def genres(stream: str) -> str:
+    first = 'floor({} * :genre_count)::int + 1'.format(uniform(stream + '-genre'))
+    second = 'floor({} * :genre_count)::int + 1'.format(uniform(stream + '-genre2'))
+    return '''
+        CASE WHEN {first} = {second} THEN '{{"' || (:genres)[{first}] || '"}}'
+             ELSE '{{"' || (:genres)[{first}] || '","' || (:genres)[{second}] || '"}}'
+        END
+    '''.format(first=first, second=second)
+
+
+def entity_counts(shows: int) -> (int, int):
+    entities = max(shows // SHOWS_PER_ENTITY, MIN_ENTITIES)
+    return entities, entities
+
+
+# truncates the tables and fills them, returns the dataset's description
+def generate(db, shows: int, seed: int = 1) -> dict:
+    venues, artists = entity_counts(shows)
+    parameters = {
+        'seed': seed,
+        'venues': venues,
+        'artists': artists,
+        'shows': shows,
+        'cities': CITIES,
+        'states': STATES,
+        'genres': GENRES,
+        'genre_count': len(GENRES),
+        'venue_skew': SKEW['venue'],
+        'artist_skew': SKEW['artist'],
+        'span_days': SHOW_SPAN_DAYS,
+    }
+
+    db.session.execute('TRUNCATE "Venue", "Artist", show RESTART IDENTITY CASCADE')
+    db.session.execute('''
+        INSERT INTO "Venue" (name, city, state, address, phone, genres, image_link, facebook_link,
+                             website_link, seeking_talent, seeking_description)
+        SELECT
+            'Venue ' || i,
+            'City ' || floor({city} * :cities)::int,
+            (:states)[floor({state} * array_length(:states, 1))::int + 1],
+            i || ' Main Street',
+            '555-' || lpad((i % 10000)::text, 4, '0'),
+            {genres},
+            'https://example.com/venues/' || i || '.jpg',
+            'https://www.facebook.com/venue' || i,
+            'https://venue' || i || '.example.com',
+            {seeking} < 0.3,
+            CASE WHEN {seeking} < 0.3 THEN 'Looking for local acts' END
+        FROM generate_series(1, :venues) AS i
+    '''.format(
+        city=uniform('venue-city'),
+        state=uniform('venue-state'),
+        genres=genres('venue'),
+        seeking=uniform('venue-seeking')
+        ), parameters)
+    db.session.execute('''
+        INSERT INTO "Artist" (name, city, state, phone, genres, image_link, facebook_link,
+                              website_link, seeking_venue, seeking_description)
+        SELECT
+            'Artist ' || i,
+            'City ' || floor({city} * :cities)::int,
+            (:states)[floor({state} * array_length(:states, 1))::int + 1],
+            '555-' || lpad((i % 10000)::text, 4, '0'),
+            {genres},
+            'https://example.com/artists/' || i || '.jpg',
+            'https://www.facebook.com/artist' || i,
+            'https://artist' || i || '.example.com',
+            {seeking} < 0.3,
+            CASE WHEN {seeking} < 0.3 THEN 'Looking for shows' END
+        FROM generate_series(1, :artists) AS i
+    '''.format(
+        city=uniform('artist-city'),
+        state=uniform('artist-state'),
+        genres=genres('artist'),
+        seeking=uniform('artist-seeking')
+        ), parameters)
+    db.session.execute('''
+        INSERT INTO show (venue_id, artist_id, start_time)
+        SELECT
+            floor(:venues * power({venue}, :venue_skew))::int + 1,
+            floor(:artists * power({artist}, :artist_skew))::int + 1,
+            date_trunc('hour', localtimestamp)
+                + round(({time} * 2 - 1) * :span_days * 48) * interval '30 minutes'
+        FROM generate_series(1, :shows) AS i
+    '''.format(
+        venue=uniform('show-venue'),
+        artist=uniform('show-artist'),
+        time=uniform('show-time')
+        ), parameters)
+    db.session.commit()
+
+    # as autovacuum leaves a deployed database: statistics, and a visibility
+    # map so index only scans are planned as such
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM ANALYZE')
+
+    return {'seed': seed, 'venues': venues, 'artists': artists, 'shows': shows}
+
+
+def scale(value: str) -> int:
+    value = value.lower()
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('scale is one of {} or a number of shows'.format(', '.join(SCALES)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--scale', type=scale, default='10k', help='shows: {} or a number'.format(', '.join(SCALES)))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = bench_app(args.database_url)
+
+    from models import db
+
+    with app.app_context():
+        create_schema()
+        start = time.perf_counter()
+        dataset = generate(db, args.scale, seed=args.seed)
+
+    print('{venues:,} venues, {artists:,} artists, {shows:,} shows (seed {seed})'.format(**dataset)
+          + ' in {:.1f}s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+from datetime import datetime
+from sqlalchemy.orm import joinedload
+
+#----------------------------------------------------------------------------#
+# Legacy view models.
+#----------------------------------------------------------------------------#
+
+# Frozen copies of the view models and loading the pages used before the
+# column-only rows of queries.py, kept as the baseline benchmarks compare with.
+
+class LegacyShowUI:
+
+    def __init__(self, show):
+        self.id = show.id
+        self.venue_id = show.venue_id
+        self.artist_id = show.artist_id
+        self.artists = show.artists
+        self.artist_name = show.artists.name
+        self.artist_image_link = show.artists.image_link
+        self.venues = show.venues
+        self.venue_name = show.venues.name
+        self.venue_image_link = show.venues.image_link
+        self.start_time = show.start_time
+
+
+def legacy_past_upcoming_shows(shows):
+    past_shows, upcoming_shows = [], []
+
+    for show in shows:
+        (past_shows if show.start_time < datetime.now() else upcoming_shows).append(show)
+
+    past_shows = map(lambda show: LegacyShowUI(show), past_shows)
+    upcoming_shows = map(lambda show: LegacyShowUI(show), upcoming_shows)
+    return (past_shows, upcoming_shows)
+
+
+class LegacyVenueUI:
+
+    def __init__(self, venue_data):
+        (past_shows, upcoming_shows) = legacy_past_upcoming_shows(venue_data.shows)
+
+        # mapped twice, as the original VenueUI did
+        past_shows = list(map(LegacyShowUI, past_shows))
+        upcoming_shows = list(map(LegacyShowUI, upcoming_shows))
+
+        self.id = venue_data.id
+        self.name = venue_data.name
+        self.city = venue_data.city
+        self.state = venue_data.state
+        self.address = venue_data.address
+        self.phone = venue_data.phone
+        self.genres = venue_data.genres
+        self.image_link = venue_data.image_link
+        self.facebook_link = venue_data.facebook_link
+        self.website = venue_data.website_link
+        self.seeking_talent = venue_data.seeking_talent
+        self.seeking_description = venue_data.seeking_description
+        self.past_shows = past_shows
+        self.past_shows_count = len(past_shows)
+        self.upcoming_shows = upcoming_shows
+        self.upcoming_shows_count = len(upcoming_shows)
+
+
+# Venue.query.get() with the old lazy='joined' shows
+def legacy_venue_ui(Venue, Show, venue_id):
+    venue = Venue.query.options(joinedload(Venue.shows).joinedload(Show.artists)).get(venue_id)
+    return LegacyVenueUI(venue)
+
+
+# Show.query.all() with both sides joined, mapped to tiles
+def legacy_show_tiles(Show):
+    shows = Show.query.options(joinedload(Show.artists), joinedload(Show.venues)).all()
+    return map(lambda show: LegacyShowUI(show), shows)
@@ -0,0 +1,237 @@
+""" Micro-benchmarks of the view model mappers and date formatting, and of
+every read route through the test client, on a seeded dataset
+(benchmarks.dataset). Results can be written as JSON and compared with
+the results of another commit.
+
+Usage:
+    python -m benchmarks.micro --database-url postgresql://localhost:5432/fyyur_bench --scale 10k --output before.json
+    git checkout my-branch
+    python -m benchmarks.micro --database-url postgresql://localhost:5432/fyyur_bench --scale 10k --compare before.json
+
+Only runs on the same scale, seed and machine compare. The page cache is
+disabled so every request queries and renders. Routes that write (form
+submissions, deletes) are left out so every run sees the same data.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+from benchmarks import bench_app, create_schema, StatementCounter
+from benchmarks.dataset import SCALES, generate, scale
+from benchmarks.plan_budget import PAST_CURSOR
+
+# a change beyond this share of the baseline is reported as slower / faster
+NOISE = 0.1
+
+
+# requests (method, url, form) for a dataset: venue and artist 1
+# are the busiest, the ones in the middle of the ids typical
+def read_routes(dataset: dict) -> list:
+    venue = dataset['venues'] // 2
+    artist = dataset['artists'] // 2
+    return [
+        ('GET', '/', None),
+        ('GET', '/venues', None),
+        ('GET', '/venues/1', None),
+        ('GET', '/venues/{}'.format(venue), None),
+        ('GET', '/venues/1/shows?when=past&cursor=' + PAST_CURSOR, None),
+        ('GET', '/venues/1/edit', None),
+        ('GET', '/venues/create', None),
+        ('POST', '/venues/search', {'search_term': 'venue 1'}),
+        ('GET', '/artists', None),
+        ('GET', '/artists/1', None),
+        ('GET', '/artists/{}'.format(artist), None),
+        ('GET', '/artists/1/shows?when=past&cursor=' + PAST_CURSOR, None),
+        ('GET', '/artists/1/edit', None),
+        ('GET', '/artists/create', None),
+        ('POST', '/artists/search', {'search_term': 'artist 1'}),
+        ('GET', '/shows', None),
+        ('GET', '/shows?when=past', None),
+        ('GET', '/shows?when=upcoming', None),
+        ('GET', '/shows/create', None),
+        ('GET', '/export/venues.csv', None),
+        ('GET', '/export/artists.ndjson', None),
+        ('GET', '/export/shows.csv?city=City%201', None),
+        ('GET', '/api/v1/venues', None),
+        ('GET', '/api/v1/venues?include=shows', None),
+        ('GET', '/api/v1/venues/1?include=shows', None),
+        ('GET', '/api/v1/venues/1/shows?when=past&cursor=' + PAST_CURSOR, None),
+        # a query parameter named like a path argument is not a crash
+        ('GET', '/api/v1/venues/1/shows?when=past&venue_id=2&cursor=' + PAST_CURSOR, None),
+        ('GET', '/api/v1/venues/search?q=venue%201', None),
+        ('GET', '/api/v1/artists', None),
+        ('GET', '/api/v1/artists/1?include=shows', None),
+        ('GET', '/api/v1/artists/search?q=artist%201', None),
+        ('GET', '/api/v1/shows?when=upcoming', None),
+        ('GET', '/api/v1/shows/1', None),
+    ]
+
+
+# seconds per call of fn: best and median of `repeat` timeit runs,
+# each long enough (timeit's autorange) to time reliably
+def timed(fn, repeat: int) -> dict:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+    return {'seconds': min(runs), 'median': statistics.median(runs)}
+
+
+def micro_benchmarks(db, repeat: int) -> dict:
+    from app import data_to_search_ui, format_datetime
+    from models import MapperShowUI, Show, Venue
+    from queries import search_results, show_tiles
+
+    now = datetime.now()
+
+    # the busiest venue's shows, as its page loads them
+    rows = show_tiles().filter(Show.venue_id == 1).order_by(Show.start_time, Show.id).all()
+    total, matches = search_results(Venue, 'venue 1', now=now)
+    start_times = [row.start_time for row in rows]
+    db.session.remove()
+
+    # format_datetime memoizes the formatted fields, as in a running app
+    # the first run warms it and the others measure lookups
+    benchmarks = {
+        'MapperShowUI.shows': (lambda: MapperShowUI(rows).shows(), len(rows)),
+        'data_to_search_ui': (lambda: data_to_search_ui(matches, total), len(matches)),
+        'format_datetime full': (lambda: [format_datetime(value, 'full') for value in start_times], len(start_times)),
+        'format_datetime medium': (lambda: [format_datetime(value) for value in start_times], len(start_times)),
+    }
+
+    results = {}
+    for name, (fn, items) in benchmarks.items():
+        results[name] = dict(timed(fn, repeat), items=items)
+    return results
+
+
+def route_benchmarks(app, db, dataset: dict, repeat: int) -> dict:
+    client = app.test_client()
+    results = {}
+
+    for method, url, form in read_routes(dataset):
+        def request():
+            response = client.open(url, method=method, data=form)
+            response.get_data()
+            response.close()
+            if response.status_code != 200:
+                raise RuntimeError('{} {}: status {}'.format(method, url, response.status_code))
+
+        request()
+        runs = []
+        for _ in range(repeat):
+            with StatementCounter(db.engine) as counter:
+                runs.append(timeit.timeit(request, number=1))
+
+        results['{} {}'.format(method, url)] = {
+            'seconds': min(runs),
+            'median': statistics.median(runs),
+            'statements': counter.count,
+        }
+    return results
+
+
+# (commit, whether the working tree has uncommitted changes)
+def git_revision() -> (str, bool):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+
+def print_results(results: dict):
+    for name, result in results['benchmarks'].items():
+        statements = result.get('statements')
+        print('{:<44} {:>10.3f} ms  median {:>10.3f} ms  {}'.format(
+            name,
+            result['seconds'] * 1000,
+            result['median'] * 1000,
+            '{} stmts'.format(statements) if statements is not None else '{} items'.format(result['items'])))
+
+
+# prints the change of each benchmark against a baseline run,
+# returns the names of the ones slower beyond NOISE
+def compare(baseline: dict, results: dict) -> list:
+    if baseline['dataset'] != results['dataset']:
+        print('baseline dataset {} differs from {}, timings do not compare'.format(baseline['dataset'], results['dataset']))
+
+    print('against {} ({})'.format((baseline['commit'] or 'unknown')[:12], baseline['created']))
+    slower = []
+    for name, result in results['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            print('{:<44} new'.format(name))
+            continue
+
+        change = result['seconds'] / before['seconds'] - 1
+        verdict = 'slower' if change > NOISE else 'faster' if change < -NOISE else ''
+        if verdict == 'slower':
+            slower.append(name)
+
+        statements = ''
+        if result.get('statements') != before.get('statements'):
+            statements = '  statements {} -> {}'.format(before.get('statements'), result.get('statements'))
+        print('{:<44} {:>10.3f} -> {:>10.3f} ms {:>+7.1%} {:<6}{}'.format(
+            name, before['seconds'] * 1000, result['seconds'] * 1000, change, verdict, statements))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--scale', type=scale, default='10k', help='shows: {} or a number'.format(', '.join(SCALES)))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--skip-routes', action='store_true', help='run the micro-benchmarks only')
+    args = parser.parse_args()
+
+    import config
+    config.PAGE_CACHE_BACKEND = None
+    app = bench_app(args.database_url)
+
+    from models import db
+
+    with app.app_context():
+        create_schema()
+        dataset = generate(db, args.scale, seed=args.seed)
+        db.session.remove()
+
+        benchmarks = micro_benchmarks(db, args.repeat)
+        if not args.skip_routes:
+            benchmarks.update(route_benchmarks(app, db, dataset, args.repeat))
+
+    commit, dirty = git_revision()
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'dataset': dataset,
+        'repeat': args.repeat,
+        'benchmarks': benchmarks,
+    }
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+            output.write('\n')
+        print('results written to {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            slower = compare(json.load(baseline_file), results)
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+""" Query-plan budget check for every read route.
+
+Usage:
+    python -m benchmarks.plan_budget --database-url postgresql://localhost:5432/fyyur_bench
+    python -m benchmarks.plan_budget --database-url ... --update
+
+Seeds a scaled dataset, calls each route through the Flask test client,
+records every statement it runs with its EXPLAIN (FORMAT JSON) plan and
+compares the route against benchmarks/plan_budget.json. Exits with
+status 1 when a route runs more statements, sequentially scans a large
+table it is not allowed to, or has a higher estimated cost than budgeted.
+--update rewrites the budget from the current run.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from sqlalchemy import event, text
+from benchmarks import bench_app, create_schema
+from pagination import encode_cursor
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), 'plan_budget.json')
+
+VENUES = 2000
+ARTISTS = 2000
+SHOWS = 100000
+
+# tables with at least this many rows must not be scanned sequentially
+LARGE_TABLE_ROWS = 10000
+
+# "load more" cursors before every past show and every upcoming show
+PAST_CURSOR = encode_cursor(datetime(2100, 1, 1), 0)
+UPCOMING_CURSOR = encode_cursor(datetime(2000, 1, 1), 0)
+
+# estimated cost budget written by --update, relative to the measured cost
+COST_HEADROOM = 1.25
+
+ROUTES = [
+    ('GET', '/', None),
+    ('GET', '/venues', None),
+    ('GET', '/venues/1', None),
+    ('GET', '/venues/1/shows?when=past&cursor=' + PAST_CURSOR, None),
+    ('GET', '/venues/1/shows?when=upcoming&cursor=' + UPCOMING_CURSOR, None),
+    ('GET', '/venues/1/edit', None),
+    ('POST', '/venues/search', {'search_term': 'hop'}),
+    ('GET', '/artists', None),
+    ('GET', '/artists/1', None),
+    ('GET', '/artists/1/shows?when=past&cursor=' + PAST_CURSOR, None),
+    ('GET', '/artists/1/edit', None),
+    ('POST', '/artists/search', {'search_term': 'band'}),
+    ('GET', '/shows', None),
+    ('GET', '/shows?when=past', None),
+    ('GET', '/shows?when=upcoming', None),
+    ('GET', '/api/v1/venues', None),
+    ('GET', '/api/v1/venues?include=shows', None),
+    ('GET', '/api/v1/venues/1?include=shows', None),
+    ('GET', '/api/v1/venues/1/shows?when=past&cursor=' + PAST_CURSOR, None),
+    ('GET', '/api/v1/venues/search?q=hop', None),
+    ('GET', '/api/v1/artists', None),
+    ('GET', '/api/v1/artists/1?include=shows', None),
+    ('GET', '/api/v1/artists/search?q=band', None),
+    ('GET', '/api/v1/shows?when=upcoming', None),
+    ('GET', '/api/v1/shows/1', None),
+]
+
+
+def seed(db):
+    db.session.execute('TRUNCATE "Venue", "Artist", show RESTART IDENTITY CASCADE')
+    db.session.execute('''
+        INSERT INTO "Venue" (name, city, state, address, genres, seeking_talent)
+        SELECT
+            (ARRAY['The Musical Hop', 'Park Square Live', 'The Dueling Pianos'])[1 + i % 3] || ' ' || i,
+            (ARRAY['San Francisco', 'New York', 'Austin', 'Chicago'])[1 + i % 4],
+            (ARRAY['CA', 'NY', 'TX', 'IL'])[1 + i % 4],
+            i || ' Folsom Street',
+            '{Jazz,Folk}',
+            i % 2 = 0
+        FROM generate_series(1, :venues) AS i
+    ''', {'venues': VENUES})
+    db.session.execute('''
+        INSERT INTO "Artist" (name, city, state, genres, seeking_venue)
+        SELECT
+            (ARRAY['Guns N Petals', 'Matt Quevado', 'The Wild Sax Band'])[1 + i % 3] || ' ' || i,
+            (ARRAY['San Francisco', 'New York', 'Austin', 'Chicago'])[1 + i % 4],
+            (ARRAY['CA', 'NY', 'TX', 'IL'])[1 + i % 4],
+            '{Rock n Roll}',
+            i % 2 = 0
+        FROM generate_series(1, :artists) AS i
+    ''', {'artists': ARTISTS})
+    db.session.execute('''
+        INSERT INTO show (venue_id, artist_id, start_time)
+        SELECT 1 + i % :venues, 1 + (i * 7) % :artists, now() + (i - :shows / 2) * interval '1 hour'
+        FROM generate_series(1, :shows) AS i
+    ''', {'venues': VENUES, 'artists': ARTISTS, 'shows': SHOWS})
+    db.session.commit()
+
+    # as autovacuum leaves a deployed database: statistics, and a visibility
+    # map so index only scans are planned as such
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM ANALYZE')
+
+
+def large_tables(db) -> set:
+    rows = db.session.execute(text('''
+        SELECT relname FROM pg_class
+        WHERE relkind IN ('r', 'p') AND reltuples >= :rows AND relnamespace = 'public'::regnamespace
+    '''), {'rows': LARGE_TABLE_ROWS})
+    return {row.relname for row in rows}
+
+
+def seq_scans(plan) -> set:
+    tables = {plan['Relation Name']} if plan.get('Node Type') == 'Seq Scan' else set()
+    for child in plan.get('Plans', []):
+        tables |= seq_scans(child)
+    return tables
+
+
+# statements a route runs, with their plans
+def record_route(app, db, method, url, data) -> list:
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    try:
+        response = app.test_client().open(url, method=method, data=data)
+        response.get_data()
+        response.close()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+
+    plans = []
+    with db.engine.connect() as connection:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+            plans.append(plan[0]['Plan'])
+
+    return statements, plans
+
+
+def measure(app, db) -> dict:
+    large = large_tables(db)
+    results = {}
+
+    for method, url, data in ROUTES:
+        statements, plans = record_route(app, db, method, url, data)
+        results['{} {}'.format(method, url)] = {
+            'statements': len(statements),
+            'cost': round(sum(plan['Total Cost'] for plan in plans), 2),
+            'seq_scans': sorted(set().union(*map(seq_scans, plans)) & large),
+        }
+
+    return results
+
+
+def over_budget(results: dict, budget: dict) -> list:
+    failures = []
+
+    for route, result in results.items():
+        allowed = budget.get(route)
+        if allowed is None:
+            failures.append('{}: no budget, run with --update'.format(route))
+            continue
+        if result['statements'] > allowed['statements']:
+            failures.append('{}: {} statements, budget {}'.format(route, result['statements'], allowed['statements']))
+        if result['cost'] > allowed['cost']:
+            failures.append('{}: estimated cost {}, budget {}'.format(route, result['cost'], allowed['cost']))
+        for table in set(result['seq_scans']) - set(allowed['seq_scans']):
+            failures.append('{}: sequential scan on large table {}'.format(route, table))
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--update', action='store_true', help='rewrite the budget from this run')
+    args = parser.parse_args()
+
+    app = bench_app(args.database_url)
+
+    from models import db
+
+    with app.app_context():
+        create_schema()
+        seed(db)
+        db.session.remove()
+        results = measure(app, db)
+
+    for route, result in results.items():
+        print('{:<28} {:>4} stmts {:>12.2f} cost  seq: {}'.format(
+            route, result['statements'], result['cost'], ', '.join(result['seq_scans']) or '-'))
+
+    if args.update:
+        budget = {
+            route: dict(result, cost=round(result['cost'] * COST_HEADROOM, 2))
+            for route, result in results.items()
+        }
+        with open(BUDGET_FILE, 'w') as budget_file:
+            json.dump(budget, budget_file, indent=2, sort_keys=True)
+            budget_file.write('\n')
+        print('budget written to {}'.format(BUDGET_FILE))
+        return
+
+    with open(BUDGET_FILE) as budget_file:
+        failures = over_budget(results, json.load(budget_file))
+
+    for failure in failures:
+        print('OVER BUDGET ' + failure)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
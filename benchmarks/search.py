@@ -0,0 +1,68 @@
+""" Trigram-indexed venue search against the legacy name ILIKE scan.
+
+Usage:
+    python -m benchmarks.search --database-url postgresql://localhost:5432/fyyur_bench --rows 1000000
+
+The legacy path loads every match, the indexed path loads one page plus the total.
+"""
+import argparse
+from sqlalchemy.orm import joinedload
+from benchmarks import bench_app, create_schema, measure
+
+TERMS = ['hop', 'music', 'dueling', 'san francisco', 'jazz', 'zzz']
+
+
+def seed(db, rows: int):
+    db.session.execute('TRUNCATE "Venue", "Artist", show RESTART IDENTITY CASCADE')
+    db.session.execute('''
+        INSERT INTO "Venue" (name, city, state, genres, seeking_talent)
+        SELECT
+            (ARRAY['The', 'Park', 'Blue', 'Golden', 'Dueling', 'Musical'])[1 + i % 6] || ' ' ||
+            (ARRAY['Hop', 'Square', 'Note', 'Pianos', 'Lounge', 'Hall', 'Cellar'])[1 + (i / 6) % 7] || ' ' ||
+            md5(i::text),
+            (ARRAY['San Francisco', 'New York', 'Austin', 'Chicago', 'Seattle'])[1 + i % 5],
+            (ARRAY['CA', 'NY', 'TX', 'IL', 'WA'])[1 + i % 5],
+            (ARRAY['{Jazz,Folk}', '{Rock n Roll}', '{Classical}', '{Blues,Soul}'])[1 + i % 4],
+            false
+        FROM generate_series(1, :rows) AS i
+    ''', {'rows': rows})
+    db.session.execute('ANALYZE "Venue"')
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app = bench_app(args.database_url)
+
+    from models import db, Venue
+    from queries import search_results
+
+    with app.app_context():
+        create_schema()
+        seed(db, args.rows)
+
+        print('{:>15} {:>10} {:>12} {:>10} {:>12}'.format('term', 'ilike hits', 'ilike ms', 'index hits', 'index ms'))
+
+        for term in TERMS:
+            legacy = []
+            indexed = []
+
+            legacy_time, _ = measure(
+                db.engine, lambda: legacy.append(Venue.query.options(joinedload(Venue.shows)).filter(Venue.name.ilike('%{}%'.format(term))).all()), args.repeat)
+            indexed_time, _ = measure(
+                db.engine, lambda: indexed.append(search_results(Venue, term)), args.repeat)
+            db.session.remove()
+
+            print('{:>15} {:>10} {:>12.1f} {:>10} {:>12.1f}'.format(
+                term,
+                len(legacy[-1]), legacy_time * 1000,
+                indexed[-1][0], indexed_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
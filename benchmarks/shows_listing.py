@@ -0,0 +1,104 @@
+""" Time to first byte and peak Python memory of /shows as the show table grows.
+
+Usage:
+    python -m benchmarks.shows_listing --database-url postgresql://localhost:5432/fyyur_bench --shows 1000 100000 1000000
+
+The legacy path renders every show through Show.query.all() and the old ShowUI;
+the keyset path streams the first page of the paginated listing.
+"""
+import argparse
+import time
+import tracemalloc
+from flask import render_template
+from benchmarks import bench_app, create_schema
+from benchmarks.legacy import legacy_show_tiles
+
+ENTITIES = 1000
+
+
+def seed(db, shows: int):
+    db.session.execute('TRUNCATE "Venue", "Artist", show RESTART IDENTITY CASCADE')
+    db.session.execute('''
+        INSERT INTO "Venue" (name, city, state, image_link, seeking_talent)
+        SELECT 'Venue ' || i, 'San Francisco', 'CA', 'https://example.com/venue/' || i, false
+        FROM generate_series(1, :entities) AS i
+    ''', {'entities': ENTITIES})
+    db.session.execute('''
+        INSERT INTO "Artist" (name, city, state, image_link, seeking_venue)
+        SELECT 'Artist ' || i, 'San Francisco', 'CA', 'https://example.com/artist/' || i, false
+        FROM generate_series(1, :entities) AS i
+    ''', {'entities': ENTITIES})
+    db.session.execute('''
+        INSERT INTO show (venue_id, artist_id, start_time)
+        SELECT 1 + i % :entities, 1 + (i * 7) % :entities, now() + (i - :shows / 2) * interval '1 hour'
+        FROM generate_series(1, :shows) AS i
+    ''', {'entities': ENTITIES, 'shows': shows})
+    db.session.execute('ANALYZE')
+    db.session.commit()
+
+
+# (seconds to first chunk, seconds to last chunk, peak traced bytes)
+def consume(chunks):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+
+    for _ in chunks:
+        if first is None:
+            first = time.perf_counter() - start
+
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def legacy_chunks(app, Show):
+    with app.test_request_context('/shows'):
+        yield render_template('pages/shows.html', shows=legacy_show_tiles(Show))
+
+
+def keyset_chunks(client, url):
+    response = client.get(url, buffered=False)
+    yield from response.response
+    response.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--shows', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    app = bench_app(args.database_url)
+
+    from models import db, Show
+
+    print('{:>10} {:>32} {:>32}'.format('shows', 'legacy (ttfb ms / total ms / MB)', 'keyset (ttfb ms / total ms / MB)'))
+
+    with app.app_context():
+        create_schema()
+
+        for shows in args.shows:
+            seed(db, shows)
+            db.session.remove()
+
+            legacy = (0, 0, 0)
+            if not args.skip_legacy:
+                legacy = consume(legacy_chunks(app, Show))
+                db.session.remove()
+
+            # first request compiles templates and warms the connection pool
+            client = app.test_client()
+            consume(keyset_chunks(client, '/shows?when=upcoming'))
+            keyset = consume(keyset_chunks(client, '/shows?when=upcoming'))
+
+            print('{:>10} {:>10.1f} / {:>8.1f} / {:>6.1f} {:>10.1f} / {:>8.1f} / {:>6.1f}'.format(
+                shows,
+                legacy[0] * 1000, legacy[1] * 1000, legacy[2] / 2 ** 20,
+                keyset[0] * 1000, keyset[1] * 1000, keyset[2] / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
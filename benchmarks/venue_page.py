@@ -0,0 +1,89 @@
+""" Memory and allocations of building one venue page with many shows.
+
+Usage:
+    python -m benchmarks.venue_page --database-url postgresql://localhost:5432/fyyur_bench --shows 50000
+
+Compares the legacy ORM view models with the slotted, row-built VenueUI.
+'retained' is what the view model keeps alive after the session is removed.
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from benchmarks import bench_app, create_schema
+from benchmarks.legacy import legacy_venue_ui
+
+ARTISTS = 500
+
+
+def seed(db, shows: int):
+    db.session.execute('TRUNCATE "Venue", "Artist", show RESTART IDENTITY CASCADE')
+    db.session.execute('''
+        INSERT INTO "Venue" (name, city, state, image_link, seeking_talent)
+        VALUES ('The Musical Hop', 'San Francisco', 'CA', 'https://example.com/venue/1', false)
+    ''')
+    db.session.execute('''
+        INSERT INTO "Artist" (name, city, state, image_link, seeking_venue)
+        SELECT 'Artist ' || i, 'San Francisco', 'CA', 'https://example.com/artist/' || i, false
+        FROM generate_series(1, :artists) AS i
+    ''', {'artists': ARTISTS})
+    db.session.execute('''
+        INSERT INTO show (venue_id, artist_id, start_time)
+        SELECT 1, 1 + i % :artists, now() + (i - :shows / 2) * interval '1 hour'
+        FROM generate_series(1, :shows) AS i
+    ''', {'artists': ARTISTS, 'shows': shows})
+    db.session.execute('ANALYZE')
+    db.session.commit()
+
+
+# (seconds, peak MB, allocated blocks, retained MB)
+def profile(db, build):
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+
+    page = build()
+
+    elapsed = time.perf_counter() - start
+    allocated = sys.getallocatedblocks() - blocks
+    peak = tracemalloc.get_traced_memory()[1]
+
+    db.session.remove()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del page
+    return elapsed, peak / 2 ** 20, allocated, retained / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--shows', type=int, default=50000)
+    args = parser.parse_args()
+
+    app = bench_app(args.database_url)
+
+    from models import db, Venue, Show
+    from queries import venue_detail
+
+    with app.app_context():
+        create_schema()
+        seed(db, args.shows)
+        db.session.remove()
+
+        print('{:>8} {:>10} {:>10} {:>12} {:>12}'.format('path', 'ms', 'peak MB', 'blocks', 'retained MB'))
+
+        for name, build in (
+            ('legacy', lambda: legacy_venue_ui(Venue, Show, 1)),
+            ('rows', lambda: venue_detail(1)),
+            ):
+            elapsed, peak, blocks, retained = profile(db, build)
+            print('{:>8} {:>10.1f} {:>10.1f} {:>12} {:>12.1f}'.format(name, elapsed * 1000, peak, blocks, retained))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, g, get_flashed_messages, jsonify, request, session, stream_with_context
+from werkzeug.http import is_resource_modified
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# Rendered GET pages keyed by endpoint, view arguments and query string.
+# Every entry carries tags such as 'venue:1' or 'shows'; write handlers
+# invalidate the tags their change affects instead of flushing the cache.
+# For `hold` seconds after an invalidation, pages of its tags read from a
+# replica (replicas.py) are not stored: the replica may not have the
+# change yet, and would refill the cache with the page it just replaced.
+
+class CachedPage:
+    __slots__ = ('body', 'mimetype')
+
+    body: bytes
+    mimetype: str
+
+    def __init__(self, body: bytes, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+
+
+class LRUBackend:
+    """ In-process cache bounded by entry count and stored bytes, with a TTL.
+    Entries are per worker process.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 2 ** 20, ttl: int = 60, hold: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hold = hold
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._held = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedPage:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, page, tags = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return page
+
+    def set(self, key: str, page: CachedPage, tags):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, page, tuple(tags))
+            self._bytes += len(page.body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags) -> int:
+        removed = 0
+        now = time.monotonic()
+        with self._lock:
+            self._held = {tag: until for tag, until in self._held.items() if until > now}
+            for tag in tags:
+                if self.hold:
+                    self._held[tag] = now + self.hold
+                for key in self._tags.pop(tag, set()):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+        return removed
+
+    def is_held(self, tags) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return any(self._held.get(tag, 0) > now for tag in tags)
+
+    def stats(self) -> dict:
+        return {
+            'backend': 'lru',
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'evictions': self.evictions,
+        }
+
+    def _remove(self, key: str):
+        expires_at, page, tags = self._entries.pop(key)
+        self._bytes -= len(page.body)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    """ Cache shared by all workers. client is a redis.Redis, or any stand-in
+    with the same interface such as fakeredis.FakeRedis.
+    """
+
+    def __init__(self, client, ttl: int = 60, prefix: str = 'fyyur:page:', hold: int = 0):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hold = hold
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('PAGE_CACHE_BACKEND = "redis" needs the redis package: pip install redis')
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key: str) -> CachedPage:
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+
+        value = json.loads(value)
+        return CachedPage(body=value['body'].encode(), mimetype=value['mimetype'])
+
+    def set(self, key: str, page: CachedPage, tags):
+        value = json.dumps({'body': page.body.decode(), 'mimetype': page.mimetype})
+
+        pipeline = self.client.pipeline()
+        pipeline.setex(self.prefix + key, self.ttl, value)
+        for tag in tags:
+            pipeline.sadd(self.prefix + 'tag:' + tag, key)
+            pipeline.expire(self.prefix + 'tag:' + tag, self.ttl)
+        pipeline.execute()
+
+    def invalidate(self, tags) -> int:
+        removed = 0
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = [self.prefix + key.decode() for key in self.client.smembers(tag_key)]
+            if keys:
+                removed += self.client.delete(*keys)
+            self.client.delete(tag_key)
+            if self.hold:
+                self.client.setex(self.prefix + 'held:' + tag, self.hold, 1)
+        return removed
+
+    def is_held(self, tags) -> bool:
+        return bool(tags) and self.client.exists(*(self.prefix + 'held:' + tag for tag in tags)) > 0
+
+    def stats(self) -> dict:
+        return {'backend': 'redis'}
+
+
+class PageCache:
+    hits: int
+    misses: int
+    stores: int
+    invalidated: int
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidated = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    # PAGE_CACHE_BACKEND: 'lru', 'redis' or None to disable caching
+    def init_app(self, app):
+        backend = app.config.get('PAGE_CACHE_BACKEND')
+        ttl = app.config.get('PAGE_CACHE_TTL', 60)
+        # replicas are expected to catch up within the read-after-write window
+        hold = app.config.get('READ_AFTER_WRITE_SECONDS', 10) if app.config.get('SQLALCHEMY_REPLICA_URIS') else 0
+
+        if backend == 'lru':
+            self.backend = LRUBackend(
+                max_entries=app.config.get('PAGE_CACHE_MAX_ENTRIES', 1024),
+                max_bytes=app.config.get('PAGE_CACHE_MAX_BYTES', 64 * 2 ** 20),
+                ttl=ttl,
+                hold=hold)
+        elif backend == 'redis':
+            self.backend = RedisBackend.from_url(app.config['PAGE_CACHE_REDIS_URL'], ttl=ttl, hold=hold)
+        elif backend is not None:
+            raise ValueError('Unknown PAGE_CACHE_BACKEND {!r}'.format(backend))
+
+        app.add_url_rule('/_cache/stats', 'page_cache_stats', lambda: jsonify(self.stats()))
+
+    # tags are formatted with the view arguments, e.g. 'venue:{venue_id}'
+    def cached(self, *tags):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**view_args):
+                # pending flash messages belong to this visitor only
+                if self.backend is None or session.get('_flashes'):
+                    return view(**view_args)
+
+                key = '{}:{}:{}'.format(
+                    request.endpoint,
+                    ','.join('{}={}'.format(name, value) for name, value in sorted(view_args.items())),
+                    request.query_string.decode())
+
+                page = self.backend.get(key)
+                if page is not None:
+                    self._count('hits')
+                    response = Response(page.body, mimetype=page.mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count('misses')
+                response = current_app.make_response(view(**view_args))
+                response.headers['X-Cache'] = 'MISS'
+
+                page_tags = [tag.format(**view_args) for tag in tags]
+                if response.is_streamed:
+                    response.response = stream_with_context(self._store_when_done(key, response.response, response, page_tags))
+                else:
+                    self._store(key, response.get_data(), response, page_tags)
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        if self.backend is not None and tags:
+            self._count('invalidated', self.backend.invalidate(tags))
+
+    def stats(self) -> dict:
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'invalidated': self.invalidated,
+        }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+    # counters are shared by the worker's threads
+    def _count(self, counter: str, n: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    # pages that flashed a message (errors) or failed are not stored, nor
+    # pages read from a replica right after their tags were invalidated
+    def _store(self, key, body: bytes, response, tags):
+        if response.status_code != 200 or get_flashed_messages():
+            return
+        if g.get('read_engine') is not None and self.backend.is_held(tags):
+            return
+        self.backend.set(key, CachedPage(body=body, mimetype=response.mimetype), tags)
+        self._count('stores')
+
+    # streamed pages are passed through chunk by chunk, then stored whole
+    def _store_when_done(self, key, body, response, tags):
+        chunks = []
+        for chunk in body:
+            chunk = chunk.encode() if isinstance(chunk, str) else chunk
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, b''.join(chunks), response, tags)
+
+
+page_cache = PageCache()
+
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+# validator(**view_args) returns (etag, last_modified) or None to skip.
+# A request whose If-None-Match or If-Modified-Since still matches is
+# answered 304 before the view, or the page cache, runs. Other pages
+# carry the validators and are revalidated by browsers on every visit.
+def conditional(validator):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            # pending flash messages are rendered into this visitor's page
+            if session.get('_flashes'):
+                return view(**view_args)
+
+            validators = validator(**view_args)
+            if validators is None:
+                return view(**view_args)
+
+            etag, last_modified = validators
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                return _set_validators(Response(status=304), etag, last_modified)
+
+            response = current_app.make_response(view(**view_args))
+            if response.status_code == 200 and not get_flashed_messages():
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+# weak, the same page may be rendered or served from the page cache
+def _set_validators(response, etag: str, last_modified):
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
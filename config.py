@@ -6,8 +6,105 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Enable debug mode.
 DEBUG = True
 
+def env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes', 'on')
+
+
+# "endpoint=ms,endpoint=ms", e.g. DB_ROUTE_STATEMENT_TIMEOUTS="search_venues=1000"
+def env_timeouts(name: str, default: dict) -> dict:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    pairs = (item.split('=') for item in value.split(',') if item.strip())
+    return {endpoint.strip(): int(timeout) for endpoint, timeout in pairs}
+
+
 # Connect to the database
 # TODO IMPLEMENT DATABASE URL
 username = os.environ.get('USER', os.environ.get('USERNAME'))
-SQLALCHEMY_DATABASE_URI = 'postgresql://{}@localhost:5432/fyyurapp'.format(username)
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://{}@localhost:5432/fyyurapp'.format(username))
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool, per worker process (engine.engine_options): DB_POOL_SIZE
+# kept open, up to DB_MAX_OVERFLOW more under load, DB_POOL_TIMEOUT seconds
+# waiting for one before failing, connections are tested on checkout
+# (pre-ping) and replaced after DB_POOL_RECYCLE seconds
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 10)
+DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 10)
+DB_POOL_PRE_PING = env_flag('DB_POOL_PRE_PING', True)
+DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+
+# statement_timeout in milliseconds (0 disables it), and tighter ones per endpoint
+DB_STATEMENT_TIMEOUT = env_int('DB_STATEMENT_TIMEOUT', 5000)
+DB_ROUTE_STATEMENT_TIMEOUTS = env_timeouts('DB_ROUTE_STATEMENT_TIMEOUTS', {
+    'search_venues': 2000,
+    'search_artists': 2000,
+    'api.search_venues': 2000,
+    'api.search_artists': 2000,
+})
+
+# Read replicas for GET and HEAD requests (replicas.ReplicaRouter), comma
+# separated URLs; a replica lagging more than REPLICA_MAX_LAG seconds is
+# skipped, and a visitor reads from the primary for READ_AFTER_WRITE_SECONDS
+# after submitting a change
+SQLALCHEMY_REPLICA_URIS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+REPLICA_HEALTH_CHECK_INTERVAL = env_int('REPLICA_HEALTH_CHECK_INTERVAL', 5)
+REPLICA_MAX_LAG = env_int('REPLICA_MAX_LAG', 10)
+READ_AFTER_WRITE_SECONDS = env_int('READ_AFTER_WRITE_SECONDS', 10)
+
+# asgi.py: threads running form submissions and other writes on the sync
+# engine, while reads run on the event loop with the async (asyncpg) engine
+ASGI_SYNC_THREADS = env_int('ASGI_SYNC_THREADS', 10)
+
+# DATABASE_URL points at PgBouncer with pool_mode = transaction
+PGBOUNCER_TRANSACTION_POOLING = env_flag('PGBOUNCER_TRANSACTION_POOLING', False)
+
+# Search results per page
+SEARCH_PAGE_SIZE = 20
+
+# /shows keyset page size and server side cursor batch size
+SHOWS_PAGE_SIZE = 60
+SHOWS_BATCH_SIZE = 20
+
+# past and upcoming shows on a venue or artist page, and per "load more"
+DETAIL_SHOWS_PAGE_SIZE = 12
+
+# most shows one /shows/schedule request books (scheduling.py)
+SCHEDULE_MAX_SLOTS = 1000
+
+# /api/v1 list and search page size, and the largest ?limit= accepted
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+# past and upcoming shows nested per venue or artist by include=shows
+API_INCLUDED_SHOWS = 12
+
+# Rendered page cache: 'lru' (per process), 'redis' or None to disable
+# (PAGE_CACHE_BACKEND=none)
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'lru').lower()
+PAGE_CACHE_BACKEND = None if PAGE_CACHE_BACKEND in ('', 'none') else PAGE_CACHE_BACKEND
+PAGE_CACHE_TTL = 60
+PAGE_CACHE_MAX_ENTRIES = 1024
+PAGE_CACHE_MAX_BYTES = 64 * 2 ** 20
+PAGE_CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+# Per request profiling (profiling.RequestProfiler): share of requests
+# profiled, 0 disables it, e.g. PROFILE_SAMPLE_RATE=0.01 profiles 1 in 100;
+# statements run this many times in one request are reported as N+1 suspects
+PROFILE_SAMPLE_RATE = env_float('PROFILE_SAMPLE_RATE', 0.0)
+PROFILE_REPEATED_STATEMENTS = env_int('PROFILE_REPEATED_STATEMENTS', 5)
+
+# `datetime` template filter: locale, display timezone (e.g. 'Europe/Paris',
+# None shows times as stored) and number of memoized formatted values
+DATETIME_LOCALE = 'en'
+DATETIME_TIMEZONE = None
+DATETIME_CACHE_SIZE = 4096
@@ -0,0 +1,184 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import has_request_context, jsonify, request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Engine options.
+#----------------------------------------------------------------------------#
+
+# SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings in config.py.
+# The default statement_timeout is a connection option, except behind
+# PgBouncer in transaction pooling mode: it does not accept startup options
+# and hands the server connection to another client after every
+# transaction, so the timeout is set per transaction (SET LOCAL) instead.
+def engine_options(config) -> dict:
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if not config['PGBOUNCER_TRANSACTION_POOLING']:
+        options['connect_args'] = {'options': '-c statement_timeout={:d}'.format(config['DB_STATEMENT_TIMEOUT'])}
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+# URL of the asyncpg (SQLAlchemy async engine) counterpart of a database URL
+def async_url(url, pgbouncer_transaction_pooling: bool = False) -> URL:
+    url = make_url(url).set(drivername='postgresql+asyncpg')
+    if pgbouncer_transaction_pooling:
+        url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+    return url
+
+
+# create_async_engine() options from the same DB_* settings;
+# asyncpg takes the statement_timeout as a server setting, and behind
+# PgBouncer in transaction pooling mode must not cache prepared statements
+def async_engine_options(config) -> dict:
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if config['PGBOUNCER_TRANSACTION_POOLING']:
+        options['connect_args'] = {'statement_cache_size': 0}
+    else:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}}
+    return options
+
+
+# Tunes the engine of a flask_sqlalchemy.SQLAlchemy: pool options,
+# per-route statement timeouts and the /_pool/stats metrics route.
+# Must run before the engine is first used.
+class EngineTuning:
+
+    def __init__(self, db=None, app=None):
+        self.db = db
+        self.route_timeouts = {}
+        self.default_timeout = None
+        self.max_overflow = 0
+        if db is not None and app is not None:
+            self.init_app(db, app)
+
+    def init_app(self, db, app):
+        self.db = db
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+        self.max_overflow = options.get('max_overflow', 0)
+
+        # per transaction timeouts: routes listed in DB_ROUTE_STATEMENT_TIMEOUTS,
+        # and every transaction behind PgBouncer
+        self.route_timeouts = dict(app.config['DB_ROUTE_STATEMENT_TIMEOUTS'])
+        if app.config['PGBOUNCER_TRANSACTION_POOLING']:
+            self.default_timeout = app.config['DB_STATEMENT_TIMEOUT']
+        event.listen(db.session, 'after_begin', self._set_statement_timeout)
+
+        app.add_url_rule('/_pool/stats', 'pool_stats', lambda: jsonify(self.stats()))
+
+    def statement_timeout(self) -> int:
+        if has_request_context() and request.endpoint in self.route_timeouts:
+            return self.route_timeouts[request.endpoint]
+        return self.default_timeout
+
+    def stats(self) -> dict:
+        return pool_metrics.stats(self.db.engine.pool, self.max_overflow)
+
+    def _set_statement_timeout(self, session, transaction, connection):
+        timeout = self.statement_timeout()
+        if timeout is not None:
+            connection.exec_driver_sql('SET LOCAL statement_timeout = {:d}'.format(timeout))
+
+
+#----------------------------------------------------------------------------#
+# Pool metrics.
+#----------------------------------------------------------------------------#
+
+# upper bounds of the checkout wait histogram, in seconds
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+# How long requests wait for a pooled connection and how close the pool is
+# to its limit, to size pool_size, max_overflow and workers from data.
+# Counters are per worker process.
+class PoolMetrics:
+    checkouts: int
+    timeouts: int
+    wait_seconds: float
+    max_wait_seconds: float
+    peak_checked_out: int
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.peak_checked_out = 0
+            self.wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record_checkout(self, wait: float, checked_out: int):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+            self.wait_histogram[bisect_left(WAIT_BUCKETS, wait)] += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    # saturation: connections in use over the most the pool will open
+    # (max_overflow is -1 for no limit, as in create_engine())
+    def stats(self, pool, max_overflow: int) -> dict:
+        capacity = pool.size() + max(max_overflow, 0)
+        checked_out = pool.checkedout()
+
+        with self._lock:
+            return {
+                'pool_size': pool.size(),
+                'max_overflow': max_overflow,
+                'checked_out': checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'saturation': round(checked_out / capacity, 3) if capacity else None,
+                'peak_saturation': round(self.peak_checked_out / capacity, 3) if capacity else None,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_avg': round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'wait_ms_max': round(self.max_wait_seconds * 1000, 3),
+                'wait_histogram_ms': {
+                    ('le_{:g}'.format(bound * 1000) if index < len(WAIT_BUCKETS) else 'inf'): count
+                    for index, (bound, count) in enumerate(zip(WAIT_BUCKETS + (None,), self.wait_histogram))
+                },
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+# QueuePool that times every checkout, including the wait for a connection
+# when all pool_size + max_overflow connections are in use
+class MeteredQueuePool(QueuePool):
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start, self.checkedout())
+        return connection
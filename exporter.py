@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import time
+import zlib
+from datetime import date, datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from models import db
+from queries import export_query
+
+#----------------------------------------------------------------------------#
+# Exports.
+#----------------------------------------------------------------------------#
+
+# Rows stream from a server side cursor in batches and are written as
+# CSV or NDJSON chunks of about CHUNK_SIZE characters, optionally through
+# a streaming gzip compressor, so memory stays flat for any export size.
+
+KINDS = ('shows', 'venues', 'artists')
+FORMATS = ('csv', 'ndjson')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+# (column names, row iterator); the cursor is closed when the rows are
+# exhausted or the iterator is closed, e.g. by a client disconnecting
+def stream_rows(query, batch_size: int = 1000):
+    columns = [column['name'] for column in query.column_descriptions]
+
+    def rows():
+        result = db.session.execute(query.statement, execution_options={'stream_results': True}).yield_per(batch_size)
+        try:
+            yield from result
+        finally:
+            result.close()
+
+    return columns, rows()
+
+
+# timedelta as PostgreSQL writes an interval ('02:00:00', '1 day 02:00:00'),
+# which `flask import` casts back to the same interval
+def interval_text(value: timedelta) -> str:
+    hours, rest = divmod(value.seconds, 3600)
+    text = '{:02}:{:02}:{:02}'.format(hours, rest // 60, rest % 60)
+    if value.microseconds:
+        text += '.{:06}'.format(value.microseconds)
+    if value.days:
+        text = '{} {} {}'.format(value.days, 'day' if value.days == 1 else 'days', text)
+    return text
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ','.join(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return interval_text(value)
+    return value
+
+
+def json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return interval_text(value)
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+# genres are written as "a,b" in CSV, the list format `flask import` reads
+def csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for row in rows:
+        writer.writerow([csv_value(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(columns, rows):
+    encoder = json.JSONEncoder(default=json_value, ensure_ascii=False, separators=(',', ':'))
+    lines = []
+    size = 0
+
+    for row in rows:
+        line = encoder.encode(dict(zip(columns, row)))
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            lines.append('')
+            yield '\n'.join(lines)
+            lines = []
+            size = 0
+
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines)
+
+
+def encode_chunks(chunks):
+    for chunk in chunks:
+        yield chunk.encode()
+
+
+# gzip member written as chunks arrive (wbits=31 adds the gzip header)
+def gzip_chunks(chunks, level: int = 6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# bytes of a whole export
+def export_chunks(kind: str, format: str, compress: bool = False, batch_size: int = 1000, **filters):
+    columns, rows = stream_rows(export_query(kind, **filters), batch_size=batch_size)
+    writer = csv_chunks if format == 'csv' else ndjson_chunks
+    chunks = encode_chunks(writer(columns, rows))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(kind: str, format: str, compress: bool = False) -> str:
+    return '{}.{}{}'.format(kind, format, '.gz' if compress else '')
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.option('--format', 'format', type=click.Choice(FORMATS), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='gzip the output')
+@click.option('--since', type=click.DateTime(), help='shows starting, or venues and artists updated, from this date')
+@click.option('--until', type=click.DateTime(), help='... and before this date')
+@click.option('--city')
+@click.option('--genre')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), help='file to write, default stdout')
+@with_appcontext
+def export_command(kind, format, compress, since, until, city, genre, output):
+    """ Stream venues, artists or shows as CSV or NDJSON. """
+    start = time.perf_counter()
+    written = 0
+
+    target = open(output, 'wb') if output else click.get_binary_stream('stdout')
+    try:
+        for chunk in export_chunks(kind, format, compress, since=since, until=until, city=city, genre=genre):
+            target.write(chunk)
+            written += len(chunk)
+    finally:
+        if output:
+            target.close()
+
+    elapsed = time.perf_counter() - start
+    click.echo('{}: {:,} bytes in {:.1f}s'.format(export_filename(kind, format, compress), written, elapsed), err=True)
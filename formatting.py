@@ -0,0 +1,182 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+import dateutil.parser
+from babel import Locale
+from babel.dates import (
+    DateTimeFormat,
+    UTC,
+    get_date_format,
+    get_datetime_format,
+    get_time_format,
+    get_timezone,
+    parse_pattern
+)
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+# formats the templates ask for by name, other babel names
+# ('short', 'long') and custom patterns are accepted as well
+NAMED_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# Part of the datetime a pattern field's text depends on, by field letter.
+# Those fields are formatted by babel once per key and then looked up;
+# fields not listed here (time zones, week numbers, ...) always go to babel.
+FIELD_KEYS = {
+    'y': lambda value: value.year,
+    'M': lambda value: value.month,
+    'L': lambda value: value.month,
+    'd': lambda value: value.day,
+    'E': lambda value: value.weekday(),
+    'a': lambda value: value.hour >= 12,
+    'h': lambda value: value.hour,
+    'H': lambda value: value.hour,
+    'K': lambda value: value.hour,
+    'k': lambda value: value.hour,
+    'm': lambda value: value.minute,
+    's': lambda value: value.second,
+}
+
+
+# one babel pattern compiled for a locale: the %-template babel builds
+# from the pattern, plus a memo table per field
+class CompiledPattern:
+    __slots__ = ('template', 'fields', 'locale')
+
+    def __init__(self, pattern: str, locale: Locale):
+        self.template = parse_pattern(pattern).format
+        self.locale = locale
+        self.fields = [
+            (name, FIELD_KEYS.get(name[0]), {})
+            for name in dict.fromkeys(re.findall(r'%\((\w+)\)s', self.template))
+        ]
+
+    # value as returned by DateTimeFormatter.localize
+    def __call__(self, value: datetime) -> str:
+        texts = {}
+        for name, key, memo in self.fields:
+            if key is None:
+                texts[name] = DateTimeFormat(value, self.locale)[name]
+                continue
+
+            field_key = key(value)
+            text = memo.get(field_key)
+            if text is None:
+                text = memo[field_key] = DateTimeFormat(value, self.locale)[name]
+            texts[name] = text
+        return self.template % texts
+
+
+# Formats datetimes like babel.dates.format_datetime, compiling each format
+# once per locale and memoizing up to cache_size formatted results.
+# Naive values are UTC when shown in a timezone, as in babel; tzinfo is the
+# default timezone (name or tzinfo), None shows values as they are stored.
+class DateTimeFormatter:
+
+    def __init__(self, locale: str = 'en', tzinfo=None, cache_size: int = 4096):
+        self.configure(locale=locale, tzinfo=tzinfo, cache_size=cache_size)
+
+    def init_app(self, app):
+        self.configure(
+            locale=app.config.get('DATETIME_LOCALE', 'en'),
+            tzinfo=app.config.get('DATETIME_TIMEZONE'),
+            cache_size=app.config.get('DATETIME_CACHE_SIZE', 4096))
+
+    def configure(self, locale: str = 'en', tzinfo=None, cache_size: int = 4096):
+        self.locale = Locale.parse(locale)
+        self.tzinfo = self.timezone(tzinfo)
+        self._patterns = {}
+        self._cached = lru_cache(maxsize=cache_size)(self._format)
+
+    def timezone(self, tzinfo):
+        return get_timezone(tzinfo) if isinstance(tzinfo, str) else tzinfo
+
+    # babel named formats are turned into a single pattern, quoting the literal
+    # text around their date and time parts
+    def pattern(self, format: str) -> str:
+        if format in NAMED_FORMATS:
+            return NAMED_FORMATS[format]
+        if format not in ('full', 'long', 'medium', 'short'):
+            return format
+
+        parts = {
+            '{0}': get_time_format(format, locale=self.locale).pattern,
+            '{1}': get_date_format(format, locale=self.locale).pattern,
+        }
+        glue = get_datetime_format(format, locale=self.locale).replace("'", '')
+        return ''.join(
+            parts.get(piece) or "'{}'".format(piece)
+            for piece in re.split(r'(\{[01]\})', glue) if piece)
+
+    def compile(self, format: str = 'medium') -> CompiledPattern:
+        compiled = self._patterns.get(format)
+        if compiled is None:
+            compiled = self._patterns[format] = CompiledPattern(self.pattern(format), self.locale)
+        return compiled
+
+    # value in tzinfo, or in the default timezone; naive values stay naive
+    # without a timezone, DateTimeFormat reads them as UTC like babel does
+    def localize(self, value, tzinfo=None) -> datetime:
+        if isinstance(value, str):
+            value = dateutil.parser.parse(value)
+
+        tzinfo = self.timezone(tzinfo) or self.tzinfo
+        if tzinfo is None:
+            return value
+
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=UTC)
+        value = value.astimezone(tzinfo)
+        if hasattr(tzinfo, 'normalize'):
+            value = tzinfo.normalize(value)
+        return value
+
+    # Memoized per value and its tzinfo: aware datetimes of the same instant
+    # compare equal, but shown as they are stored their texts differ.
+    def format(self, value, format: str = 'medium', tzinfo=None) -> str:
+        return self._cached(*self.key(value), format, tzinfo)
+
+    def _format(self, value, zone, format: str, tzinfo) -> str:
+        return self.compile(format)(self.localize(value, tzinfo))
+
+    # cache key of a value, for format() and format_many()
+    def key(self, value) -> tuple:
+        zone = (value.tzinfo, value.utcoffset()) if isinstance(value, datetime) else None
+        return value, zone
+
+    # all values of a listing in one pass, bypassing the result cache
+    # so a long listing does not evict it; repeated values are formatted once
+    def format_many(self, values, format: str = 'medium', tzinfo=None) -> list[str]:
+        compiled = self.compile(format)
+        texts = {}
+        formatted = []
+        for value in values:
+            key = self.key(value)
+            text = texts.get(key)
+            if text is None:
+                text = texts[key] = compiled(self.localize(value, tzinfo))
+            formatted.append(text)
+        return formatted
+
+    # (item, formatted item.<attribute>) for items that may be streamed,
+    # formatted by format_many() batch_size items at a time
+    def format_items(self, items, attribute: str, format: str = 'medium', tzinfo=None, batch_size: int = 20):
+        items = iter(items)
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                return
+            texts = self.format_many([getattr(item, attribute) for item in batch], format, tzinfo)
+            yield from zip(batch, texts)
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+datetime_formatter = DateTimeFormatter()
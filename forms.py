@@ -6,10 +6,17 @@ from wtforms import (
     SelectField,
     SelectMultipleField,
     DateTimeField,
+    DateField,
     BooleanField,
+    IntegerField,
+    FileField,
     )
+from wtforms.widgets import HiddenInput
 from wtforms.validators import (
     DataRequired,
+    InputRequired,
+    NumberRange,
+    Optional,
     URL,
     Regexp
     )
@@ -115,17 +122,58 @@ genre_choices = [
     ]
 
 class ShowForm(Form):
-    artist_id = StringField(
-        'artist_id'
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired()]
     )
-    venue_id = StringField(
-        'venue_id'
+    venue_id = IntegerField(
+        'venue_id', validators=[DataRequired()]
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # minutes
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
+
+# a series of shows: either every `interval` days, weeks or months from
+# start_time to until, or the slots of an uploaded CSV file
+class ScheduleForm(Form):
+    artist_id = IntegerField(
+        'artist_id', validators=[DataRequired()]
+    )
+    venue_id = IntegerField(
+        'venue_id', validators=[DataRequired()]
+    )
+    # minutes, for every show unless the file gives one
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
+    start_time = DateTimeField(
+        'start_time', validators=[Optional()]
+    )
+    frequency = SelectField(
+        'frequency',
+        choices=[('weekly', 'Every week'), ('daily', 'Every day'), ('monthly', 'Every month')],
+        default='weekly'
+    )
+    interval = IntegerField(
+        'interval',
+        validators=[DataRequired(), NumberRange(min=1, max=52)],
+        default=1
+    )
+    until = DateField(
+        'until', validators=[Optional()]
+    )
+    slots = FileField(
+        'slots'
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -208,3 +256,18 @@ class ArtistForm(Form):
             'seeking_description'
      )
 
+
+# the version of the venue or artist an edit form was filled from,
+# see queries.update_entity()
+class VersionedForm:
+    version = IntegerField(
+        'version', validators=[InputRequired()], widget=HiddenInput()
+    )
+
+
+class EditVenueForm(VersionedForm, VenueForm):
+    pass
+
+
+class EditArtistForm(VersionedForm, ArtistForm):
+    pass
@@ -0,0 +1,509 @@
+import csv
+import gzip
+import hashlib
+import os
+import time
+import click
+from flask.cli import with_appcontext
+from models import db
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# A file is COPYed as it is into an UNLOGGED staging table, then validated
+# and upserted set by set in chunks of rows; each chunk commits together
+# with the job's progress, so a failed import resumes after the last
+# committed chunk. Jobs, staging tables and rejected rows live in their own
+# schema, out of the way of the application tables and their migrations.
+
+SCHEMA = 'fyyur_import'
+
+# regular expressions checked before a text value is cast
+INTEGER = r'^\s*\d{1,9}\s*$'
+BOOLEAN = r'^\s*(true|false|t|f|yes|no|y|n|1|0)?\s*$'
+TRUE = r'^\s*(true|t|yes|y|1)\s*$'
+
+
+class ImportKind:
+    __slots__ = ('name', 'table', 'columns', 'booleans', 'ignored')
+
+    name: str
+    table: str
+    columns: tuple
+    booleans: tuple
+    ignored: tuple
+
+    def __init__(self, name: str, table: str, columns: tuple, booleans: tuple = (), ignored: tuple = ()):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.booleans = booleans
+        self.ignored = ignored
+
+
+# columns a file may have, CSV headers or JSON keys; shows reference their
+# venue and artist by id or by (case-insensitive, unique) name. Ignored
+# columns are the ones `flask export` adds for readers, so an export
+# loads back as it is.
+KINDS = {
+    'venues': ImportKind(
+        'venues', 'Venue',
+        ('id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+         'website_link', 'genres', 'seeking_talent', 'seeking_description'),
+        booleans=('seeking_talent',)),
+    'artists': ImportKind(
+        'artists', 'Artist',
+        ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link',
+         'website_link', 'seeking_venue', 'seeking_description'),
+        booleans=('seeking_venue',)),
+    'shows': ImportKind(
+        'shows', 'show',
+        ('id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'start_time', 'duration'),
+        ignored=('venue_city', 'venue_state', 'artist_genres')),
+}
+
+SETUP_SQL = '''
+    CREATE SCHEMA IF NOT EXISTS {schema};
+
+    CREATE TABLE IF NOT EXISTS {schema}.job (
+        id text PRIMARY KEY,
+        kind text NOT NULL,
+        path text NOT NULL,
+        staged_rows bigint,
+        next_line bigint NOT NULL DEFAULT 1,
+        inserted bigint NOT NULL DEFAULT 0,
+        updated bigint NOT NULL DEFAULT 0,
+        rejected bigint NOT NULL DEFAULT 0,
+        started_at timestamptz NOT NULL DEFAULT now(),
+        finished_at timestamptz
+    );
+
+    CREATE TABLE IF NOT EXISTS {schema}.reject (
+        job_id text NOT NULL REFERENCES {schema}.job ON DELETE CASCADE,
+        line bigint NOT NULL,
+        error text NOT NULL,
+        PRIMARY KEY (job_id, line)
+    );
+
+    -- STABLE, not IMMUTABLE: how text casts to timestamp depends on DateStyle
+    CREATE OR REPLACE FUNCTION {schema}.is_timestamp(value text) RETURNS boolean
+    LANGUAGE plpgsql STABLE AS $$
+    BEGIN
+        PERFORM value::timestamp;
+        RETURN true;
+    EXCEPTION WHEN others THEN
+        RETURN false;
+    END $$;
+
+    CREATE OR REPLACE FUNCTION {schema}.is_interval(value text) RETURNS boolean
+    LANGUAGE plpgsql STABLE AS $$
+    BEGIN
+        PERFORM value::interval;
+        RETURN true;
+    EXCEPTION WHEN others THEN
+        RETURN false;
+    END $$;
+'''
+
+
+# the same file (path, size and modification time) resumes the same job
+def job_id(kind: ImportKind, path: str) -> str:
+    stat = os.stat(path)
+    fingerprint = '{}:{}:{}:{}'.format(kind.name, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+
+
+def file_format(path: str) -> str:
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise click.BadParameter('expected a .csv, .jsonl or .ndjson file, optionally gzipped', param_hint='PATH')
+
+
+def open_file(path: str):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def rate(rows: int, seconds: float) -> str:
+    return '{:,.0f} rows/s'.format(rows / seconds) if seconds > 0 else '-'
+
+
+class Importer:
+
+    def __init__(self, connection, kind: ImportKind, path: str, chunk_size: int = 100000, echo=click.echo):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.kind = kind
+        self.path = path
+        self.format = file_format(path)
+        self.chunk_size = chunk_size
+        self.echo = echo
+        self.job = job_id(kind, path)
+        self.staging = '{}.stage_{}'.format(SCHEMA, self.job)
+        self.started = None
+        self.processed = 0
+
+    def execute(self, sql: str, parameters=None):
+        self.cursor.execute(sql, parameters)
+        return self.cursor
+
+    def run(self, restart: bool = False):
+        self.started = time.perf_counter()
+        self.execute(SETUP_SQL.format(schema=SCHEMA))
+        if restart:
+            self.execute('DELETE FROM {}.job WHERE id = %(job)s'.format(SCHEMA), {'job': self.job})
+            self.execute('DROP TABLE IF EXISTS {}'.format(self.staging))
+        self.execute('''
+            INSERT INTO {}.job (id, kind, path) VALUES (%(job)s, %(kind)s, %(path)s)
+            ON CONFLICT (id) DO NOTHING
+        '''.format(SCHEMA), {'job': self.job, 'kind': self.kind.name, 'path': os.path.abspath(self.path)})
+        self.connection.commit()
+
+        job = self.load_job()
+        if job['finished_at'] is not None:
+            self.echo('{} was already imported (job {}), use --restart to import it again'.format(self.path, self.job))
+            return
+
+        if not self.is_staged(job):
+            self.stage()
+            job = self.load_job()
+        if job['next_line'] > 1:
+            self.echo('resuming job {} at row {:,} of {:,}'.format(self.job, job['next_line'], job['staged_rows']))
+
+        self.upsert(job)
+        self.finish()
+
+    def load_job(self) -> dict:
+        cursor = self.execute('SELECT * FROM {}.job WHERE id = %(job)s'.format(SCHEMA), {'job': self.job})
+        return dict(zip([column.name for column in cursor.description], cursor.fetchone()))
+
+    # UNLOGGED tables are emptied by a server crash, so their rows are recounted
+    def is_staged(self, job: dict) -> bool:
+        if job['staged_rows'] is None:
+            return False
+        exists = self.execute('SELECT to_regclass(%(staging)s) IS NOT NULL', {'staging': self.staging}).fetchone()[0]
+        if not exists:
+            return False
+        return self.execute('SELECT count(*) FROM {}'.format(self.staging)).fetchone()[0] == job['staged_rows']
+
+    #  Staging
+    #  ----------------------------------------------------------------
+
+    def stage(self):
+        start = time.perf_counter()
+        self.execute('DROP TABLE IF EXISTS {}'.format(self.staging))
+
+        with open_file(self.path) as source:
+            if self.format == 'csv':
+                self.copy_csv(source)
+            else:
+                self.copy_jsonl(source)
+
+        staged = self.execute('SELECT count(*) FROM {}'.format(self.staging)).fetchone()[0]
+        self.execute('ANALYZE {}'.format(self.staging))
+        # the same file stages into the same line numbers, so a job whose staging
+        # table was lost keeps its progress
+        self.execute('UPDATE {}.job SET staged_rows = %(staged)s WHERE id = %(job)s'.format(SCHEMA), {'staged': staged, 'job': self.job})
+        self.connection.commit()
+
+        elapsed = time.perf_counter() - start
+        self.echo('staged {:,} rows in {:.1f}s ({})'.format(staged, elapsed, rate(staged, elapsed)))
+
+    # text columns named after the CSV header, filled by COPY in file order
+    def copy_csv(self, source):
+        header = source.readline().decode('utf-8-sig')
+        columns = [column.strip().lower() for column in next(csv.reader([header]))]
+        staged = self.kind.columns + self.kind.ignored
+        unknown = set(columns) - set(staged)
+        if unknown:
+            raise click.ClickException('unknown {} columns: {}'.format(self.kind.name, ', '.join(sorted(unknown))))
+
+        self.execute('''
+            CREATE UNLOGGED TABLE {} (line bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY, {})
+        '''.format(self.staging, ', '.join('{} text'.format(column) for column in staged)))
+        self.cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT csv, ENCODING 'UTF8')".format(self.staging, ', '.join(columns)),
+            source)
+
+    # one jsonb document per line: CSV with quote and delimiter characters
+    # that cannot appear unescaped in JSON keeps every line a single field
+    def copy_jsonl(self, source):
+        self.execute('''
+            CREATE UNLOGGED TABLE {} (line bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY, doc jsonb)
+        '''.format(self.staging))
+        self.cursor.copy_expert(
+            "COPY {} (doc) FROM STDIN WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02', ENCODING 'UTF8')".format(self.staging),
+            source)
+
+    # staged column as text, whichever the file format
+    def text(self, column: str) -> str:
+        if self.format == 'csv':
+            return 'NULLIF(btrim(s.{0}), \'\')'.format(column)
+        if column == 'genres':
+            return '''CASE jsonb_typeof(s.doc->'genres')
+                WHEN 'array' THEN array_to_string(ARRAY(SELECT jsonb_array_elements_text(s.doc->'genres')), ',')
+                ELSE s.doc->>'genres' END'''
+        return 'NULLIF(btrim(s.doc->>\'{0}\'), \'\')'.format(column)
+
+    #  Validation and upsert
+    #  ----------------------------------------------------------------
+
+    # name, SQL type and varchar length of the target table's columns
+    def target_columns(self) -> dict:
+        rows = self.execute('''
+            SELECT attname, format_type(atttypid, atttypmod),
+                CASE WHEN atttypid = 'varchar'::regtype AND atttypmod > 0 THEN atttypmod - 4 END
+            FROM pg_attribute
+            WHERE attrelid = %(table)s::regclass AND attnum > 0 AND NOT attisdropped
+        ''', {'table': '"{}"'.format(self.kind.table)}).fetchall()
+        return {name: (sql_type, max_length) for name, sql_type, max_length in rows}
+
+    def upsert(self, job: dict):
+        sql = self.shows_sql() if self.kind.name == 'shows' else self.entities_sql()
+        if self.kind.name == 'shows':
+            self.resolve_names()
+        self.reserve_ids()
+
+        first = job['next_line']
+        total = job['staged_rows']
+        start = time.perf_counter()
+
+        while first <= total:
+            last = first + self.chunk_size
+            rejected, inserted, updated = self.execute(sql, {
+                'job': self.job, 'first': first, 'last': last,
+                'integer': INTEGER, 'boolean': BOOLEAN, 'true': TRUE,
+            }).fetchone()
+            self.execute('''
+                UPDATE {}.job
+                SET next_line = %(last)s, inserted = inserted + %(inserted)s,
+                    updated = updated + %(updated)s, rejected = rejected + %(rejected)s
+                WHERE id = %(job)s
+            '''.format(SCHEMA), {'job': self.job, 'last': last, 'inserted': inserted, 'updated': updated, 'rejected': rejected})
+            self.connection.commit()
+
+            self.processed = min(last, total + 1) - job['next_line']
+            elapsed = time.perf_counter() - start
+            self.echo('  {:>12,} / {:,} rows  {}'.format(min(last - 1, total), total, rate(self.processed, elapsed)))
+            first = last
+
+    # ids the sequence hands out must not collide with ids given in the file
+    def reserve_ids(self):
+        id_column = 's.id' if self.format == 'csv' else "s.doc->>'id'"
+        self.execute('''
+            SELECT setval(sequence, highest)
+            FROM (
+                SELECT pg_get_serial_sequence(%(table)s, 'id') AS sequence, GREATEST(
+                    (SELECT max(id) FROM "{0}"),
+                    (SELECT max(btrim({1})::int) FROM {2} s WHERE {1} ~ %(integer)s)) AS highest
+            ) ids
+            WHERE highest > pg_sequence_last_value(sequence::regclass) OR
+                (highest IS NOT NULL AND pg_sequence_last_value(sequence::regclass) IS NULL)
+        '''.format(self.kind.table, id_column, self.staging), {'table': '"{}"'.format(self.kind.table), 'integer': INTEGER})
+        self.connection.commit()
+
+    # shared head of the chunk statement: staged rows of the chunk as text,
+    # and each id kept only on its last line
+    def source_sql(self) -> str:
+        return '''
+            source AS (
+                SELECT s.line, {columns}
+                FROM {staging} s
+                WHERE s.line >= %(first)s AND s.line < %(last)s
+            ),
+            ranked AS (
+                SELECT *, CASE WHEN id IS NULL THEN 1 ELSE row_number() OVER (PARTITION BY id ORDER BY line DESC) END AS id_rank
+                FROM source
+            )
+        '''.format(
+            columns=', '.join('{} AS {}'.format(self.text(column), column) for column in self.kind.columns),
+            staging=self.staging)
+
+    # length checks for varchar targets, on the text a value would be stored as
+    # (an explicit cast to varchar(n) would silently truncate it)
+    def length_checks(self, measured: dict, targets: dict) -> list:
+        checks = []
+        for column, text in measured.items():
+            max_length = targets[column][1]
+            if max_length is not None:
+                checks.append("WHEN length({}) > {} THEN '{} is longer than {} characters'".format(text, max_length, column, max_length))
+        return checks
+
+    def entities_sql(self) -> str:
+        targets = self.target_columns()
+        values = {}
+        measured = {}
+        for column in self.kind.columns:
+            if column == 'id':
+                continue
+            if column in self.kind.booleans:
+                values[column] = 'COALESCE({} ~* %(true)s, false)'.format(column)
+            elif column == 'genres':
+                genres = '''ARRAY(
+                    SELECT btrim(genre, ' "') FROM unnest(regexp_split_to_array(btrim(genres, ' {}'), '[,;]')) AS genre
+                    WHERE btrim(genre, ' "') <> '')'''
+                values[column] = 'CASE WHEN genres IS NOT NULL THEN CAST({} AS {}) END'.format(genres, targets['genres'][0])
+                measured[column] = '({})::text'.format(genres)
+            else:
+                values[column] = measured[column] = column
+
+        checks = [
+            "WHEN id_rank > 1 THEN 'id is repeated on a later line'",
+            "WHEN id IS NOT NULL AND id !~ %(integer)s THEN 'id is not an integer'",
+            "WHEN name IS NULL THEN 'name is required'",
+        ]
+        checks += ["WHEN {0} !~* %(boolean)s THEN '{0} is not a boolean'".format(column) for column in self.kind.booleans]
+        checks += self.length_checks(measured, targets)
+
+        return self.chunk_sql(values, checks)
+
+    # venue and artist names that identify exactly one row, looked up in bulk
+    def resolve_names(self):
+        for table in ('Venue', 'Artist'):
+            name = 'import_{}_names'.format(table.lower())
+            self.execute('''
+                DROP TABLE IF EXISTS {0};
+                CREATE TEMP TABLE {0} AS
+                    SELECT lower(btrim(name)) AS key, min(id) AS id, count(*) AS matches
+                    FROM "{1}" WHERE name IS NOT NULL GROUP BY 1;
+                ALTER TABLE {0} ADD PRIMARY KEY (key);
+                ANALYZE {0};
+            '''.format(name, table))
+        self.connection.commit()
+
+    def shows_sql(self) -> str:
+        resolve = '''
+            resolved AS (
+                SELECT r.*,
+                    COALESCE(venue.id, venue_name.id) AS venue_ref, venue_name.matches AS venue_matches,
+                    COALESCE(artist.id, artist_name.id) AS artist_ref, artist_name.matches AS artist_matches
+                FROM ranked r
+                LEFT JOIN "Venue" venue
+                    ON venue.id = CASE WHEN r.venue_id ~ %(integer)s THEN btrim(r.venue_id)::int END
+                LEFT JOIN import_venue_names venue_name
+                    ON r.venue_id IS NULL AND venue_name.key = lower(r.venue_name)
+                LEFT JOIN "Artist" artist
+                    ON artist.id = CASE WHEN r.artist_id ~ %(integer)s THEN btrim(r.artist_id)::int END
+                LEFT JOIN import_artist_names artist_name
+                    ON r.artist_id IS NULL AND artist_name.key = lower(r.artist_name)
+            )
+        '''
+        values = {
+            'venue_id': 'venue_ref',
+            'artist_id': 'artist_ref',
+            'start_time': 'start_time::timestamp',
+            # the default of show.duration (migration 4f2d8e61c0a7)
+            'duration': "COALESCE(duration::interval, interval '2 hours')",
+        }
+        checks = [
+            "WHEN id_rank > 1 THEN 'id is repeated on a later line'",
+            "WHEN id IS NOT NULL AND id !~ %(integer)s THEN 'id is not an integer'",
+            "WHEN venue_id IS NULL AND venue_name IS NULL THEN 'venue_id or venue_name is required'",
+            "WHEN venue_matches > 1 THEN 'venue_name matches more than one venue'",
+            "WHEN venue_ref IS NULL THEN 'venue not found'",
+            "WHEN artist_id IS NULL AND artist_name IS NULL THEN 'artist_id or artist_name is required'",
+            "WHEN artist_matches > 1 THEN 'artist_name matches more than one artist'",
+            "WHEN artist_ref IS NULL THEN 'artist not found'",
+            "WHEN start_time IS NULL THEN 'start_time is required'",
+            "WHEN NOT {}.is_timestamp(start_time) THEN 'start_time is not a timestamp'".format(SCHEMA),
+            "WHEN duration IS NOT NULL AND NOT {}.is_interval(duration) THEN 'duration is not an interval'".format(SCHEMA),
+            "WHEN duration::interval <= interval '0' THEN 'duration is not positive'",
+        ]
+        return self.chunk_sql(values, checks, resolve=resolve, checked_from='resolved')
+
+    # One statement per chunk: rejects rows that fail a check, updates the
+    # others by id and inserts the rest (rows without an id get the next
+    # one), and returns (rejected, inserted, updated) counts. Not an
+    # ON CONFLICT (id) upsert: show is partitioned, its ids are unique
+    # through the sequence but have no unique index of their own.
+    def chunk_sql(self, values: dict, checks: list, resolve: str = None, checked_from: str = 'ranked') -> str:
+        columns = ['id'] + list(values)
+        return '''
+            WITH {source}, {resolve}
+            checked AS (
+                SELECT *, CASE {checks} END AS error FROM {checked_from}
+            ),
+            rejected AS (
+                INSERT INTO {schema}.reject (job_id, line, error)
+                SELECT %(job)s, line, error FROM checked WHERE error IS NOT NULL
+                ON CONFLICT DO NOTHING
+                RETURNING 1
+            ),
+            accepted AS (
+                SELECT line, COALESCE(btrim(id)::int, nextval(pg_get_serial_sequence('"{table}"', 'id'))) AS id, {aliased}
+                FROM checked WHERE error IS NULL
+            ),
+            updated AS (
+                UPDATE "{table}" AS target SET {updates}
+                FROM accepted WHERE target.id = accepted.id
+                RETURNING target.id
+            ),
+            inserted AS (
+                INSERT INTO "{table}" ({columns})
+                SELECT {columns} FROM accepted
+                WHERE id NOT IN (SELECT id FROM updated)
+                ORDER BY line
+                RETURNING 1
+            )
+            SELECT
+                (SELECT count(*) FROM rejected),
+                (SELECT count(*) FROM inserted),
+                (SELECT count(*) FROM updated)
+        '''.format(
+            source=self.source_sql(),
+            resolve=(resolve + ',') if resolve else '',
+            checks=' '.join(checks),
+            checked_from=checked_from,
+            schema=SCHEMA,
+            table=self.kind.table,
+            columns=', '.join(columns),
+            aliased=', '.join('{} AS {}'.format(value, column) for column, value in values.items()),
+            updates=', '.join('{0} = accepted.{0}'.format(column) for column in values))
+
+    #  Finish
+    #  ----------------------------------------------------------------
+
+    def finish(self):
+        job = self.load_job()
+        self.execute('ANALYZE "{}"'.format(self.kind.table))
+        self.execute('DROP TABLE IF EXISTS {}'.format(self.staging))
+        self.execute('UPDATE {}.job SET finished_at = now() WHERE id = %(job)s'.format(SCHEMA), {'job': self.job})
+        self.connection.commit()
+
+        # rate of this run, a resumed job only processes what was left
+        elapsed = time.perf_counter() - self.started
+        self.echo('{}: {:,} inserted, {:,} updated, {:,} rejected in {:.1f}s ({})'.format(
+            self.kind.name, job['inserted'], job['updated'], job['rejected'], elapsed, rate(self.processed, elapsed)))
+
+        if job['rejected']:
+            rejects = self.execute('''
+                SELECT line, error FROM {}.reject WHERE job_id = %(job)s ORDER BY line LIMIT 10
+            '''.format(SCHEMA), {'job': self.job}).fetchall()
+            for line, error in rejects:
+                self.echo('  row {:,}: {}'.format(line, error))
+            self.echo('  all rejected rows: SELECT * FROM {}.reject WHERE job_id = \'{}\''.format(SCHEMA, self.job))
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=100000, show_default=True, help='rows validated and upserted per transaction')
+@click.option('--restart', is_flag=True, help='import the file again from the start')
+@with_appcontext
+def import_command(kind, path, chunk_size, restart):
+    """ Bulk load venues, artists or shows from a CSV or JSON lines file
+    (.csv, .jsonl, .ndjson, optionally .gz). Run it again after a failure
+    to resume where it stopped. Connects to the primary database directly,
+    not through PgBouncer.
+    """
+    # long COPYs and chunks run without the application's statement timeout,
+    # the connection is discarded afterwards
+    connection = db.engine.raw_connection()
+    try:
+        connection.cursor().execute('SET statement_timeout = 0')
+        Importer(connection, KINDS[kind], path, chunk_size=chunk_size).run(restart=restart)
+    finally:
+        connection.invalidate()
@@ -1,6 +1,7 @@
 from __future__ import with_statement
 
 import logging
+import re
 from logging.config import fileConfig
 
 from flask import current_app
@@ -26,6 +27,27 @@ config.set_main_option(
         '%', '%%'))
 target_metadata = current_app.extensions['migrate'].db.metadata
 
+# the partitions of show (show_p202605, show_p2023, show_default, attached
+# or detached) are created by partitions.py, and the GiST and trigram
+# expression indexes by hand-written migrations; none of them is in the
+# models, so autogenerate must not drop them
+SHOW_PARTITION = re.compile(r'^show_(p\d{4}(\d{2})?|default)$')
+HAND_WRITTEN_INDEXES = {
+    'ix_venue_search_document',
+    'ix_artist_search_document',
+    'ix_show_venue_during',
+    'ix_show_artist_during',
+}
+
+
+def include_name(name, type_, parent_names):
+    if type_ == 'table':
+        return not SHOW_PARTITION.match(name)
+    if type_ == 'index':
+        return name not in HAND_WRITTEN_INDEXES
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -46,7 +68,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        include_name=include_name
     )
 
     with context.begin_transaction():
@@ -74,15 +97,25 @@ def run_migrations_online():
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
+        # index builds and backfills may run longer than the application's
+        # statement_timeout; migrations connect to PostgreSQL, not PgBouncer.
+        # The connection is discarded afterwards instead of being pooled
+        # without a timeout.
+        connection.exec_driver_sql('SET statement_timeout = 0')
+
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_name=include_name,
             **current_app.extensions['migrate'].configure_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            connection.invalidate()
 
 
 if context.is_offline_mode():
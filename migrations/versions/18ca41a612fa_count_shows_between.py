@@ -0,0 +1,47 @@
+"""count shows between
+
+Revision ID: 18ca41a612fa
+Revises: 390c90d5062f
+Create Date: 2026-10-19 11:26:40.118502
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '18ca41a612fa'
+down_revision = '390c90d5062f'
+branch_labels = None
+depends_on = None
+
+
+# shows of a venue (or, without one, of an artist) that start after
+# after_time and at or before until_time. Readers of a show statistics row
+# count the shows that started since the row was counted on the show
+# index; when the row is too old for the bounded subquery they use
+# (queries.STATS_MOVE_WINDOW), they call this instead. Being plpgsql, it
+# is planned per call with its own bounds, on the partitions they cover,
+# and not inlined into a plan that would cost every partition for every row.
+def upgrade():
+    op.execute('''
+        CREATE FUNCTION fyyur_count_shows_between(venue integer, artist integer, after_time timestamp, until_time timestamp)
+        RETURNS bigint
+        LANGUAGE plpgsql STABLE AS $$
+        BEGIN
+            IF venue IS NOT NULL THEN
+                RETURN (
+                    SELECT count(*) FROM show
+                    WHERE venue_id = venue AND start_time > after_time AND start_time <= until_time
+                );
+            END IF;
+            RETURN (
+                SELECT count(*) FROM show
+                WHERE artist_id = artist AND start_time > after_time AND start_time <= until_time
+            );
+        END $$;
+    ''')
+
+
+def downgrade():
+    op.execute('DROP FUNCTION fyyur_count_shows_between(integer, integer, timestamp, timestamp);')
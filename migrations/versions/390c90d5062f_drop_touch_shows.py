@@ -0,0 +1,51 @@
+"""drop touch shows
+
+Revision ID: 390c90d5062f
+Revises: a9ce067fd7a0
+Create Date: 2026-10-19 10:41:08.902537
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '390c90d5062f'
+down_revision = 'a9ce067fd7a0'
+branch_labels = None
+depends_on = None
+
+
+# (entity table, show column)
+TABLES = [
+    ('Venue', 'venue_id'),
+    ('Artist', 'artist_id'),
+]
+
+
+# Renaming a venue or an artist, or changing its image, no longer updates
+# all its shows: page validators read the updated_at of the artists and
+# venues on the page instead (queries.page_validator).
+def upgrade():
+    for table, _ in TABLES:
+        op.execute('DROP TRIGGER touch_shows ON "{}";'.format(table))
+    op.execute('DROP FUNCTION fyyur_touch_shows();')
+
+
+# as in migration cb5278f2eb5a
+def downgrade():
+    op.execute('''
+        CREATE FUNCTION fyyur_touch_shows() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            EXECUTE format('UPDATE show SET updated_at = now() WHERE %I = $1', TG_ARGV[0]) USING NEW.id;
+            RETURN NULL;
+        END $$;
+    ''')
+    for table, foreign_key in TABLES:
+        op.execute('''
+            CREATE TRIGGER touch_shows AFTER UPDATE OF name, image_link ON "{0}"
+            FOR EACH ROW
+            WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.image_link IS DISTINCT FROM NEW.image_link)
+            EXECUTE FUNCTION fyyur_touch_shows('{1}');
+        '''.format(table, foreign_key))
@@ -0,0 +1,42 @@
+"""show duration
+
+Revision ID: 4f2d8e61c0a7
+Revises: bb4ff3c4ddfb
+Create Date: 2026-10-18 19:26:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2d8e61c0a7'
+down_revision = 'bb4ff3c4ddfb'
+branch_labels = None
+depends_on = None
+
+
+# queries.show_during() must build the exact same range expression,
+# otherwise the planner can not match it against these indexes;
+# btree_gist lets the integer key share a GiST index with the range.
+# Indexes rather than exclusion constraints: shows already booked on top
+# of each other stay valid, the booking form checks new ones
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist;')
+    op.add_column('show', sa.Column('duration', sa.Interval(), server_default=sa.text("interval '2 hours'"), nullable=False))
+    op.create_check_constraint('ck_show_duration', 'show', "duration > interval '0'")
+    op.execute('''
+        CREATE INDEX ix_show_venue_during ON show
+        USING gist (venue_id, tsrange(start_time, start_time + duration));
+    ''')
+    op.execute('''
+        CREATE INDEX ix_show_artist_during ON show
+        USING gist (artist_id, tsrange(start_time, start_time + duration));
+    ''')
+
+
+def downgrade():
+    op.execute('DROP INDEX ix_show_artist_during;')
+    op.execute('DROP INDEX ix_show_venue_during;')
+    op.drop_constraint('ck_show_duration', 'show', type_='check')
+    op.drop_column('show', 'duration')
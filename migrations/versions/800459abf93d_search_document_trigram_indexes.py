@@ -0,0 +1,45 @@
+"""search document trigram indexes
+
+Revision ID: 800459abf93d
+Revises: 5166beaa6de6
+Create Date: 2026-10-18 09:12:41.503217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '800459abf93d'
+down_revision = '5166beaa6de6'
+branch_labels = None
+depends_on = None
+
+
+# queries.search_document() must build the exact same expression,
+# otherwise the planner can not match it against these indexes.
+# The indexes are built CONCURRENTLY, which can not run inside a
+# transaction block, so writes to Venue and Artist go on meanwhile
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    op.execute('''
+        CREATE FUNCTION fyyur_search_document(VARIADIC parts text[]) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT lower(array_to_string(parts, ' ')) $$;
+    ''')
+    with op.get_context().autocommit_block():
+        op.execute('''
+            CREATE INDEX CONCURRENTLY ix_venue_search_document ON "Venue"
+            USING gin (fyyur_search_document(name, city, state, genres::text) gin_trgm_ops);
+        ''')
+        op.execute('''
+            CREATE INDEX CONCURRENTLY ix_artist_search_document ON "Artist"
+            USING gin (fyyur_search_document(name, city, state, genres::text) gin_trgm_ops);
+        ''')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY ix_artist_search_document;')
+        op.execute('DROP INDEX CONCURRENTLY ix_venue_search_document;')
+    op.execute('DROP FUNCTION fyyur_search_document(VARIADIC text[]);')
@@ -0,0 +1,163 @@
+"""partition show by month
+
+Revision ID: 9c3e5a7d21f4
+Revises: 4f2d8e61c0a7
+Create Date: 2026-10-18 21:04:52.381925
+
+"""
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3e5a7d21f4'
+down_revision = '4f2d8e61c0a7'
+branch_labels = None
+depends_on = None
+
+
+# partitions.py keeps the same layout: a partition per month ahead of now,
+# shows of years that ended a year ago merged into one partition per year,
+# and show_default for anything outside them
+MONTHS_AHEAD = 12
+KEEP_MONTHS = 12
+
+COLUMNS = 'id, venue_id, artist_id, start_time, updated_at, duration'
+
+INDEXES = [
+    'CREATE INDEX ix_show_start_time_id ON show (start_time, id)',
+    'CREATE INDEX ix_show_venue_id_start_time ON show (venue_id, start_time, id)',
+    'CREATE INDEX ix_show_artist_id_start_time ON show (artist_id, start_time, id)',
+    'CREATE INDEX ix_show_venue_during ON show USING gist (venue_id, tsrange(start_time, start_time + duration))',
+    'CREATE INDEX ix_show_artist_during ON show USING gist (artist_id, tsrange(start_time, start_time + duration))',
+]
+
+TRIGGERS = [
+    '''CREATE TRIGGER touch_updated_at BEFORE UPDATE ON show
+       FOR EACH ROW EXECUTE FUNCTION fyyur_touch_updated_at()''',
+    '''CREATE TRIGGER count_insert_shows AFTER INSERT ON show
+       REFERENCING NEW TABLE AS new_shows
+       FOR EACH STATEMENT EXECUTE FUNCTION fyyur_count_insert_shows()''',
+    '''CREATE TRIGGER count_delete_shows AFTER DELETE ON show
+       REFERENCING OLD TABLE AS old_shows
+       FOR EACH STATEMENT EXECUTE FUNCTION fyyur_count_delete_shows()''',
+    '''CREATE TRIGGER count_update_shows AFTER UPDATE ON show
+       REFERENCING OLD TABLE AS old_shows NEW TABLE AS new_shows
+       FOR EACH STATEMENT EXECUTE FUNCTION fyyur_count_update_shows()''',
+]
+
+
+def add_months(day: date, months: int) -> date:
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+# (name, from, to) of the partitions for shows starting from `first`
+def partition_ranges(first: date, today: date) -> list:
+    this_month = today.replace(day=1)
+    monthly_from = date(add_months(this_month, -KEEP_MONTHS).year, 1, 1)
+    monthly_to = add_months(this_month, MONTHS_AHEAD + 1)
+
+    ranges = [
+        ('show_p{}'.format(year), date(year, 1, 1), date(year + 1, 1, 1))
+        for year in range(min(first, monthly_from).year, monthly_from.year)
+    ]
+    month = monthly_from
+    while month < monthly_to:
+        ranges.append(('show_p{:%Y%m}'.format(month), month, add_months(month, 1)))
+        month = add_months(month, 1)
+    return ranges
+
+
+# Builds a partitioned show table beside the old one, copies the shows
+# and swaps them. Shows keep their ids; the primary key becomes
+# (id, start_time) since a partitioned table's keys include the partition key.
+def upgrade():
+    connection = op.get_bind()
+
+    op.execute('ALTER TABLE show RENAME TO show_unpartitioned')
+    op.execute('ALTER TABLE show_unpartitioned RENAME CONSTRAINT show_pkey TO show_unpartitioned_pkey')
+    op.execute('''
+        CREATE TABLE show (
+            id integer NOT NULL DEFAULT nextval('show_id_seq'),
+            venue_id integer NOT NULL,
+            artist_id integer NOT NULL,
+            start_time timestamp without time zone NOT NULL,
+            updated_at timestamp with time zone NOT NULL DEFAULT now(),
+            duration interval NOT NULL DEFAULT interval '2 hours',
+            CONSTRAINT show_pkey PRIMARY KEY (id, start_time),
+            CONSTRAINT show_venue_id_fkey FOREIGN KEY (venue_id) REFERENCES "Venue" (id),
+            CONSTRAINT show_artist_id_fkey FOREIGN KEY (artist_id) REFERENCES "Artist" (id),
+            CONSTRAINT ck_show_duration CHECK (duration > interval '0')
+        ) PARTITION BY RANGE (start_time);
+    ''')
+    op.execute('CREATE TABLE show_default PARTITION OF show DEFAULT;')
+
+    # a new partition takes the shows of its range out of show_default,
+    # which would otherwise refuse it; the bounds are checked before
+    # attaching so ATTACH does not scan the new partition again
+    op.execute('''
+        CREATE FUNCTION fyyur_create_show_partition(name text, lower timestamp, upper timestamp) RETURNS bigint
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            moved bigint;
+        BEGIN
+            EXECUTE format('CREATE TABLE %I (LIKE show INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', name);
+            EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (start_time >= %L AND start_time < %L)',
+                           name, name || '_bounds', lower, upper);
+            EXECUTE format('WITH moved AS (DELETE FROM show_default WHERE start_time >= %L AND start_time < %L RETURNING *)
+                            INSERT INTO %I SELECT * FROM moved', lower, upper, name);
+            GET DIAGNOSTICS moved = ROW_COUNT;
+            EXECUTE format('ALTER TABLE show ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', name, lower, upper);
+            EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', name, name || '_bounds');
+            RETURN moved;
+        END $$;
+    ''')
+
+    first = connection.execute(sa.text('SELECT min(start_time)::date FROM show_unpartitioned')).scalar()
+    today = connection.execute(sa.text('SELECT current_date')).scalar()
+    for name, lower, upper in partition_ranges(first or today, today):
+        connection.execute(
+            sa.text('SELECT fyyur_create_show_partition(:name, :lower, :upper)'),
+            {'name': name, 'lower': lower, 'upper': upper})
+
+    # before the triggers: show_stats already counts these shows
+    op.execute('INSERT INTO show ({0}) SELECT {0} FROM show_unpartitioned'.format(COLUMNS))
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+    op.execute('DROP TABLE show_unpartitioned')
+
+    for index in INDEXES:
+        op.execute(index)
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    op.execute('ANALYZE show')
+
+
+def downgrade():
+    op.execute('ALTER TABLE show RENAME TO show_partitioned')
+    op.execute('ALTER TABLE show_partitioned RENAME CONSTRAINT show_pkey TO show_partitioned_pkey')
+    op.execute('''
+        CREATE TABLE show (
+            id integer NOT NULL DEFAULT nextval('show_id_seq'),
+            venue_id integer NOT NULL,
+            artist_id integer NOT NULL,
+            start_time timestamp without time zone NOT NULL,
+            updated_at timestamp with time zone NOT NULL DEFAULT now(),
+            duration interval NOT NULL DEFAULT interval '2 hours',
+            CONSTRAINT show_pkey PRIMARY KEY (id),
+            CONSTRAINT show_venue_id_fkey FOREIGN KEY (venue_id) REFERENCES "Venue" (id),
+            CONSTRAINT show_artist_id_fkey FOREIGN KEY (artist_id) REFERENCES "Artist" (id),
+            CONSTRAINT ck_show_duration CHECK (duration > interval '0')
+        );
+    ''')
+    op.execute('INSERT INTO show ({0}) SELECT {0} FROM show_partitioned'.format(COLUMNS))
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+    op.execute('DROP TABLE show_partitioned')
+    op.execute('DROP FUNCTION fyyur_create_show_partition(text, timestamp, timestamp)')
+
+    for index in INDEXES:
+        op.execute(index)
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    op.execute('ANALYZE show')
@@ -0,0 +1,28 @@
+"""show start_time id index
+
+Revision ID: a089d8f617f5
+Revises: 800459abf93d
+Create Date: 2026-10-18 11:03:27.884120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a089d8f617f5'
+down_revision = '800459abf93d'
+branch_labels = None
+depends_on = None
+
+
+# keyset order of /shows, scanned forwards for upcoming and backwards for past;
+# CONCURRENTLY can not run inside a transaction block
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_show_start_time_id', table_name='show', postgresql_concurrently=True)
@@ -0,0 +1,98 @@
+"""show stats changed at
+
+Revision ID: a9ce067fd7a0
+Revises: d81f3a6c2b97
+Create Date: 2026-10-19 10:04:51.276113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9ce067fd7a0'
+down_revision = 'd81f3a6c2b97'
+branch_labels = None
+depends_on = None
+
+
+# (stats table, show column)
+STATS = [
+    ('venue_show_stats', 'venue_id'),
+    ('artist_show_stats', 'artist_id'),
+]
+
+# as in migration bb4ff3c4ddfb
+CHANGES = {
+    'INSERT': 'SELECT venue_id, artist_id, start_time, 1 AS sign FROM new_shows',
+    'DELETE': 'SELECT venue_id, artist_id, start_time, -1 AS sign FROM old_shows',
+    'UPDATE': '''
+        SELECT n.venue_id, n.artist_id, n.start_time, 1 AS sign
+        FROM new_shows n JOIN old_shows o USING (id)
+        WHERE (n.venue_id, n.artist_id, n.start_time) IS DISTINCT FROM (o.venue_id, o.artist_id, o.start_time)
+        UNION ALL
+        SELECT o.venue_id, o.artist_id, o.start_time, -1 AS sign
+        FROM new_shows n JOIN old_shows o USING (id)
+        WHERE (n.venue_id, n.artist_id, n.start_time) IS DISTINCT FROM (o.venue_id, o.artist_id, o.start_time)
+    ''',
+}
+
+# COUNT_CHANGES of migration bb4ff3c4ddfb, {changed} sets shows_changed_at
+COUNT_CHANGES = '''
+    INSERT INTO {stats} ({key}, counted_at)
+    SELECT DISTINCT {key}, localtimestamp FROM ({changes}) changes WHERE sign > 0
+    ORDER BY {key}
+    ON CONFLICT DO NOTHING;
+
+    PERFORM 1 FROM {stats}
+    WHERE {key} IN (SELECT {key} FROM ({changes}) changes)
+    ORDER BY {key}
+    FOR UPDATE;
+
+    UPDATE {stats} AS stats SET
+        {changed}
+        past_count = stats.past_count + delta.past,
+        upcoming_count = stats.upcoming_count + delta.upcoming,
+        next_show_time = (
+            SELECT min(show.start_time) FROM show
+            WHERE show.{key} = stats.{key} AND show.start_time > stats.counted_at
+        )
+    FROM (
+        SELECT
+            changes.{key},
+            coalesce(sum(changes.sign) FILTER (WHERE changes.start_time <= counted.counted_at), 0) AS past,
+            coalesce(sum(changes.sign) FILTER (WHERE changes.start_time > counted.counted_at), 0) AS upcoming
+        FROM ({changes}) changes
+        JOIN {stats} counted ON counted.{key} = changes.{key}
+        GROUP BY changes.{key}
+    ) delta
+    WHERE stats.{key} = delta.{key};
+'''
+
+
+def count_functions(changed: str):
+    for event, changes in CHANGES.items():
+        body = ''.join(COUNT_CHANGES.format(stats=stats, key=key, changes=changes, changed=changed) for stats, key in STATS)
+        op.execute('''
+            CREATE OR REPLACE FUNCTION fyyur_count_{0}_shows() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                {1}
+                RETURN NULL;
+            END $$;
+        '''.format(event.lower(), body))
+
+
+# shows_changed_at is when a show of the entity was last added, removed,
+# moved or given another venue or artist, so venue and artist pages can
+# be validated from their statistics row instead of their shows
+def upgrade():
+    for stats, _ in STATS:
+        op.add_column(stats, sa.Column('shows_changed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    count_functions(changed='shows_changed_at = now(),')
+
+
+def downgrade():
+    count_functions(changed='')
+    for stats, _ in reversed(STATS):
+        op.drop_column(stats, 'shows_changed_at')
@@ -0,0 +1,144 @@
+"""show stats
+
+Revision ID: bb4ff3c4ddfb
+Revises: cb5278f2eb5a
+Create Date: 2026-10-18 17:02:11.148305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bb4ff3c4ddfb'
+down_revision = 'cb5278f2eb5a'
+branch_labels = None
+depends_on = None
+
+
+# (stats table, entity table, show column)
+STATS = [
+    ('venue_show_stats', 'Venue', 'venue_id'),
+    ('artist_show_stats', 'Artist', 'artist_id'),
+]
+
+# (venue_id, artist_id, start_time, sign) of the shows a statement added
+# (+1) and removed (-1), read from its transition tables
+CHANGES = {
+    'INSERT': 'SELECT venue_id, artist_id, start_time, 1 AS sign FROM new_shows',
+    'DELETE': 'SELECT venue_id, artist_id, start_time, -1 AS sign FROM old_shows',
+    'UPDATE': '''
+        SELECT n.venue_id, n.artist_id, n.start_time, 1 AS sign
+        FROM new_shows n JOIN old_shows o USING (id)
+        WHERE (n.venue_id, n.artist_id, n.start_time) IS DISTINCT FROM (o.venue_id, o.artist_id, o.start_time)
+        UNION ALL
+        SELECT o.venue_id, o.artist_id, o.start_time, -1 AS sign
+        FROM new_shows n JOIN old_shows o USING (id)
+        WHERE (n.venue_id, n.artist_id, n.start_time) IS DISTINCT FROM (o.venue_id, o.artist_id, o.start_time)
+    ''',
+}
+
+# Adds a statement's changes to the rows of one stats table, split at each
+# row's counted_at. Rows are locked before they are read, in id order, and
+# the update runs as a later statement so its snapshot holds every change
+# committed by whoever had the lock before.
+# Shows being added create their entity's row; removals only update rows,
+# since their venue or artist may be gone.
+COUNT_CHANGES = '''
+    INSERT INTO {stats} ({key}, counted_at)
+    SELECT DISTINCT {key}, localtimestamp FROM ({changes}) changes WHERE sign > 0
+    ORDER BY {key}
+    ON CONFLICT DO NOTHING;
+
+    PERFORM 1 FROM {stats}
+    WHERE {key} IN (SELECT {key} FROM ({changes}) changes)
+    ORDER BY {key}
+    FOR UPDATE;
+
+    UPDATE {stats} AS stats SET
+        past_count = stats.past_count + delta.past,
+        upcoming_count = stats.upcoming_count + delta.upcoming,
+        next_show_time = (
+            SELECT min(show.start_time) FROM show
+            WHERE show.{key} = stats.{key} AND show.start_time > stats.counted_at
+        )
+    FROM (
+        SELECT
+            changes.{key},
+            coalesce(sum(changes.sign) FILTER (WHERE changes.start_time <= counted.counted_at), 0) AS past,
+            coalesce(sum(changes.sign) FILTER (WHERE changes.start_time > counted.counted_at), 0) AS upcoming
+        FROM ({changes}) changes
+        JOIN {stats} counted ON counted.{key} = changes.{key}
+        GROUP BY changes.{key}
+    ) delta
+    WHERE stats.{key} = delta.{key};
+'''
+
+# every entity with shows, counted now; `flask stats refresh --all` runs the same
+COUNT_ALL = '''
+    INSERT INTO {stats} ({key}, counted_at, past_count, upcoming_count, next_show_time)
+    SELECT
+        {key},
+        localtimestamp,
+        count(*) FILTER (WHERE start_time <= localtimestamp),
+        count(*) FILTER (WHERE start_time > localtimestamp),
+        min(start_time) FILTER (WHERE start_time > localtimestamp)
+    FROM show
+    GROUP BY {key}
+'''
+
+
+# Statement level triggers with transition tables: a bulk insert or
+# `flask import` chunk updates each entity's row once, not once per show.
+# Transition tables can not be combined with a column list, so updates of
+# other columns (updated_at) fire the trigger and are filtered out in CHANGES.
+def upgrade():
+    for stats, entity, key in STATS:
+        op.create_table(stats,
+            sa.Column(key, sa.Integer(), nullable=False),
+            sa.Column('counted_at', sa.DateTime(), nullable=False),
+            sa.Column('past_count', sa.Integer(), server_default='0', nullable=False),
+            sa.Column('upcoming_count', sa.Integer(), server_default='0', nullable=False),
+            sa.Column('next_show_time', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint([key], ['{}.id'.format(entity)], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(key)
+        )
+        op.create_index(op.f('ix_{}_next_show_time'.format(stats)), stats, ['next_show_time'], unique=False)
+        op.execute(COUNT_ALL.format(stats=stats, key=key))
+
+    for event, changes in CHANGES.items():
+        body = ''.join(COUNT_CHANGES.format(stats=stats, key=key, changes=changes) for stats, _, key in STATS)
+        op.execute('''
+            CREATE FUNCTION fyyur_count_{0}_shows() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                {1}
+                RETURN NULL;
+            END $$;
+        '''.format(event.lower(), body))
+
+    op.execute('''
+        CREATE TRIGGER count_insert_shows AFTER INSERT ON show
+        REFERENCING NEW TABLE AS new_shows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_count_insert_shows();
+    ''')
+    op.execute('''
+        CREATE TRIGGER count_delete_shows AFTER DELETE ON show
+        REFERENCING OLD TABLE AS old_shows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_count_delete_shows();
+    ''')
+    op.execute('''
+        CREATE TRIGGER count_update_shows AFTER UPDATE ON show
+        REFERENCING OLD TABLE AS old_shows NEW TABLE AS new_shows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_count_update_shows();
+    ''')
+
+
+def downgrade():
+    for event in reversed(list(CHANGES)):
+        op.execute('DROP TRIGGER count_{0}_shows ON show;'.format(event.lower()))
+        op.execute('DROP FUNCTION fyyur_count_{0}_shows();'.format(event.lower()))
+
+    for stats, _, _ in reversed(STATS):
+        op.drop_index(op.f('ix_{}_next_show_time'.format(stats)), table_name=stats)
+        op.drop_table(stats)
@@ -0,0 +1,70 @@
+"""row versions
+
+Revision ID: cb5278f2eb5a
+Revises: e0a0d375e862
+Create Date: 2026-10-18 15:26:52.731904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cb5278f2eb5a'
+down_revision = 'e0a0d375e862'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['Venue', 'Artist', 'show']
+
+
+# updated_at is kept by triggers, so bulk SQL writes bump it as well as the ORM.
+# A show tile renders its artist's and venue's name and image, so changing
+# those touches the shows that display them.
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+    op.execute('''
+        CREATE FUNCTION fyyur_touch_updated_at() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.updated_at = now();
+            RETURN NEW;
+        END $$;
+    ''')
+    for table in TABLES:
+        op.execute('''
+            CREATE TRIGGER touch_updated_at BEFORE UPDATE ON "{0}"
+            FOR EACH ROW EXECUTE FUNCTION fyyur_touch_updated_at();
+        '''.format(table))
+
+    op.execute('''
+        CREATE FUNCTION fyyur_touch_shows() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            EXECUTE format('UPDATE show SET updated_at = now() WHERE %I = $1', TG_ARGV[0]) USING NEW.id;
+            RETURN NULL;
+        END $$;
+    ''')
+    for table, foreign_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute('''
+            CREATE TRIGGER touch_shows AFTER UPDATE OF name, image_link ON "{0}"
+            FOR EACH ROW
+            WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.image_link IS DISTINCT FROM NEW.image_link)
+            EXECUTE FUNCTION fyyur_touch_shows('{1}');
+        '''.format(table, foreign_key))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.execute('DROP TRIGGER touch_shows ON "{}";'.format(table))
+    op.execute('DROP FUNCTION fyyur_touch_shows();')
+
+    for table in TABLES:
+        op.execute('DROP TRIGGER touch_updated_at ON "{}";'.format(table))
+    op.execute('DROP FUNCTION fyyur_touch_updated_at();')
+
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
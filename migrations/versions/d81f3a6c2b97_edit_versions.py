@@ -0,0 +1,51 @@
+"""edit versions
+
+Revision ID: d81f3a6c2b97
+Revises: 9c3e5a7d21f4
+Create Date: 2026-10-18 23:12:37.508341
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f3a6c2b97'
+down_revision = '9c3e5a7d21f4'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['Venue', 'Artist']
+
+
+# version counts the updates of a row. An edit form carries the version it
+# was filled from and only updates a row still at that version. The
+# version is bumped by a trigger, as updated_at is, so an import or a
+# manual UPDATE also makes older forms stale.
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+
+    op.execute('''
+        CREATE FUNCTION fyyur_bump_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.version = OLD.version + 1;
+            RETURN NEW;
+        END $$;
+    ''')
+    for table in TABLES:
+        op.execute('''
+            CREATE TRIGGER bump_version BEFORE UPDATE ON "{0}"
+            FOR EACH ROW EXECUTE FUNCTION fyyur_bump_version();
+        '''.format(table))
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute('DROP TRIGGER bump_version ON "{}";'.format(table))
+    op.execute('DROP FUNCTION fyyur_bump_version();')
+
+    for table in reversed(TABLES):
+        op.drop_column(table, 'version')
@@ -0,0 +1,90 @@
+"""show access path indexes
+
+Revision ID: e0a0d375e862
+Revises: a089d8f617f5
+Create Date: 2026-10-18 13:41:09.216448
+
+"""
+import json
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e0a0d375e862'
+down_revision = 'a089d8f617f5'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    # venue page tiles (ORDER BY start_time, id) and upcoming counts per venue
+    ('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time', 'id']),
+    # artist page tiles and upcoming counts per artist
+    ('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time', 'id']),
+]
+
+# main statement shape of each view -> index it must be able to use
+PLAN_CHECKS = [
+    ('show_venue tiles',
+     'SELECT id FROM show WHERE venue_id = 1 ORDER BY start_time, id',
+     'ix_show_venue_id_start_time'),
+    ('show_artist tiles',
+     'SELECT id FROM show WHERE artist_id = 1 ORDER BY start_time, id',
+     'ix_show_artist_id_start_time'),
+    ('search_venues upcoming count',
+     'SELECT count(id) FROM show WHERE venue_id = 1 AND start_time > now()',
+     'ix_show_venue_id_start_time'),
+    ('search_artists upcoming count',
+     'SELECT count(id) FROM show WHERE artist_id = 1 AND start_time > now()',
+     'ix_show_artist_id_start_time'),
+    ('shows upcoming page',
+     'SELECT id FROM show WHERE start_time >= now() ORDER BY start_time, id LIMIT 61',
+     'ix_show_start_time_id'),
+    ('search_venues matches',
+     '''SELECT id FROM "Venue" WHERE fyyur_search_document(name, city, state, genres::text) LIKE '%hop%' ''',
+     'ix_venue_search_document'),
+    ('search_artists matches',
+     '''SELECT id FROM "Artist" WHERE fyyur_search_document(name, city, state, genres::text) LIKE '%hop%' ''',
+     'ix_artist_search_document'),
+]
+
+
+def plan_indexes(plan) -> set:
+    names = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        names |= plan_indexes(child)
+    return names
+
+
+# Small or empty tables are planned as sequential scans, so sequential
+# scans are disabled for the check: it proves each shape can use its
+# index, not that the planner prefers it for the current row counts.
+def check_plans():
+    connection = op.get_bind()
+    connection.execute(sa.text('SET LOCAL enable_seqscan = off'))
+
+    for view, statement, index in PLAN_CHECKS:
+        plan = connection.execute(sa.text('EXPLAIN (FORMAT JSON) ' + statement)).scalar()
+        plan = plan if isinstance(plan, list) else json.loads(plan)
+        used = plan_indexes(plan[0]['Plan'])
+        if index not in used:
+            raise RuntimeError('{} does not use {}, plan uses {}'.format(view, index, sorted(used) or 'no index'))
+
+    connection.execute(sa.text('RESET enable_seqscan'))
+
+
+# CONCURRENTLY can not run inside a transaction block
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+    if not context.is_offline_mode():
+        check_plans()
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -1,7 +1,8 @@
-from flask_sqlalchemy import SQLAlchemy
+from replicas import RoutingSQLAlchemy
 from datetime import datetime
+from itertools import groupby
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -22,7 +23,11 @@ class Venue(db.Model):
     genres = db.Column(db.ARRAY(db.String(24)))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship('Show', back_populates='venues', lazy='joined')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now(), server_onupdate=db.FetchedValue())
+    # bumped on every update by the bump_version trigger (migration
+    # d81f3a6c2b97); edit forms only update the version they were filled from
+    version = db.Column(db.Integer, nullable=False, server_default=db.text('1'), server_onupdate=db.FetchedValue())
+    shows = db.relationship('Show', back_populates='venues', lazy=True)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -40,67 +45,140 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship('Show', back_populates='artists', lazy='joined')
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now(), server_onupdate=db.FetchedValue())
+    # bumped on every update by the bump_version trigger (migration
+    # d81f3a6c2b97); edit forms only update the version they were filled from
+    version = db.Column(db.Integer, nullable=False, server_default=db.text('1'), server_onupdate=db.FetchedValue())
+    shows = db.relationship('Show', back_populates='artists', lazy=True)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+# Partitioned by month of start_time (migration 9c3e5a7d21f4, partitions.py),
+# so the primary key includes start_time; ids alone stay unique through
+# their sequence.
 class Show(db.Model):
-   id = db.Column(db.Integer, primary_key=True)
+   __table_args__ = (
+      db.Index('ix_show_start_time_id', 'start_time', 'id'),
+      db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time', 'id'),
+      db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time', 'id'),
+      db.CheckConstraint("duration > interval '0'", name='ck_show_duration'),
+      {'postgresql_partition_by': 'RANGE (start_time)'},
+   )
+
+   id = db.Column(db.Integer, primary_key=True, autoincrement=True)
    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
    artists = db.relationship('Artist', back_populates='shows', lazy=True)
    venues = db.relationship('Venue', back_populates='shows', lazy=True)
-   start_time = db.Column(db.DateTime, nullable=False)
+   start_time = db.Column(db.DateTime, primary_key=True)
+   # the show occupies its venue and artist over [start_time, start_time +
+   # duration), see queries.show_during(); ix_show_venue_during and
+   # ix_show_artist_during (migration 4f2d8e61c0a7) index that range
+   duration = db.Column(db.Interval, nullable=False, server_default=db.text("interval '2 hours'"))
+   # kept current by the touch_updated_at triggers (migration cb5278f2eb5a)
+   updated_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now(), server_onupdate=db.FetchedValue())
+
+# Show counts per venue and per artist, kept by the count_show_changes
+# triggers (migration bb4ff3c4ddfb) and by `flask stats refresh`.
+# Counts split the entity's shows at counted_at: past_count started by
+# then, upcoming_count after; next_show_time is the first show after
+# counted_at, so the counts still hold at any time before it.
+# shows_changed_at is the last time one of its shows was added, removed or
+# moved (migration a9ce067fd7a0), for page validators.
+# An entity without shows has no row.
+class VenueShowStats(db.Model):
+   __tablename__ = 'venue_show_stats'
+
+   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+   counted_at = db.Column(db.DateTime, nullable=False)
+   past_count = db.Column(db.Integer, nullable=False, default=0)
+   upcoming_count = db.Column(db.Integer, nullable=False, default=0)
+   next_show_time = db.Column(db.DateTime, index=True)
+   shows_changed_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+class ArtistShowStats(db.Model):
+   __tablename__ = 'artist_show_stats'
+
+   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+   counted_at = db.Column(db.DateTime, nullable=False)
+   past_count = db.Column(db.Integer, nullable=False, default=0)
+   upcoming_count = db.Column(db.Integer, nullable=False, default=0)
+   next_show_time = db.Column(db.DateTime, index=True)
+   shows_changed_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+#----------------------------------------------------------------------------#
+# View models.
+#----------------------------------------------------------------------------#
+
+# View models are filled from column-only rows (queries.py) and never
+# hold ORM instances, so a rendered page does not keep the session's
+# identity map alive.
 
 class ShowUI:
+    __slots__ = (
+        'id',
+        'start_time',
+        'artist_id',
+        'artist_name',
+        'artist_image_link',
+        'venue_id',
+        'venue_name',
+        'venue_image_link',
+        )
 
     id : int
-    venue_id : str
-    artist_id : str
-    artists : str
+    start_time : datetime
+    artist_id : int
+    artist_name : str
     artist_image_link: str
-    venues: str
+    venue_id : int
     venue_name : str
     venue_image_link: str
-    start_time : str
 
-    def __init__(self, show: Show):
-
-        self.id = show.id
-        self.venue_id = show.venue_id
-        self.artist_id = show.artist_id
-        self.artists = show.artists
-        self.artist_name = show.artists.name
-        self.artist_image_link = show.artists.image_link
-        self.venues = show.venues
-        self.venue_name = show.venues.name
-        self.venue_image_link = show.venues.image_link
-        self.start_time = show.start_time
+    # row: a queries.show_tiles() row
+    def __init__(self, row):
+        self.id = row.id
+        self.start_time = row.start_time
+        self.artist_id = row.artist_id
+        self.artist_name = row.artist_name
+        self.artist_image_link = row.artist_image_link
+        self.venue_id = row.venue_id
+        self.venue_name = row.venue_name
+        self.venue_image_link = row.venue_image_link
 
 
 class MapperShowUI:
-    _shows : list[Show]
-
-    def __init__(self, shows):
-        self._shows = shows
-
-    def past_upcoming_shows(self) -> (list[ShowUI], list[ShowUI]) :
-
-        past_shows, upcoming_shows = [], []
+    _rows : list
 
-        for show in self._shows:
-            (past_shows if show.start_time < datetime.now() else upcoming_shows).append(show)
-
-        past_shows = map(lambda show: ShowUI(show), past_shows)   
-        upcoming_shows = map(lambda show: ShowUI(show), upcoming_shows)
-        return (past_shows, upcoming_shows)
+    def __init__(self, rows):
+        self._rows = rows
 
     def shows(self) -> list[ShowUI]:
-        return map(lambda show: ShowUI(show), self._shows)
+        return [ShowUI(row) for row in self._rows]
 
 
 class ArtistUI:
+    __slots__ = (
+        'id',
+        'name',
+        'city',
+        'state',
+        'phone',
+        'image_link',
+        'facebook_link',
+        'website',
+        'seeking_venue',
+        'seeking_description',
+        'genres',
+        'past_shows',
+        'upcoming_shows',
+        'past_shows_count',
+        'upcoming_shows_count',
+        'past_shows_cursor',
+        'upcoming_shows_cursor',
+        )
+
     id: int
     name : str
     city : str
@@ -116,13 +194,18 @@ class ArtistUI:
     upcoming_shows : list[ShowUI]
     past_shows_count: int
     upcoming_shows_count: int
+    past_shows_cursor: str
+    upcoming_shows_cursor: str
 
-    def __init__(self, artist_data: Artist):
+    # artist_data: row of Artist columns with past_shows_count and
+    # upcoming_shows_count, past_shows / upcoming_shows: the first
+    # KeysetPage of each (queries.entity_show_page())
+    def __init__(self, artist_data, past_shows, upcoming_shows):
 
-        (past_shows, upcoming_shows) = MapperShowUI(shows=artist_data.shows).past_upcoming_shows()
-
-        past_shows = list(map(ShowUI, past_shows))
-        upcoming_shows = list(map(ShowUI, upcoming_shows))
+        self.past_shows = MapperShowUI(rows=past_shows).shows()
+        self.past_shows_cursor = past_shows.next_cursor
+        self.upcoming_shows = MapperShowUI(rows=upcoming_shows).shows()
+        self.upcoming_shows_cursor = upcoming_shows.next_cursor
 
         self.id = artist_data.id
         self.name = artist_data.name
@@ -135,13 +218,31 @@ class ArtistUI:
         self.website = artist_data.website_link
         self.seeking_venue = artist_data.seeking_venue
         self.seeking_description = artist_data.seeking_description
-        self.past_shows = past_shows
-        self.past_shows_count = len(past_shows)
-        self.upcoming_shows = upcoming_shows
-        self.upcoming_shows_count = len(upcoming_shows)
+        self.past_shows_count = artist_data.past_shows_count
+        self.upcoming_shows_count = artist_data.upcoming_shows_count
 
 
 class VenueUI():
+    __slots__ = (
+        'id',
+        'name',
+        'city',
+        'state',
+        'address',
+        'phone',
+        'image_link',
+        'facebook_link',
+        'website',
+        'genres',
+        'seeking_talent',
+        'seeking_description',
+        'past_shows',
+        'upcoming_shows',
+        'past_shows_count',
+        'upcoming_shows_count',
+        'past_shows_cursor',
+        'upcoming_shows_cursor',
+        )
 
     id : int
     name : str
@@ -159,13 +260,18 @@ class VenueUI():
     upcoming_shows : list [ShowUI]
     past_shows_count: int
     upcoming_shows_count: int
+    past_shows_cursor: str
+    upcoming_shows_cursor: str
 
-    def __init__(self, venue_data: Venue):
-
-        (past_shows, upcoming_shows) = MapperShowUI(shows=venue_data.shows).past_upcoming_shows()
+    # venue_data: row of Venue columns with past_shows_count and
+    # upcoming_shows_count, past_shows / upcoming_shows: the first
+    # KeysetPage of each (queries.entity_show_page())
+    def __init__(self, venue_data, past_shows, upcoming_shows):
 
-        past_shows = list(map(ShowUI, past_shows))
-        upcoming_shows = list(map(ShowUI, upcoming_shows))
+        self.past_shows = MapperShowUI(rows=past_shows).shows()
+        self.past_shows_cursor = past_shows.next_cursor
+        self.upcoming_shows = MapperShowUI(rows=upcoming_shows).shows()
+        self.upcoming_shows_cursor = upcoming_shows.next_cursor
 
         self.id = venue_data.id
         self.name = venue_data.name
@@ -179,25 +285,56 @@ class VenueUI():
         self.website = venue_data.website_link
         self.seeking_talent = venue_data.seeking_talent
         self.seeking_description = venue_data.seeking_description
-        self.past_shows = past_shows
-        self.past_shows_count = len(past_shows)
-        self.upcoming_shows = upcoming_shows
-        self.upcoming_shows_count = len(upcoming_shows)
+        self.past_shows_count = venue_data.past_shows_count
+        self.upcoming_shows_count = venue_data.upcoming_shows_count
+
+
+class AreaVenueUI():
+    __slots__ = ('id', 'name', 'num_upcoming_shows')
+
+    id: int
+    name: str
+    num_upcoming_shows: int
+
+    def __init__(self, id, name, num_upcoming_shows):
+        self.id = id
+        self.name = name
+        self.num_upcoming_shows = num_upcoming_shows
 
 
 class AreaUI():
+    __slots__ = ('city', 'state', 'venues')
 
     city: str
     state: str
-    venues : list[VenueUI]
+    venues : list[AreaVenueUI]
 
-    def __init__(self, city: str, state: str, venues: list[Venue]):
+    def __init__(self, city: str, state: str, venues: list[AreaVenueUI]):
         self.city = city
         self.state = state
-        self.venues = map(lambda data: VenueUI(venue_data=data), venues)
+        self.venues = venues
+
+
+# takes rows of (city, state, id, name, num_upcoming_shows)
+# ordered by area, returns one AreaUI per (city, state)
+class MapperAreaUI:
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def areas(self) -> list[AreaUI]:
+        areas = []
+
+        for (city, state), rows in groupby(self._rows, key=lambda row: (row.city, row.state)):
+            venues = [AreaVenueUI(id=row.id, name=row.name, num_upcoming_shows=row.num_upcoming_shows) for row in rows]
+            areas.append(AreaUI(city=city, state=state, venues=venues))
+
+        return areas
 
 
 class SearchData():
+    __slots__ = ('id', 'name', 'num_upcoming_shows')
+
     id: int
     name: str
     num_upcoming_shows: int
@@ -209,9 +346,11 @@ class SearchData():
 
 
 class SearchUI():
+    __slots__ = ('count', 'data')
+
     count: int
-    data: list[VenueUI]
+    data: list[SearchData]
 
     def __init__(self, count, data):
         self.count = count
-        self.data = data
\ No newline at end of file
+        self.data = data
@@ -0,0 +1,78 @@
+import base64
+from datetime import datetime
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# opaque, url safe cursor for a (start_time, id) position
+def encode_cursor(start_time: datetime, id: int) -> str:
+    raw = '{}|{}'.format(start_time.isoformat(), id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> (datetime, int):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_time, id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(start_time), int(id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+# opaque cursor for a single integer position: the last id of an id keyset,
+# or the offset of the next page of ranked search results
+def encode_position(position: int) -> str:
+    return base64.urlsafe_b64encode(str(position).encode()).decode().rstrip('=')
+
+
+def decode_position(cursor: str) -> int:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+    if position < 0:
+        raise InvalidCursor(cursor)
+    return position
+
+
+# Iterates rows once, as they stream from the database. rows may hold
+# one extra look-ahead row (query per_page + 1) that is never yielded,
+# a Result is closed afterwards so its server side cursor is released.
+# next_cursor is known after iterating, which is also when a
+# streamed template reaches its pager.
+# cursor builds it from the last row, (start_time, id) by default.
+class KeysetPage:
+    per_page: int
+
+    def __init__(self, rows, per_page: int, cursor=None):
+        self._rows = rows
+        self._last = None
+        self._more = False
+        self._cursor = cursor or (lambda row: encode_cursor(row.start_time, row.id))
+        self.per_page = per_page
+
+    def __iter__(self):
+        count = 0
+        try:
+            for row in self._rows:
+                if count == self.per_page:
+                    self._more = True
+                    break
+                count += 1
+                self._last = row
+                yield row
+        finally:
+            if hasattr(self._rows, 'close'):
+                self._rows.close()
+
+    @property
+    def next_cursor(self) -> str:
+        if not self._more:
+            return None
+        return self._cursor(self._last)
@@ -0,0 +1,224 @@
+import re
+from datetime import date, datetime
+import click
+from flask.cli import with_appcontext
+from models import db
+from show_stats import refresh_all
+
+#----------------------------------------------------------------------------#
+# Show partitions.
+#----------------------------------------------------------------------------#
+
+# show is partitioned by start_time (migration 9c3e5a7d21f4): one partition
+# per month (show_p202605), one per year for years long past (show_p2023),
+# and show_default for shows outside all of them. Queries bounded on
+# start_time, such as the past / upcoming split, only read the partitions
+# in their range. `flask partitions create`, run monthly, keeps partitions
+# ready MONTHS_AHEAD months ahead; `flask partitions archive` merges the
+# months of past years into a single partition each, so the number of
+# partitions stays small while every show stays in `show`.
+
+MONTHS_AHEAD = 12
+KEEP_MONTHS = 12
+
+# pg_get_expr() of a range partition's bound
+BOUNDS = re.compile(r"FOR VALUES FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+PARTITIONS = '''
+    SELECT child.relname AS name, pg_get_expr(child.relpartbound, child.oid) AS bound,
+           greatest(child.reltuples, 0)::bigint AS rows
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'show'::regclass
+'''
+
+
+class Partition:
+    __slots__ = ('name', 'lower', 'upper', 'rows')
+
+    name: str
+    lower: datetime
+    upper: datetime
+    rows: int
+
+    def __init__(self, name: str, lower: datetime, upper: datetime, rows: int):
+        self.name = name
+        self.lower = lower
+        self.upper = upper
+        self.rows = rows
+
+    def months(self) -> int:
+        return (self.upper.year - self.lower.year) * 12 + self.upper.month - self.lower.month
+
+
+def add_months(day: date, months: int) -> date:
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+# range partitions in start_time order, without show_default
+def show_partitions(session) -> list:
+    partitions = []
+    for row in session.execute(PARTITIONS):
+        bounds = BOUNDS.match(row.bound)
+        if bounds is not None:
+            lower, upper = (datetime.fromisoformat(value) for value in bounds.groups())
+            partitions.append(Partition(row.name, lower, upper, row.rows))
+    return sorted(partitions, key=lambda partition: partition.lower)
+
+
+def covered(partitions: list, lower: datetime, upper: datetime) -> bool:
+    return any(partition.lower < upper and lower < partition.upper for partition in partitions)
+
+
+# creates the missing monthly partitions from this month to `months_ahead`
+# months ahead, moving their shows out of show_default; returns
+# [(partition, shows moved)]
+def create_partitions(session, months_ahead: int = MONTHS_AHEAD, today: date = None) -> list:
+    month = (today or date.today()).replace(day=1)
+    partitions = show_partitions(session)
+    created = []
+
+    for _ in range(months_ahead + 1):
+        lower, upper = datetime.combine(month, datetime.min.time()), datetime.combine(add_months(month, 1), datetime.min.time())
+        if not covered(partitions, lower, upper):
+            name = 'show_p{:%Y%m}'.format(month)
+            moved = session.execute(
+                'SELECT fyyur_create_show_partition(:name, :lower, :upper)',
+                {'name': name, 'lower': lower, 'upper': upper}).scalar()
+            created.append((name, moved))
+        month = add_months(month, 1)
+
+    session.commit()
+    return created
+
+
+# Merges the monthly partitions of every year that ended `keep_months`
+# months before this month into one partition for the year, returns
+# [(partition, shows)]. The year's shows are copied while writes to show
+# wait and reads go on; only swapping the partitions blocks reads, briefly.
+def archive_partitions(session, keep_months: int = KEEP_MONTHS, today: date = None) -> list:
+    cutoff = datetime.combine(add_months((today or date.today()).replace(day=1), -keep_months), datetime.min.time())
+    years = {}
+    for partition in show_partitions(session):
+        if partition.months() == 1 and datetime(partition.lower.year + 1, 1, 1) <= cutoff:
+            years.setdefault(partition.lower.year, []).append(partition)
+
+    archived = []
+    for year, months in sorted(years.items()):
+        lower, upper = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+        name = 'show_p{}'.format(year)
+        parameters = {'lower': lower, 'upper': upper}
+        session.execute('LOCK TABLE show IN EXCLUSIVE MODE')
+        # with the parent's indexes, which ATTACH then adopts instead of building
+        session.execute('CREATE TABLE {0} (LIKE show INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES)'.format(name))
+        session.execute(
+            'ALTER TABLE {0} ADD CONSTRAINT {0}_bounds CHECK (start_time >= :lower AND start_time < :upper)'.format(name),
+            parameters)
+        shows = session.execute(
+            'INSERT INTO {} SELECT * FROM show WHERE start_time >= :lower AND start_time < :upper'.format(name),
+            parameters).rowcount
+
+        session.execute('DELETE FROM show_default WHERE start_time >= :lower AND start_time < :upper', parameters)
+        for month in months:
+            session.execute('ALTER TABLE show DETACH PARTITION {}'.format(month.name))
+            session.execute('DROP TABLE {}'.format(month.name))
+        session.execute('ALTER TABLE show ATTACH PARTITION {} FOR VALUES FROM (:lower) TO (:upper)'.format(name), parameters)
+        session.execute('ALTER TABLE {0} DROP CONSTRAINT {0}_bounds'.format(name))
+        session.execute('ANALYZE {}'.format(name))
+        session.commit()
+        archived.append((name, shows))
+
+    return archived
+
+
+# Detaches the partitions that end on or before `before`: their shows leave
+# show (and the counts), the tables stay, to be dumped and dropped or
+# attached again (ALTER TABLE show ATTACH PARTITION ... FOR VALUES ...,
+# then `flask stats refresh --all`); returns the detached partitions
+def detach_partitions(session, before: datetime) -> list:
+    detached = [partition for partition in show_partitions(session) if partition.upper <= before]
+    for partition in detached:
+        session.execute('ALTER TABLE show DETACH PARTITION {}'.format(partition.name))
+    session.commit()
+
+    if detached:
+        refresh_all(session)
+    return detached
+
+
+@click.group('partitions')
+def partitions_command():
+    """ Monthly partitions of the show table. """
+
+
+@partitions_command.command('list')
+@with_appcontext
+def list_command():
+    """ Partitions of show, with their estimated number of shows. """
+    try:
+        partitions = show_partitions(db.session)
+        default_rows = db.session.execute('SELECT count(*) FROM show_default').scalar()
+    finally:
+        db.session.remove()
+
+    for partition in partitions:
+        click.echo('{:<16} {:%Y-%m-%d} .. {:%Y-%m-%d} {:>12,} shows'.format(partition.name, partition.lower, partition.upper, partition.rows))
+    click.echo('{:<16} {:>38,} shows'.format('show_default', default_rows))
+
+
+@partitions_command.command('create')
+@click.option('--months-ahead', default=MONTHS_AHEAD, show_default=True, help='create partitions up to this many months ahead')
+@with_appcontext
+def create_command(months_ahead):
+    """ Create the partitions of the coming months. Run it from cron
+    every month.
+    """
+    try:
+        created = create_partitions(db.session, months_ahead)
+    finally:
+        db.session.remove()
+
+    for name, moved in created:
+        click.echo('{} created, {:,} shows moved from show_default'.format(name, moved))
+    if not created:
+        click.echo('partitions exist up to {} months ahead'.format(months_ahead))
+
+
+@partitions_command.command('archive')
+@click.option('--keep-months', default=KEEP_MONTHS, show_default=True, help='keep monthly partitions for at least this many months back')
+@with_appcontext
+def archive_command(keep_months):
+    """ Merge the monthly partitions of past years into one partition per
+    year. The shows stay in the show table.
+    """
+    try:
+        archived = archive_partitions(db.session, keep_months)
+    finally:
+        db.session.remove()
+
+    for name, shows in archived:
+        click.echo('{} created with {:,} shows'.format(name, shows))
+    if not archived:
+        click.echo('no year to archive')
+
+
+@partitions_command.command('detach')
+@click.option('--before', type=click.DateTime(), required=True, help='detach the partitions ending on or before this date')
+@with_appcontext
+def detach_command(before):
+    """ Take old partitions out of the show table, keeping them as tables
+    of their own, and recount the show statistics.
+    """
+    try:
+        detached = detach_partitions(db.session, before)
+    finally:
+        db.session.remove()
+
+    for partition in detached:
+        click.echo('{} detached ({:,} shows), attach it again with: '
+                   "ALTER TABLE show ATTACH PARTITION {} FOR VALUES FROM ('{}') TO ('{}'); "
+                   'then run flask stats refresh --all'.format(
+                       partition.name, partition.rows, partition.name, partition.lower, partition.upper))
+    if not detached:
+        click.echo('no partition ends before {:%Y-%m-%d}'.format(before))
@@ -0,0 +1,249 @@
+import json
+import logging
+import random
+import re
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Request profiling.
+#----------------------------------------------------------------------------#
+
+# Where the time of a request goes, for a sample of requests
+# (PROFILE_SAMPLE_RATE): SQL statements, from SQLAlchemy's cursor events on
+# every engine (primary, replicas and the ASGI async engines), template
+# rendering, from the app's Jinja template class, and the rest, the view's
+# own Python. A profiled response carries a Server-Timing header and logs
+# one JSON line; statements that run PROFILE_REPEATED_STATEMENTS times or
+# more in a request are listed as N+1 suspects.
+# Streamed pages (/shows) send their headers before rendering, so their
+# Server-Timing covers the work up to the first byte; the log line is
+# written when the request ends and covers all of it.
+
+# a list of bound parameters, as in an expanded IN (...), whose length
+# varies between otherwise identical statements
+PARAMETER_LIST = re.compile(r'\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+\s*\)')
+
+
+# statements with the same shape differ only in their parameters
+def statement_shape(statement: str) -> str:
+    return PARAMETER_LIST.sub('(...)', statement)
+
+
+class RequestProfile:
+    __slots__ = (
+        'start',
+        'sql_count',
+        'sql_seconds',
+        'template_seconds',
+        'template_sql_seconds',
+        'rendering',
+        'statements',
+        'status',
+        )
+
+    start: float
+    sql_count: int
+    sql_seconds: float
+    template_seconds: float
+    template_sql_seconds: float
+    rendering: bool
+    statements: dict
+    status: int
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_sql_seconds = 0.0
+        self.rendering = False
+        # statement -> [executions, seconds]
+        self.statements = {}
+        self.status = None
+
+    def add_statement(self, statement: str, seconds: float):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if self.rendering:
+            self.template_sql_seconds += seconds
+
+        executions = self.statements.get(statement)
+        if executions is None:
+            executions = self.statements[statement] = [0, 0.0]
+        executions[0] += 1
+        executions[1] += seconds
+
+    def add_render(self, seconds: float):
+        self.template_seconds += seconds
+
+    # (shape, executions, seconds) of the shapes run at least `threshold`
+    # times, most executed first
+    def repeated(self, threshold: int) -> list:
+        shapes = {}
+        for statement, (count, seconds) in self.statements.items():
+            totals = shapes.setdefault(statement_shape(statement), [0, 0.0])
+            totals[0] += count
+            totals[1] += seconds
+
+        repeated = [(shape, count, seconds) for shape, (count, seconds) in shapes.items() if count >= threshold]
+        return sorted(repeated, key=lambda item: -item[1])
+
+    # milliseconds so far: sql, template (its own time, without the
+    # statements run while rendering), app (everything else) and total
+    def timings(self) -> dict:
+        total = time.perf_counter() - self.start
+        template = self.template_seconds - self.template_sql_seconds
+        return {
+            'sql': round(self.sql_seconds * 1000, 3),
+            'template': round(template * 1000, 3),
+            'app': round(max(total - self.sql_seconds - template, 0.0) * 1000, 3),
+            'total': round(total * 1000, 3),
+        }
+
+
+def current_profile() -> RequestProfile:
+    if has_request_context():
+        return g.get('profile')
+    return None
+
+
+# Jinja template class that adds render time to the request's profile;
+# render() serves render_template, generate() the streamed pages, where
+# only the time spent producing each chunk counts
+def profiled_template_class(base):
+
+    class ProfiledTemplate(base):
+
+        def render(self, *args, **kwargs):
+            profile = current_profile()
+            if profile is None or profile.rendering:
+                return base.render(self, *args, **kwargs)
+
+            profile.rendering = True
+            start = time.perf_counter()
+            try:
+                return base.render(self, *args, **kwargs)
+            finally:
+                profile.rendering = False
+                profile.add_render(time.perf_counter() - start)
+
+        def generate(self, *args, **kwargs):
+            profile = current_profile()
+            chunks = base.generate(self, *args, **kwargs)
+            if profile is None:
+                yield from chunks
+                return
+
+            while True:
+                profile.rendering = True
+                start = time.perf_counter()
+                try:
+                    chunk = next(chunks, None)
+                finally:
+                    profile.rendering = False
+                    profile.add_render(time.perf_counter() - start)
+                if chunk is None:
+                    return
+                yield chunk
+
+    return ProfiledTemplate
+
+
+class RequestProfiler:
+    sample_rate: float
+    repeated_threshold: int
+
+    def __init__(self, app=None):
+        self.sample_rate = 0.0
+        self.repeated_threshold = 5
+        if app is not None:
+            self.init_app(app)
+
+    # PROFILE_SAMPLE_RATE: share of requests profiled, 0 leaves the app
+    # without any hook
+    def init_app(self, app):
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.repeated_threshold = app.config.get('PROFILE_REPEATED_STATEMENTS', 5)
+        if self.sample_rate <= 0:
+            return
+
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.jinja_env.template_class = profiled_template_class(app.jinja_env.template_class)
+
+        app.before_request(self._start)
+        app.after_request(self._add_header)
+        app.teardown_request(self._log)
+
+    def _start(self):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            g.profile = RequestProfile()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None and current_profile() is not None:
+            context._profile_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_profile_start', None)
+        if start is not None:
+            profile = current_profile()
+            if profile is not None:
+                profile.add_statement(statement, time.perf_counter() - start)
+
+    def _add_header(self, response):
+        profile = current_profile()
+        if profile is None:
+            return response
+
+        profile.status = response.status_code
+        timings = profile.timings()
+        metrics = [
+            'sql;dur={};desc="{} statements"'.format(timings['sql'], profile.sql_count),
+            'template;dur={}'.format(timings['template']),
+            'app;dur={}'.format(timings['app']),
+            'total;dur={}'.format(timings['total']),
+        ]
+        repeated = profile.repeated(self.repeated_threshold)
+        if repeated:
+            metrics.append('repeated;desc="{} statement shapes, up to {} times"'.format(len(repeated), repeated[0][1]))
+
+        response.headers['Server-Timing'] = ', '.join(metrics)
+        return response
+
+    def _log(self, exc=None):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+
+        repeated = profile.repeated(self.repeated_threshold)
+        record = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': profile.status,
+            'sql_count': profile.sql_count,
+            'ms': profile.timings(),
+        }
+        if repeated:
+            record['repeated'] = [
+                {'statement': shape[:500], 'count': count, 'ms': round(seconds * 1000, 3)}
+                for shape, count, seconds in repeated
+            ]
+        if exc is not None:
+            record['error'] = repr(exc)
+
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record))
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,653 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import attrgetter
+from flask import g
+from sqlalchemy import and_, case, func, cast, literal, or_, select, tuple_, true, union_all, update, ARRAY, Text
+from sqlalchemy.sql import operators
+from models import *
+from pagination import KeysetPage, decode_cursor, decode_position, encode_position
+from partitions import add_months
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# first key of the advisory locks on a venue's or an artist's schedule,
+# the second is its id
+SCHEDULE_LOCKS = {
+    'venue': 7301,
+    'artist': 7302,
+}
+
+
+# range overlap; one operator object for every statement, SQLAlchemy
+# keys its compiled statement cache on the operator's identity
+OVERLAPS = operators.custom_op('&&')
+
+
+# one "now" per request, so every past/upcoming split in it agrees
+def request_now() -> datetime:
+    if 'now' not in g:
+        g.now = datetime.now()
+    return g.now
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+# whole /venues directory in one statement, upcoming shows
+# come from venue_show_stats (joined) against a single "now"
+def area_directory(now: datetime = None) -> list[AreaUI]:
+    now = now or datetime.now()
+
+    num_upcoming_shows = func.coalesce(stats_count_column(Venue, now), 0)
+
+    rows = db.session.query(
+        Venue.city,
+        Venue.state,
+        Venue.id,
+        Venue.name,
+        num_upcoming_shows.label('num_upcoming_shows')
+        ) \
+        .outerjoin(VenueShowStats, VenueShowStats.venue_id == Venue.id) \
+        .order_by(Venue.state, Venue.city, Venue.id)
+
+    return MapperAreaUI(rows=rows).areas()
+
+
+#  Search
+#  ----------------------------------------------------------------
+
+# must match the expression of the ix_venue_search_document and
+# ix_artist_search_document trigram indexes (migration 800459abf93d)
+def search_document(model):
+    return func.fyyur_search_document(model.name, model.city, model.state, cast(model.genres, Text))
+
+
+def contains_pattern(term: str) -> str:
+    term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%{}%'.format(term)
+
+
+# show column that points back at a Venue or an Artist
+def show_foreign_key(model):
+    return Show.venue_id if model is Venue else Show.artist_id
+
+
+# ids on the other side of an entity's shows:
+# artists of a venue, venues of an artist
+def show_counterpart_ids(model, entity_id: int) -> list[int]:
+    counterpart = Show.artist_id if model is Venue else Show.venue_id
+
+    rows = db.session.query(counterpart) \
+        .filter(show_foreign_key(model) == entity_id) \
+        .distinct()
+
+    return [row[0] for row in rows]
+
+
+# show statistics rows of Venue or Artist
+def show_stats_model(model):
+    return VenueShowStats if model is Venue else ArtistShowStats
+
+
+# how far counted_at of a show statistics row may be from `now` for the
+# shows that started in between to be counted in a subquery bounded on
+# constant times; `flask stats refresh` keeps stale rows within a minute
+STATS_MOVE_WINDOW = timedelta(hours=1)
+
+
+# constant [lower, upper) bounds around `now` for counting the shows that
+# started since a statistics row was counted, kept within the monthly
+# partition of `now` so the subquery is planned on that one partition
+# instead of on every partition for every row
+def stats_move_bounds(now: datetime) -> (datetime, datetime):
+    month = now.date().replace(day=1)
+    lower = datetime.combine(month, datetime.min.time())
+    upper = datetime.combine(add_months(month, 1), datetime.min.time())
+    return max(now - STATS_MOVE_WINDOW, lower), min(now + STATS_MOVE_WINDOW, upper)
+
+
+# past or upcoming show count from a show statistics row of `model`.
+# The row's counts hold until its next_show_time. Shows that started since
+# counted_at (before `flask stats refresh` moved them) are counted on
+# ix_show_*_id_start_time between the two times and moved to the past;
+# when counted_at is ahead of `now`, shows between them move back. Rows
+# counted outside stats_move_bounds() are counted by
+# fyyur_count_shows_between (migration 18ca41a612fa) instead.
+def stats_count_column(model, now: datetime, when: str = 'upcoming'):
+    stats = show_stats_model(model)
+    foreign_key = show_foreign_key(model)
+    key = getattr(stats, foreign_key.name)
+    after = func.least(stats.counted_at, now)
+    until = func.greatest(stats.counted_at, now)
+    lower, upper = stats_move_bounds(now)
+
+    bounded = db.session.query(func.count()) \
+        .filter(
+            foreign_key == key,
+            Show.start_time > after,
+            Show.start_time <= until,
+            Show.start_time >= lower,
+            Show.start_time < upper
+            ) \
+        .scalar_subquery()
+    keys = (key, None) if model is Venue else (None, key)
+    unbounded = func.fyyur_count_shows_between(*keys, after, until)
+
+    current = and_(stats.counted_at <= now, or_(stats.next_show_time.is_(None), stats.next_show_time > now))
+    within = and_(stats.counted_at >= lower, stats.counted_at < upper)
+    direction = case((stats.counted_at <= now, 1), else_=-1)
+    moved = case((current, 0), (within, bounded * direction), else_=unbounded * direction)
+
+    return stats.past_count + moved if when == 'past' else stats.upcoming_count - moved
+
+
+# correlated lookup of an entity's past or upcoming show count in its show
+# statistics row, one primary key probe; an entity without a row has no shows
+def stats_show_count(model, entity_id, now: datetime, when: str = 'upcoming'):
+    stats = show_stats_model(model)
+    key = getattr(stats, show_foreign_key(model).name)
+
+    count = db.session.query(stats_count_column(model, now, when)) \
+        .filter(key == entity_id) \
+        .scalar_subquery()
+
+    return func.coalesce(count, 0)
+
+
+# case-insensitive partial match on name, city, state and genres,
+# name matches rank first, then by trigram similarity of the name;
+# returns (total matches, one page of (id, name, upcoming_count) rows);
+# offset, when given, replaces page
+def search_results(model, term: str, page: int = 1, per_page: int = 20, now: datetime = None, offset: int = None):
+    now = now or datetime.now()
+    term = (term or '').strip().lower()
+    pattern = contains_pattern(term)
+    offset = (max(page, 1) - 1) * per_page if offset is None else offset
+
+    name_match = func.lower(model.name).like(pattern)
+    name_similarity = func.similarity(func.lower(model.name), term)
+
+    matches = db.session.query(
+        model.id,
+        model.name,
+        name_match.label('name_match'),
+        name_similarity.label('name_similarity'),
+        func.count().over().label('total')
+        ) \
+        .filter(search_document(model).like(pattern)) \
+        .order_by(name_match.desc(), name_similarity.desc(), model.name, model.id) \
+        .limit(per_page) \
+        .offset(offset) \
+        .subquery()
+
+    # upcoming shows are only counted for the rows of this page
+    rows = db.session.query(
+        matches.c.id,
+        matches.c.name,
+        matches.c.total,
+        stats_show_count(model, matches.c.id, now).label('upcoming_count')
+        ) \
+        .order_by(
+            matches.c.name_match.desc(),
+            matches.c.name_similarity.desc(),
+            matches.c.name,
+            matches.c.id
+            ) \
+        .all()
+
+    total = rows[0].total if rows else 0
+    return total, rows
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+# columns the show tiles render, without loading Show, Artist or Venue instances
+def show_tiles():
+    return db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link')
+        ) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .join(Venue, Venue.id == Show.venue_id)
+
+
+# the time a show occupies its venue and artist, as indexed by
+# ix_show_venue_during and ix_show_artist_during; the same expression
+# builds the range of a show not yet booked from its start and duration
+def show_during(start_time=Show.start_time, duration=Show.duration):
+    return func.tsrange(start_time, start_time + duration)
+
+
+# Shows overlapping [start_time, start_time + duration) at the venue or by
+# the artist, as show tiles with the show's duration and which of the two
+# it conflicts on, in one statement over the two GiST indexes (BitmapOr);
+# shows ending when the new one starts do not conflict
+def show_conflicts(venue_id: int, artist_id: int, start_time: datetime, duration: timedelta) -> list:
+    overlaps = show_during().operate(OVERLAPS, show_during(literal(start_time), literal(duration)))
+    venue_conflict = Show.venue_id == venue_id
+    artist_conflict = Show.artist_id == artist_id
+
+    return show_tiles() \
+        .add_columns(
+            Show.duration,
+            venue_conflict.label('venue_conflict'),
+            artist_conflict.label('artist_conflict')
+            ) \
+        .filter(overlaps, or_(venue_conflict, artist_conflict)) \
+        .order_by(Show.start_time, Show.id) \
+        .all()
+
+
+# Locks the venue's and the artist's schedules until the transaction ends,
+# so two bookings can not both pass show_conflicts() and then overlap;
+# returns (venue exists, artist exists). Venue locks are always taken
+# before artist locks, so bookings never wait on each other in a cycle.
+def lock_show_schedule(venue_id: int, artist_id: int) -> (bool, bool):
+    row = db.session.execute('''
+        SELECT
+            pg_advisory_xact_lock(:venue_lock, :venue_id),
+            pg_advisory_xact_lock(:artist_lock, :artist_id),
+            EXISTS (SELECT 1 FROM "Venue" WHERE id = :venue_id) AS venue,
+            EXISTS (SELECT 1 FROM "Artist" WHERE id = :artist_id) AS artist
+    ''', {
+        'venue_lock': SCHEDULE_LOCKS['venue'],
+        'venue_id': venue_id,
+        'artist_lock': SCHEDULE_LOCKS['artist'],
+        'artist_id': artist_id,
+        }).one()
+    return row.venue, row.artist
+
+
+# show_tiles() of shows that started by `now` and of shows after it, split
+# like the show statistics count them; each is bounded on start_time so
+# show's partitions on the other side of now are pruned from the plan
+def past_shows(now: datetime):
+    return show_tiles().filter(Show.start_time <= now)
+
+
+def upcoming_shows(now: datetime):
+    return show_tiles().filter(Show.start_time > now)
+
+
+# shows in (start_time, id) order from after a cursor; the row comparison
+# orders the page, the start_time bound prunes the partitions before it
+def show_keyset(query, cursor: str = None, descending: bool = False):
+    key = tuple_(Show.start_time, Show.id)
+
+    if cursor is not None:
+        start_time, show_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(Show.start_time <= start_time, key < tuple_(start_time, show_id))
+        else:
+            query = query.filter(Show.start_time >= start_time, key > tuple_(start_time, show_id))
+
+    if descending:
+        return query.order_by(Show.start_time.desc(), Show.id.desc())
+    return query.order_by(Show.start_time, Show.id)
+
+
+# one keyset page of /shows ordered by (start_time, id),
+# past shows run newest first; when is None, 'past' or 'upcoming'.
+# Rows are fetched from a server side cursor in batches of batch_size,
+# the statement is executed before returning so errors surface here.
+def show_listing(when: str = None, cursor: str = None, per_page: int = 60, batch_size: int = 20, now: datetime = None) -> KeysetPage:
+    now = now or datetime.now()
+
+    if when == 'past':
+        query = past_shows(now)
+    elif when == 'upcoming':
+        query = upcoming_shows(now)
+    else:
+        query = show_tiles()
+
+    query = show_keyset(query, cursor, descending=when == 'past')
+
+    rows = db.session.execute(
+        query.limit(per_page + 1).statement,
+        execution_options={'stream_results': True}
+        ).yield_per(batch_size)
+
+    return KeysetPage(rows=rows, per_page=per_page)
+
+
+#  Detail pages
+#  ----------------------------------------------------------------
+
+# every column of a model as a plain row
+def entity_columns(model):
+    return [column for column in model.__table__.columns]
+
+
+# one keyset page of a venue's or an artist's past shows, latest first,
+# or upcoming shows, soonest first: a LIMIT per_page + 1 read of the
+# (venue_id or artist_id, start_time, id) index in the partitions on that
+# side of now; when is 'past' or 'upcoming'
+def entity_show_page(model, entity_id: int, when: str, cursor: str = None, per_page: int = 12, now: datetime = None) -> KeysetPage:
+    now = now or datetime.now()
+    query = past_shows(now) if when == 'past' else upcoming_shows(now)
+
+    rows = show_keyset(query.filter(show_foreign_key(model) == entity_id), cursor, descending=when == 'past') \
+        .limit(per_page + 1) \
+        .all()
+
+    return KeysetPage(rows=rows, per_page=per_page)
+
+
+# exact past_shows_count and upcoming_shows_count columns of an entity,
+# from its show statistics row
+def entity_show_counts(model, entity_id: int, now: datetime) -> list:
+    return [
+        stats_show_count(model, entity_id, now, when).label('{}_shows_count'.format(when))
+        for when in ('past', 'upcoming')
+    ]
+
+
+# venue page view model from three column-only statements: the venue with
+# its show counts, then the first page of its past and of its upcoming shows;
+# raises NoResultFound for an unknown venue
+def venue_detail(venue_id: int, now: datetime = None, per_page: int = 12) -> VenueUI:
+    now = now or datetime.now()
+
+    venue = db.session.query(*entity_columns(Venue), *entity_show_counts(Venue, venue_id, now)) \
+        .filter(Venue.id == venue_id) \
+        .one()
+    past = entity_show_page(Venue, venue_id, 'past', per_page=per_page, now=now)
+    upcoming = entity_show_page(Venue, venue_id, 'upcoming', per_page=per_page, now=now)
+
+    return VenueUI(venue_data=venue, past_shows=past, upcoming_shows=upcoming)
+
+
+# artist page view model from three column-only statements, as venue_detail();
+# raises NoResultFound for an unknown artist
+def artist_detail(artist_id: int, now: datetime = None, per_page: int = 12) -> ArtistUI:
+    now = now or datetime.now()
+
+    artist = db.session.query(*entity_columns(Artist), *entity_show_counts(Artist, artist_id, now)) \
+        .filter(Artist.id == artist_id) \
+        .one()
+    past = entity_show_page(Artist, artist_id, 'past', per_page=per_page, now=now)
+    upcoming = entity_show_page(Artist, artist_id, 'upcoming', per_page=per_page, now=now)
+
+    return ArtistUI(artist_data=artist, past_shows=past, upcoming_shows=upcoming)
+
+
+#  Edits
+#  ----------------------------------------------------------------
+
+# the columns of a venue or an artist that its edit form has a field for,
+# version included
+def form_columns(model, form) -> list:
+    columns = model.__table__.columns
+    return [columns[name] for name in form._fields if name in columns]
+
+
+# id and the form's columns of a venue or an artist in one column-only
+# statement, None for an unknown id
+def entity_form_data(model, form, entity_id: int):
+    return db.session.query(model.id, *form_columns(model, form)) \
+        .filter(model.id == entity_id) \
+        .one_or_none()
+
+
+# Writes the form's fields to a venue or an artist in one statement,
+# UPDATE ... WHERE id = :id AND version = :version RETURNING version, so
+# an edit made since the form was filled is never overwritten; the
+# bump_version trigger increments the version. Returns the new version,
+# None when the row was edited since or deleted. The caller commits.
+def update_entity(model, entity_id: int, form) -> int:
+    table = model.__table__
+    values = {
+        column.name: getattr(form, column.name).data
+        for column in form_columns(model, form) if column.name != 'version'
+    }
+
+    return db.session.execute(
+        update(table)
+        .where(table.c.id == entity_id, table.c.version == form.version.data)
+        .values(values)
+        .returning(table.c.version)
+        ).scalar()
+
+
+# Deletes every show of a venue or an artist in one statement, to run
+# before deleting the venue or artist: the show foreign keys do not
+# cascade. The count_delete_shows trigger updates the other side's
+# statistics. The caller commits.
+def delete_entity_shows(model, entity_id: int) -> int:
+    return db.session.query(Show) \
+        .filter(show_foreign_key(model) == entity_id) \
+        .delete(synchronize_session=False)
+
+
+#  Exports
+#  ----------------------------------------------------------------
+
+# genres as text[] whether the column is an array or its text form
+def genre_list(model):
+    return cast(cast(model.genres, Text), ARRAY(Text))
+
+
+# Column-only export queries, filtered by a date range, city and genre:
+# shows by start_time, at a venue in the city, by an artist of the genre;
+# venues and artists by updated_at, for incremental dumps, with the
+# columns `flask import` reads so a dump loads back as it is.
+def export_query(kind: str, since: datetime = None, until: datetime = None, city: str = None, genre: str = None):
+    if kind == 'shows':
+        return show_export(since, until, city, genre)
+
+    model = Venue if kind == 'venues' else Artist
+    columns = [column for column in entity_columns(model) if column.name not in ('genres', 'updated_at', 'version')]
+    query = db.session.query(*columns, genre_list(model).label('genres'))
+
+    if since is not None:
+        query = query.filter(model.updated_at >= since)
+    if until is not None:
+        query = query.filter(model.updated_at < until)
+    if city:
+        query = query.filter(func.lower(model.city) == city.lower())
+    if genre:
+        query = query.filter(genre_list(model).any(genre))
+
+    return query.order_by(model.id)
+
+
+def show_export(since: datetime = None, until: datetime = None, city: str = None, genre: str = None):
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.duration,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Venue.city.label('venue_city'),
+        Venue.state.label('venue_state'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        genre_list(Artist).label('artist_genres')
+        ) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .join(Venue, Venue.id == Show.venue_id)
+
+    if since is not None:
+        query = query.filter(Show.start_time >= since)
+    if until is not None:
+        query = query.filter(Show.start_time < until)
+    if city:
+        query = query.filter(func.lower(Venue.city) == city.lower())
+    if genre:
+        query = query.filter(genre_list(Artist).any(genre))
+
+    return query.order_by(Show.start_time, Show.id)
+
+
+#  API
+#  ----------------------------------------------------------------
+
+# fields the API returns for a venue or an artist: its columns, with
+# genres as a list, and its show counts
+def api_fields(model) -> list:
+    return [column.name for column in entity_columns(model)] + ['past_shows_count', 'upcoming_shows_count']
+
+
+# the requested fields only, show counts are looked up in the show statistics
+def api_columns(model, fields: list, now: datetime) -> list:
+    columns = []
+    for name in fields:
+        if name == 'genres':
+            column = genre_list(model)
+        elif name == 'past_shows_count':
+            column = stats_show_count(model, model.id, now, when='past')
+        elif name == 'upcoming_shows_count':
+            column = stats_show_count(model, model.id, now)
+        else:
+            column = model.__table__.columns[name]
+        columns.append(column.label(name))
+    return columns
+
+
+# one page of venues or artists in id order, `fields` must include id
+def api_listing(model, fields: list, cursor: str = None, per_page: int = 50, now: datetime = None) -> KeysetPage:
+    now = now or datetime.now()
+
+    query = db.session.query(*api_columns(model, fields, now))
+
+    if cursor is not None:
+        query = query.filter(model.id > decode_position(cursor))
+
+    rows = query.order_by(model.id).limit(per_page + 1).all()
+
+    return KeysetPage(rows=rows, per_page=per_page, cursor=lambda row: encode_position(row.id))
+
+
+# raises NoResultFound for an unknown venue or artist
+def api_detail(model, entity_id: int, fields: list, now: datetime = None):
+    now = now or datetime.now()
+
+    return db.session.query(*api_columns(model, fields, now)) \
+        .filter(model.id == entity_id) \
+        .one()
+
+
+# The first page of past shows, latest first, and of upcoming shows,
+# soonest first, of several venues or artists, one statement for each of
+# `whens` ('past', 'upcoming'): each entity reads at most per_page + 1
+# rows of ix_show_*_id_start_time (LATERAL ... LIMIT).
+# {entity id: {when: KeysetPage of show tiles}}
+def api_entity_shows(model, entity_ids: list, whens=('past', 'upcoming'), per_page: int = 12, now: datetime = None) -> dict:
+    now = now or datetime.now()
+    foreign_key = show_foreign_key(model)
+    shows = {entity_id: {when: [] for when in whens} for entity_id in entity_ids}
+
+    entities = db.session.query(model.id.label('entity_id')) \
+        .filter(model.id.in_(entity_ids)) \
+        .subquery('entities')
+
+    for when in whens:
+        query = past_shows(now) if when == 'past' else upcoming_shows(now)
+        page = show_keyset(query.filter(foreign_key == entities.c.entity_id), descending=when == 'past') \
+            .limit(per_page + 1) \
+            .subquery('page') \
+            .lateral()
+
+        order = (page.c.start_time, page.c.id)
+        if when == 'past':
+            order = tuple(column.desc() for column in order)
+
+        rows = db.session.query(entities.c.entity_id, *page.c) \
+            .select_from(entities) \
+            .join(page, true()) \
+            .order_by(entities.c.entity_id, *order)
+
+        for entity_id, entity_rows in groupby(rows, key=attrgetter('entity_id')):
+            shows[entity_id][when].extend(entity_rows)
+
+    return {
+        entity_id: {when: KeysetPage(rows=rows, per_page=per_page) for when, rows in pages.items()}
+        for entity_id, pages in shows.items()
+    }
+
+
+# whether a venue or an artist exists, for the pages of its shows
+def entity_exists(model, entity_id: int) -> bool:
+    return db.session.query(db.session.query(model.id).filter(model.id == entity_id).exists()).scalar()
+
+
+# raises NoResultFound for an unknown show
+def api_show(show_id: int):
+    return show_tiles().filter(Show.id == show_id).one()
+
+
+#  Conditional requests
+#  ----------------------------------------------------------------
+
+# naive datetimes are local time, like start_time
+def http_datetime(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+# the other side of the first per_page past and upcoming shows of a venue
+# or an artist: the ids of the artists or venues its page renders
+def shown_counterpart_ids(model, entity_id: int, per_page: int, now: datetime):
+    counterpart = Show.artist_id if model is Venue else Show.venue_id
+    foreign_key = show_foreign_key(model)
+
+    pages = [
+        show_keyset(db.session.query(counterpart).filter(foreign_key == entity_id, bound), descending=descending) \
+            .limit(per_page) \
+            .subquery()
+        for bound, descending in ((Show.start_time <= now, True), (Show.start_time > now, False))
+    ]
+    return union_all(*(select(page.c[0]) for page in pages))
+
+
+# (etag, last_modified) of a venue or artist page from one statement that
+# reads the entity's row and its show statistics row, without loading the
+# page; None for an unknown entity.
+# A page changes when the entity is written (updated_at), when one of its
+# shows is added, removed or moved (the statistics' shows_changed_at),
+# when a show starts (the counts, and counted_at once `flask stats
+# refresh` moved it) and when an artist or venue of the shows on the page
+# is written (the largest of their updated_at). per_page is the number of
+# past and of upcoming shows the page renders.
+def page_validator(model, entity_id: int, per_page: int = 12, now: datetime = None):
+    now = now or datetime.now()
+    stats = show_stats_model(model)
+    counterpart = Artist if model is Venue else Venue
+
+    current = and_(stats.counted_at <= now, or_(stats.next_show_time.is_(None), stats.next_show_time > now))
+    counterparts_updated_at = db.session.query(func.max(counterpart.updated_at)) \
+        .filter(counterpart.id.in_(shown_counterpart_ids(model, entity_id, per_page, now))) \
+        .scalar_subquery()
+
+    row = db.session.query(
+        model.updated_at,
+        stats.shows_changed_at,
+        stats_count_column(model, now, 'past').label('past'),
+        stats_count_column(model, now, 'upcoming').label('upcoming'),
+        case((current, stats.counted_at), else_=literal(now)).label('last_started'),
+        counterparts_updated_at.label('counterparts_updated_at')
+        ) \
+        .outerjoin(stats, getattr(stats, show_foreign_key(model).name) == model.id) \
+        .filter(model.id == entity_id) \
+        .one_or_none()
+
+    if row is None:
+        return None
+
+    version = '{}:{}:{}:{}:{}:{}:{}'.format(
+        model.__tablename__, entity_id, row.updated_at, row.shows_changed_at, row.past, row.upcoming, row.counterparts_updated_at)
+    etag = hashlib.md5(version.encode()).hexdigest()
+
+    changes = [row.updated_at, row.shows_changed_at, row.last_started, row.counterparts_updated_at]
+    last_modified = max(http_datetime(change) for change in changes if change is not None)
+
+    return etag, last_modified
@@ -0,0 +1,222 @@
+import itertools
+import logging
+import threading
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, exc, orm
+
+logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+READ_METHODS = ('GET', 'HEAD')
+
+# WSGI environ key of a callable that maps the engine a request would use
+# to the one it must use instead, set by asgi.py for requests served on
+# the event loop
+ENGINE_ADAPTER = 'fyyur.engine_adapter'
+
+# seconds a standby's replay is behind its primary; 0 when it has replayed
+# everything it received, NULL (healthy) on a server that is not a standby
+REPLICA_LAG_SQL = '''
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+
+
+class Replica:
+    __slots__ = ('bind', 'healthy', 'checked_at')
+
+    bind: str
+    healthy: bool
+    checked_at: float
+
+    def __init__(self, bind: str):
+        self.bind = bind
+        self.healthy = True
+        self.checked_at = float('-inf')
+
+
+# Picks the engine for read-only requests: GET and HEAD requests and views
+# marked read_only go to the SQLALCHEMY_REPLICA_URIS round-robin, everything
+# else to the primary.
+# A visitor that wrote something reads from the primary for the next
+# READ_AFTER_WRITE_SECONDS, so the redirect after a form sees its own write.
+# Each replica is checked at most every REPLICA_HEALTH_CHECK_INTERVAL seconds,
+# one that fails, lags more than REPLICA_MAX_LAG seconds or drops a
+# connection is skipped until its next check; with no healthy replica
+# reads go to the primary.
+# A request reads from the replica it picked first for all its statements,
+# and the checks run on a background thread, not on the requests.
+class ReplicaRouter:
+
+    def __init__(self, db):
+        self.db = db
+        self.replicas = []
+        self.read_only_endpoints = set()
+        self._cycle = None
+        self._lock = threading.Lock()
+        self._checker = None
+
+    def init_app(self, app):
+        urls = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        self.check_interval = app.config.get('REPLICA_HEALTH_CHECK_INTERVAL', 5)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', 10)
+        self.read_after_write = app.config.get('READ_AFTER_WRITE_SECONDS', 10)
+
+        # replicas are Flask-SQLAlchemy binds without tables,
+        # created with the same engine options as the primary
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.replicas = []
+        for index, url in enumerate(urls):
+            replica = Replica('replica_{}'.format(index))
+            binds[replica.bind] = url
+            self.replicas.append(replica)
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+        self._cycle = itertools.cycle(self.replicas)
+
+        if self.replicas:
+            app.after_request(self._pin_after_write)
+
+    # marks a view that only reads although it is not a GET, such as a search form
+    def read_only(self, view):
+        self.read_only_endpoints.add(view.__name__)
+        return view
+
+    def is_read_only(self) -> bool:
+        return request.method in READ_METHODS or request.endpoint in self.read_only_endpoints
+
+    # replica engine for this request, or None for the primary, picked on
+    # its first statement and kept in g.read_engine for the rest of it
+    def read_engine(self):
+        if not self.replicas or not has_request_context():
+            return None
+        if 'read_engine' not in g:
+            g.read_engine = self.pick_engine()
+        return g.read_engine
+
+    def pick_engine(self):
+        if not self.is_read_only() or self.is_pinned():
+            return None
+
+        self.start_checks()
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = next(self._cycle)
+            if replica.healthy:
+                return self.engine(replica)
+        return None
+
+    # whether this visitor wrote something in the last READ_AFTER_WRITE_SECONDS
+    def is_pinned(self) -> bool:
+        return session.get('_primary_until', 0) > time.time()
+
+    def engine(self, replica: Replica):
+        engine = self.db.get_engine(bind=replica.bind)
+        if not event.contains(engine, 'handle_error', self._on_error):
+            event.listen(engine, 'handle_error', self._on_error)
+        return engine
+
+    # starts the checks in this process, again in a worker forked after they started
+    def start_checks(self):
+        if self._checker is not None and self._checker.is_alive():
+            return
+        with self._lock:
+            if self._checker is None or not self._checker.is_alive():
+                self._checker = threading.Thread(
+                    target=self.run_checks, args=(current_app._get_current_object(),),
+                    name='replica-checks', daemon=True)
+                self._checker.start()
+
+    def run_checks(self, app):
+        with app.app_context():
+            while True:
+                for replica in self.replicas:
+                    if time.monotonic() - replica.checked_at >= self.check_interval:
+                        replica.checked_at = time.monotonic()
+                        replica.healthy = self.check(replica)
+                time.sleep(self.check_interval)
+
+    def check(self, replica: Replica) -> bool:
+        engine = self.engine(replica)
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name != 'postgresql':
+                    connection.exec_driver_sql('SELECT 1')
+                    return True
+
+                lag = connection.exec_driver_sql(REPLICA_LAG_SQL).scalar()
+                if self.max_lag is not None and lag > self.max_lag:
+                    logger.warning('replica %s is %.1fs behind, reading from the primary', replica.bind, lag)
+                    return False
+                return True
+        except exc.DBAPIError as e:
+            logger.warning('replica %s is unavailable: %s', replica.bind, e.orig)
+            return False
+
+    def adapt(self, engine):
+        if has_request_context():
+            adapter = request.environ.get(ENGINE_ADAPTER)
+            if adapter is not None:
+                return adapter(engine)
+        return engine
+
+    # writes from a request that is not read-only pin its visitor to the primary
+    def mark_write(self):
+        if has_request_context() and not self.is_read_only():
+            g.wrote_primary = True
+
+    def _pin_after_write(self, response):
+        if g.get('wrote_primary'):
+            session['_primary_until'] = time.time() + self.read_after_write
+        return response
+
+    # a replica that drops its connections is skipped until its next check
+    def _on_error(self, context):
+        if not context.is_disconnect:
+            return
+        for replica in self.replicas:
+            if self.db.get_engine(bind=replica.bind) is context.engine:
+                replica.healthy = False
+                replica.checked_at = time.monotonic()
+
+
+# session whose reads in read-only requests go to a replica;
+# flushes and requests that are not read-only use the primary
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self.router = db.router
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        engine = None
+        if not self._flushing:
+            engine = self.router.read_engine()
+        if engine is None:
+            engine = SignallingSession.get_bind(self, mapper, clause)
+        return self.router.adapt(engine)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    session.router.mark_write()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def __init__(self, *args, **kwargs):
+        self.router = ReplicaRouter(self)
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def init_app(self, app):
+        self.router.init_app(app)
+        SQLAlchemy.init_app(self, app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
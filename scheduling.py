@@ -0,0 +1,202 @@
+import csv
+import io
+from datetime import datetime, time, timedelta
+from itertools import islice
+from dateutil import rrule
+from queries import lock_show_schedule
+
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#----------------------------------------------------------------------------#
+
+# Books a series of shows for one venue and artist: the dates of a
+# recurrence (every Friday until the end of the year) or the slots of an
+# uploaded file. Every slot is checked and the free ones inserted by a
+# single statement, SCHEDULE, whatever their number; the others are
+# reported with the reason they were refused.
+
+FREQUENCIES = {
+    'daily': rrule.DAILY,
+    'weekly': rrule.WEEKLY,
+    'monthly': rrule.MONTHLY,
+}
+
+# Slots as arrays, one element per slot. A slot is refused when an existing
+# show overlaps it at the venue or by the artist, found on the GiST indexes
+# of queries.show_during(), or when it overlaps an earlier starting slot of
+# the same schedule. Inserted shows are matched back to their slot by
+# start_time, which is unique among slots that do not overlap.
+SCHEDULE = '''
+    WITH slot AS (
+        SELECT
+            requested.*,
+            tsrange(start_time, start_time + duration) AS during,
+            max(start_time + duration) OVER (
+                ORDER BY start_time, number ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ) > start_time AS overlaps_slot
+        FROM unnest(CAST(:numbers AS int[]), CAST(:start_times AS timestamp[]), CAST(:durations AS interval[]))
+            AS requested (number, start_time, duration)
+    ),
+    checked AS (
+        SELECT
+            slot.*,
+            (
+                SELECT show.id FROM show
+                WHERE show.venue_id = :venue_id
+                  AND tsrange(show.start_time, show.start_time + show.duration) && slot.during
+                LIMIT 1
+            ) AS venue_show_id,
+            (
+                SELECT show.id FROM show
+                WHERE show.artist_id = :artist_id
+                  AND tsrange(show.start_time, show.start_time + show.duration) && slot.during
+                LIMIT 1
+            ) AS artist_show_id
+        FROM slot
+    ),
+    inserted AS (
+        INSERT INTO show (venue_id, artist_id, start_time, duration)
+        SELECT :venue_id, :artist_id, start_time, duration FROM checked
+        WHERE venue_show_id IS NULL AND artist_show_id IS NULL AND overlaps_slot IS NOT TRUE
+        ORDER BY start_time
+        RETURNING id, start_time
+    )
+    SELECT checked.number, inserted.id AS show_id, checked.venue_show_id, checked.artist_show_id, checked.overlaps_slot
+    FROM checked
+    LEFT JOIN inserted ON inserted.start_time = checked.start_time AND checked.overlaps_slot IS NOT TRUE
+    ORDER BY checked.number
+'''
+
+
+# a requested show: number is its line in the uploaded file or its place
+# in the recurrence; error is set when the slot could not be read
+class Slot:
+    __slots__ = (
+        'number',
+        'start_time',
+        'duration',
+        'error',
+        'show_id',
+        'conflict',
+        'conflict_show_id',
+        )
+
+    number: int
+    start_time: datetime
+    duration: timedelta
+    error: str
+    show_id: int
+    conflict: str
+    conflict_show_id: int
+
+    def __init__(self, number: int, start_time: datetime = None, duration: timedelta = None, error: str = None):
+        self.number = number
+        self.start_time = start_time
+        self.duration = duration
+        self.error = error
+        self.show_id = None
+        self.conflict = None
+        self.conflict_show_id = None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return 'invalid'
+        if self.show_id is not None:
+            return 'scheduled'
+        return self.conflict or 'pending'
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+# the shows of a recurrence, first at `first`, then every `interval`
+# days, weeks or months up to the end of the `until` day
+def recurring_slots(first: datetime, frequency: str, interval: int, until, duration: timedelta, max_slots: int) -> list:
+    last = datetime.combine(until, time.max)
+    if last < first:
+        raise ScheduleError('The last date is before the first show.')
+
+    # one date past max_slots is enough to refuse a longer recurrence
+    dates = rrule.rrule(FREQUENCIES[frequency], dtstart=first, interval=interval, until=last)
+    slots = [Slot(number, start_time, duration) for number, start_time in enumerate(islice(dates, max_slots + 1), start=1)]
+    if len(slots) > max_slots:
+        raise ScheduleError('A schedule books at most {} shows.'.format(max_slots))
+    return slots
+
+
+# slots of an uploaded CSV file, one per line: start_time (ISO 8601,
+# e.g. 2024-05-03 21:00) and optionally the duration in minutes;
+# a first line starting with "start_time" is a header
+def uploaded_slots(stream, duration: timedelta, max_slots: int) -> list:
+    slots = []
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+    for line, row in enumerate(reader, start=1):
+        cells = [cell.strip() for cell in row]
+        if not any(cells) or (line == 1 and cells[0].lower() == 'start_time'):
+            continue
+        if len(slots) == max_slots:
+            raise ScheduleError('A schedule books at most {} shows.'.format(max_slots))
+        slots.append(parse_slot(line, cells, duration))
+
+    if not slots:
+        raise ScheduleError('The file has no shows.')
+    return slots
+
+
+def parse_slot(line: int, cells: list, duration: timedelta) -> Slot:
+    try:
+        start_time = datetime.fromisoformat(cells[0])
+    except ValueError:
+        return Slot(line, error='start_time is not a timestamp')
+    if start_time.tzinfo is not None:
+        return Slot(line, error='start_time must be local time, without a UTC offset')
+
+    if len(cells) > 1 and cells[1]:
+        try:
+            minutes = int(cells[1])
+        except ValueError:
+            minutes = 0
+        if not 0 < minutes <= 24 * 60:
+            return Slot(line, error='duration is not a number of minutes up to 1440')
+        duration = timedelta(minutes=minutes)
+
+    return Slot(line, start_time, duration)
+
+
+# Checks and inserts the valid slots in one statement, after locking the
+# venue's and the artist's schedules; fills in each slot's show or conflict.
+# The caller commits. Raises ScheduleError for an unknown venue or artist.
+def schedule_shows(session, venue_id: int, artist_id: int, slots: list) -> list:
+    venue_found, artist_found = lock_show_schedule(venue_id, artist_id)
+    if not venue_found:
+        raise ScheduleError('There is no venue with ID {}.'.format(venue_id))
+    if not artist_found:
+        raise ScheduleError('There is no artist with ID {}.'.format(artist_id))
+
+    valid = {slot.number: slot for slot in slots if slot.error is None}
+    if not valid:
+        return slots
+
+    rows = session.execute(SCHEDULE, {
+        'venue_id': venue_id,
+        'artist_id': artist_id,
+        'numbers': list(valid),
+        'start_times': [slot.start_time for slot in valid.values()],
+        'durations': [slot.duration for slot in valid.values()],
+        })
+
+    for row in rows:
+        slot = valid[row.number]
+        if row.show_id is not None:
+            slot.show_id = row.show_id
+        elif row.venue_show_id is not None:
+            slot.conflict, slot.conflict_show_id = 'venue booked', row.venue_show_id
+        elif row.artist_show_id is not None:
+            slot.conflict, slot.conflict_show_id = 'artist booked', row.artist_show_id
+        else:
+            slot.conflict = 'overlaps another slot'
+
+    return slots
@@ -0,0 +1,130 @@
+import time
+import click
+from flask.cli import with_appcontext
+from models import db, VenueShowStats, ArtistShowStats
+
+#----------------------------------------------------------------------------#
+# Show statistics.
+#----------------------------------------------------------------------------#
+
+# venue_show_stats and artist_show_stats (models.VenueShowStats) follow
+# every show insert, update and delete through triggers. What they can not
+# follow is time: once a show starts it must move from the upcoming to the
+# past count. `flask stats refresh`, run every minute or so, moves the
+# shows that started since each row was counted; until then readers see
+# the row is stale (next_show_time has passed) and count that entity live.
+
+# (stats table, show column)
+STATS = [
+    (VenueShowStats.__tablename__, 'venue_id'),
+    (ArtistShowStats.__tablename__, 'artist_id'),
+]
+
+# rows with a show that started since they were counted,
+# locked in id order against the count_*_shows triggers
+LOCK_STALE = '''
+    SELECT {key} FROM {stats}
+    WHERE next_show_time <= localtimestamp
+    ORDER BY {key}
+    FOR UPDATE
+'''
+
+# runs as a statement after LOCK_STALE, so it counts every show committed
+# while waiting for the locks; both split at the transaction's start
+MOVE_STARTED = '''
+    UPDATE {stats} AS stats SET
+        counted_at = localtimestamp,
+        past_count = stats.past_count + moved.shows,
+        upcoming_count = stats.upcoming_count - moved.shows,
+        next_show_time = (
+            SELECT min(show.start_time) FROM show
+            WHERE show.{key} = stats.{key} AND show.start_time > localtimestamp
+        )
+    FROM (
+        SELECT counted.{key}, (
+            SELECT count(*) FROM show
+            WHERE show.{key} = counted.{key}
+              AND show.start_time > counted.counted_at
+              AND show.start_time <= localtimestamp
+        ) AS shows
+        FROM {stats} counted
+        WHERE counted.{key} = ANY(:ids)
+    ) moved
+    WHERE stats.{key} = moved.{key}
+'''
+
+# recount of every row from scratch, after the table lock the triggers
+# wait, so no change is counted twice or missed; shows written without
+# the triggers may have changed any page, so all of them are marked changed
+COUNT_ALL = '''
+    INSERT INTO {stats} AS stats ({key}, counted_at, past_count, upcoming_count, next_show_time)
+    SELECT
+        {key},
+        localtimestamp,
+        count(*) FILTER (WHERE start_time <= localtimestamp),
+        count(*) FILTER (WHERE start_time > localtimestamp),
+        min(start_time) FILTER (WHERE start_time > localtimestamp)
+    FROM show
+    GROUP BY {key}
+    ON CONFLICT ({key}) DO UPDATE SET
+        counted_at = EXCLUDED.counted_at,
+        past_count = EXCLUDED.past_count,
+        upcoming_count = EXCLUDED.upcoming_count,
+        next_show_time = EXCLUDED.next_show_time,
+        shows_changed_at = now()
+'''
+
+DELETE_EMPTY = '''
+    DELETE FROM {stats} AS stats
+    WHERE NOT EXISTS (SELECT 1 FROM show WHERE show.{key} = stats.{key})
+'''
+
+
+# moves started shows to the past counts, returns the number of rows refreshed
+def refresh_started(session) -> int:
+    refreshed = 0
+    for stats, key in STATS:
+        ids = session.execute(LOCK_STALE.format(stats=stats, key=key)).scalars().all()
+        if ids:
+            session.execute(MOVE_STARTED.format(stats=stats, key=key), {'ids': ids})
+            refreshed += len(ids)
+    session.commit()
+    return refreshed
+
+
+# counts every venue and artist again, for a database whose shows were
+# written with triggers disabled (pg_restore --disable-triggers, replication)
+def refresh_all(session) -> int:
+    counted = 0
+    for stats, key in STATS:
+        session.execute('LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE'.format(stats))
+        counted += session.execute(COUNT_ALL.format(stats=stats, key=key)).rowcount
+        session.execute(DELETE_EMPTY.format(stats=stats, key=key))
+    session.commit()
+    return counted
+
+
+@click.group('stats')
+def stats_command():
+    """ Per venue and per artist show counts. """
+
+
+@stats_command.command('refresh')
+@click.option('--all', 'recount', is_flag=True, help='recount every venue and artist instead of the started shows')
+@click.option('--every', type=float, help='keep running, refreshing every this many seconds')
+@with_appcontext
+def refresh_command(recount, every):
+    """ Move shows that started to the past counts. Run it from cron every
+    minute, or keep it running with --every 60.
+    """
+    while True:
+        start = time.perf_counter()
+        try:
+            rows = refresh_all(db.session) if recount else refresh_started(db.session)
+        finally:
+            db.session.remove()
+        click.echo('{:,} rows {} in {:.2f}s'.format(rows, 'counted' if recount else 'refreshed', time.perf_counter() - start))
+
+        if every is None:
+            return
+        time.sleep(every)
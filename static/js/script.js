@@ -2,3 +2,27 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// "Load more" on venue and artist pages is replaced by the next shows of its section
+document.addEventListener('click', function (e) {
+  var link = e.target.closest('.load-more a');
+  if (!link) {
+    return;
+  }
+  e.preventDefault();
+  fetch(link.href)
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status + ' ' + response.statusText);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      var more = link.parentNode;
+      more.insertAdjacentHTML('afterend', html);
+      more.remove();
+    })
+    .catch(function (err) {
+      console.error('could not load more shows', err);
+    });
+});